@@ -11,6 +11,9 @@ from src.gui.tabs.signature_tab import SignatureTab
 from src.gui.tabs.rename_tab import RenameTab
 from src.gui.tabs.organize_tab import OrganizeTab
 from src.gui.tabs.fees_tab import FeesTab
+from src.gui.tabs.jobs_tab import JobsTab
+from src.gui.tabs.archive_tab import ArchiveTab
+from src.logic.job_scheduler import JobScheduler
 from src.logic.monthly_fees import MonthlyFeesProcessor
 
 class MainApplication(tk.Tk):
@@ -27,10 +30,14 @@ class MainApplication(tk.Tk):
         self.config_manager = ConfigManager()
         self.config_manager.load()
 
+        self.scheduler = JobScheduler()
+
         self._initialize_stringvars()
         self._setup_style()
         self._create_widgets()
         self._load_config_into_vars()
+        if self.watch_folders.get(): self.jobs_tab.preprocessor.start()
+        if self.profile_next_run.get(): self.jobs_tab.toggle_profiling()
 
         self.protocol("WM_DELETE_WINDOW", self._on_closing)
 
@@ -90,16 +97,26 @@ class MainApplication(tk.Tk):
         self.firma_pdf_dir = tk.StringVar(value=os.path.join(const.APPLICATION_PATH, const.FIRMA_PDF_OUTPUT_DIR))
         self.firma_ghostscript_path = tk.StringVar()
         self.firma_processing_mode = tk.StringVar(value="schede")
+        self.firma_compression_mode = tk.StringVar(value="Standard")
+        self.firma_gs_batch = tk.BooleanVar(value=False)
         self.email_to = tk.StringVar()
         self.email_cc = tk.StringVar()
         self.email_subject = tk.StringVar()
         self.email_tcl = tk.StringVar()
         self.email_is_formal = tk.BooleanVar(value=False)
         self.email_size_limit = tk.StringVar(value="6")
+        self.email_group_by = tk.StringVar(value="Nessuno")
+        self.email_backend = tk.StringVar(value="outlook")
         self.rinomina_path = tk.StringVar()
         self.rinomina_password = tk.StringVar()
         self.organizza_source_dir = tk.StringVar()
         self.organizza_dest_dir = tk.StringVar(value=os.path.join(const.APPLICATION_PATH, const.ORGANIZZA_DEST_DIR))
+        self.organizza_bundle_pdf = tk.BooleanVar(value=False)
+        self.stampa_batch = tk.BooleanVar(value=False)
+        self.stampa_backend = tk.StringVar(value="stampante")
+        self.watch_folders = tk.BooleanVar(value=False)
+        self.profile_next_run = tk.BooleanVar(value=False)
+        self.archivio_dir = tk.StringVar(value=const.ORGANIZZA_BASE_DIR)
         self.canoni_selected_year = tk.StringVar()
         self.canoni_selected_month = tk.StringVar()
         self.canoni_messina_num = tk.StringVar()
@@ -108,6 +125,7 @@ class MainApplication(tk.Tk):
         self.canoni_word_path = tk.StringVar()
         self.selected_printer = tk.StringVar()
         self.canoni_macro_name = tk.StringVar(value=const.DEFAULT_MACRO_NAME)
+        self.canoni_prefetch = tk.BooleanVar(value=True)
         self.canoni_giornaliera_path = tk.StringVar()
         self.canoni_cons1_path = tk.StringVar()
         self.canoni_cons2_path = tk.StringVar()
@@ -116,6 +134,8 @@ class MainApplication(tk.Tk):
     def _load_config_into_vars(self):
         # ... (this method is unchanged)
         self.firma_ghostscript_path.set(self.config_manager.get("firma_ghostscript_path"))
+        self.firma_compression_mode.set(self.config_manager.get("firma_compression_mode"))
+        self.firma_gs_batch.set(self.config_manager.get("firma_gs_batch"))
         self.rinomina_path.set(self.config_manager.get("rinomina_path"))
         self.rinomina_password.set(self.config_manager.get("rinomina_password"))
         today = datetime.now()
@@ -127,10 +147,17 @@ class MainApplication(tk.Tk):
         organize_folder_month_str = f"{prev_month_date.month:02d} - {fees_tab_month_name.upper()}"
         organize_default_path = os.path.join(const.ORGANIZZA_BASE_DIR, prev_month_year_str, organize_folder_month_str)
         self.organizza_source_dir.set(organize_default_path)
+        self.organizza_bundle_pdf.set(self.config_manager.get("organizza_bundle_pdf"))
+        self.stampa_batch.set(self.config_manager.get("stampa_batch"))
+        self.stampa_backend.set(self.config_manager.get("stampa_backend"))
+        self.watch_folders.set(self.config_manager.get("watch_folders"))
+        self.profile_next_run.set(self.config_manager.get("profile_next_run"))
+        self.archivio_dir.set(self.config_manager.get("archivio_dir"))
         self.canoni_messina_num.set(self.config_manager.get("canoni_messina_num"))
         self.canoni_naselli_num.set(self.config_manager.get("canoni_naselli_num"))
         self.canoni_caldarella_num.set(self.config_manager.get("canoni_caldarella_num"))
         self.canoni_word_path.set(self.config_manager.get("canoni_word_path"))
+        self.canoni_prefetch.set(self.config_manager.get("canoni_prefetch"))
         self.selected_printer.set(self.config_manager.get("selected_printer"))
         self.email_to.set(self.config_manager.get("email_to"))
         self.email_cc.set(self.config_manager.get("email_cc"))
@@ -138,6 +165,8 @@ class MainApplication(tk.Tk):
         self.email_tcl.set(self.config_manager.get("email_tcl"))
         self.email_is_formal.set(self.config_manager.get("email_is_formal"))
         self.email_size_limit.set(self.config_manager.get("email_size_limit"))
+        self.email_group_by.set(self.config_manager.get("email_group_by"))
+        self.email_backend.set(self.config_manager.get("email_backend"))
 
     def _create_widgets(self):
         self.configure(background=self.background_color)
@@ -153,22 +182,30 @@ class MainApplication(tk.Tk):
         self.rinomina_container = ttk.Frame(notebook, padding="15")
         self.organizza_container = ttk.Frame(notebook, padding="15")
         self.canoni_container = ttk.Frame(notebook, padding="15")
+        self.jobs_container = ttk.Frame(notebook, padding="15")
+        self.archivio_container = ttk.Frame(notebook, padding="15")
 
         self.firma_container.columnconfigure(0, weight=1)
         self.rinomina_container.columnconfigure(0, weight=1)
         self.organizza_container.columnconfigure(0, weight=1)
         self.canoni_container.columnconfigure(0, weight=1)
+        self.jobs_container.columnconfigure(0, weight=1)
+        self.archivio_container.columnconfigure(0, weight=1)
 
         notebook.add(self.firma_container, text=' Apponi Firma ')
         notebook.add(self.rinomina_container, text=' Aggiungi Data Schede ')
         notebook.add(self.organizza_container, text=' Organizza e Stampa Schede ')
         notebook.add(self.canoni_container, text=' Stampa Canoni Mensili ')
+        notebook.add(self.jobs_container, text=' Coda Processi ')
+        notebook.add(self.archivio_container, text=' Cerca in Archivio ')
 
         # --- Create Log Widgets ---
         self.log_widget_firma = self._create_log_frame(self.firma_container, "Log Esecuzione (Firma)")
         self.log_widget_rinomina = self._create_log_frame(self.rinomina_container, "Log Esecuzione (Aggiungi Data)")
         self.log_widget_organizza = self._create_log_frame(self.organizza_container, "Log Esecuzione (Organizza/Stampa)")
         self.log_widget_canoni = self._create_log_frame(self.canoni_container, "Log Esecuzione (Stampa Canoni)")
+        self.log_widget_jobs = self._create_log_frame(self.jobs_container, "Log Esecuzione (Fine Mese)")
+        self.log_widget_archivio = self._create_log_frame(self.archivio_container, "Log Esecuzione (Indice Archivio)")
 
         # --- Dependency Injection and Tab Creation ---
         self.signature_tab = SignatureTab(self.firma_container, self, lambda msg, level='INFO': log_message(self.log_widget_firma, msg, level))
@@ -191,6 +228,16 @@ class MainApplication(tk.Tk):
         self.log_widget_organizza.master.pack_forget()
         self.log_widget_organizza.master.pack(fill=tk.X, side=tk.BOTTOM, pady=(15, 0))
 
+        self.jobs_tab = JobsTab(self.jobs_container, self, lambda msg, level='INFO': log_message(self.log_widget_jobs, msg, level))
+        self.jobs_tab.pack(fill='both', expand=True)
+        self.log_widget_jobs.master.pack_forget()
+        self.log_widget_jobs.master.pack(fill=tk.X, side=tk.BOTTOM, pady=(15, 0))
+
+        self.archive_tab = ArchiveTab(self.archivio_container, self, lambda msg, level='INFO': log_message(self.log_widget_archivio, msg, level))
+        self.archive_tab.pack(fill='both', expand=True)
+        self.log_widget_archivio.master.pack_forget()
+        self.log_widget_archivio.master.pack(fill=tk.X, side=tk.BOTTOM, pady=(15, 0))
+
     def _create_log_frame(self, parent, title):
         log_frame = ttk.LabelFrame(parent, text=title, padding="10")
         # The frame is packed by the caller
@@ -201,19 +248,33 @@ class MainApplication(tk.Tk):
         # ... (this method is unchanged)
         current_config = {
             "firma_ghostscript_path": self.firma_ghostscript_path.get(),
+            "firma_compression_mode": self.firma_compression_mode.get(),
+            "firma_gs_batch": self.firma_gs_batch.get(),
             "rinomina_path": self.rinomina_path.get(),
             "rinomina_password": self.rinomina_password.get(),
             "canoni_messina_num": self.canoni_messina_num.get(),
             "canoni_naselli_num": self.canoni_naselli_num.get(),
             "canoni_caldarella_num": self.canoni_caldarella_num.get(),
+            "canoni_tcl_names": self.config_manager.get("canoni_tcl_names"),
             "canoni_word_path": self.canoni_word_path.get(),
+            "canoni_prefetch": self.canoni_prefetch.get(),
             "selected_printer": self.selected_printer.get(),
+            "organizza_bundle_pdf": self.organizza_bundle_pdf.get(),
+            "stampa_batch": self.stampa_batch.get(),
+            "stampa_backend": self.stampa_backend.get(),
+            "watch_folders": self.watch_folders.get(),
+            "profile_next_run": self.profile_next_run.get(),
+            "archivio_dir": self.archivio_dir.get(),
             "email_to": self.email_to.get(),
             "email_cc": self.email_cc.get(),
             "email_subject": self.email_subject.get(),
             "email_tcl": self.email_tcl.get(),
             "email_is_formal": self.email_is_formal.get(),
-            "email_size_limit": self.email_size_limit.get()
+            "email_size_limit": self.email_size_limit.get(),
+            "email_group_by": self.email_group_by.get(),
+            "email_backend": self.email_backend.get()
         }
         self.config_manager.save(current_config)
+        self.jobs_tab.preprocessor.stop()
+        self.scheduler.cancel_all()
         self.destroy()
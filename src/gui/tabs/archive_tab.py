@@ -0,0 +1,124 @@
+import tkinter as tk
+from tkinter import ttk
+import os
+import sqlite3
+from src.logic.archive_index import ArchiveIndexer
+from src.logic.workbook_metadata import extract_date_from_value
+from src.utils.ui_utils import create_path_entry, select_folder_dialog, open_folder_in_explorer
+
+
+class ArchiveTab(ttk.Frame):
+    """Searches the archive index by ODC, emission date range, model and file name."""
+    MAX_RESULTS = 2000
+
+    def __init__(self, parent, app_config, logger):
+        super().__init__(parent)
+        self.app_config = app_config
+        self.log_widget = logger
+        self.search_odc = tk.StringVar()
+        self.search_model = tk.StringVar()
+        self.search_from = tk.StringVar()
+        self.search_to = tk.StringVar()
+        self.search_name = tk.StringVar()
+
+        self._create_widgets()
+        self.indexer = ArchiveIndexer(app_config, self.log_archivio)
+        self.indexer.on_update_finished = lambda: self.master.after(0, self.refresh_index_info)
+        self.after(200, self.refresh_index_info)
+
+    def _create_widgets(self):
+        self.columnconfigure(0, weight=1)
+
+        desc_label = ttk.Label(self, text="Cerca le schede dell'archivio per ODC, modello, periodo di emissione o nome del file. L'indice viene aggiornato in background leggendo solo i file nuovi o modificati.", wraplength=800, justify=tk.LEFT, style='info.TLabel')
+        desc_label.pack(fill=tk.X, pady=(0, 15), anchor='w')
+
+        # --- Index Frame ---
+        index_frame = ttk.LabelFrame(self, text="1. Indice dell'Archivio", padding=15)
+        index_frame.pack(fill=tk.X, pady=5)
+        create_path_entry(index_frame, "Cartella Archivio:", self.app_config.archivio_dir, 0, readonly=False,
+                          browse_command=lambda: select_folder_dialog(self.app_config.archivio_dir, "Seleziona la cartella dell'archivio delle schede"))
+        self.index_info_label = ttk.Label(index_frame, text="")
+        self.index_info_label.grid(row=1, column=0, columnspan=2, sticky='w', padx=5, pady=(5, 0))
+        ttk.Button(index_frame, text="Aggiorna Indice", command=self.queue_index_update).grid(row=1, column=2, sticky='e', padx=5, pady=(5, 0))
+
+        # --- Search Frame ---
+        search_frame = ttk.LabelFrame(self, text="2. Ricerca", padding=15)
+        search_frame.pack(fill=tk.X, pady=5)
+        for column in (1, 3): search_frame.columnconfigure(column, weight=1)
+        ttk.Label(search_frame, text="ODC:").grid(row=0, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(search_frame, textvariable=self.search_odc).grid(row=0, column=1, sticky='ew', padx=5, pady=3)
+        ttk.Label(search_frame, text="Modello:").grid(row=0, column=2, sticky='w', padx=5, pady=3)
+        self.model_combo = ttk.Combobox(search_frame, textvariable=self.search_model, values=[""])
+        self.model_combo.grid(row=0, column=3, sticky='ew', padx=5, pady=3)
+        ttk.Label(search_frame, text="Emessa dal (gg/mm/aaaa):").grid(row=1, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(search_frame, textvariable=self.search_from).grid(row=1, column=1, sticky='ew', padx=5, pady=3)
+        ttk.Label(search_frame, text="al:").grid(row=1, column=2, sticky='w', padx=5, pady=3)
+        ttk.Entry(search_frame, textvariable=self.search_to).grid(row=1, column=3, sticky='ew', padx=5, pady=3)
+        ttk.Label(search_frame, text="Nome contiene:").grid(row=2, column=0, sticky='w', padx=5, pady=3)
+        ttk.Entry(search_frame, textvariable=self.search_name).grid(row=2, column=1, columnspan=3, sticky='ew', padx=5, pady=3)
+        ttk.Button(search_frame, text="Cerca", style='primary.TButton', command=self.search).grid(row=3, column=0, columnspan=4, sticky='we', pady=(10, 0))
+        for widget in search_frame.winfo_children():
+            if isinstance(widget, ttk.Entry): widget.bind('<Return>', lambda e: self.search())
+
+        # --- Results Frame ---
+        results_frame = ttk.LabelFrame(self, text="3. Risultati", padding=15)
+        results_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        results_frame.rowconfigure(0, weight=1)
+        results_frame.columnconfigure(0, weight=1)
+        columns = ("name", "odc", "model", "date", "size", "folder")
+        self.tree = ttk.Treeview(results_frame, columns=columns, show='headings', selectmode='browse')
+        for column, heading, width in [("name", "Scheda", 280), ("odc", "ODC", 120), ("model", "Modello", 140), ("date", "Emissione", 90), ("size", "KB", 60), ("folder", "Cartella", 320)]:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=column in ("name", "folder"))
+        scrollbar = ttk.Scrollbar(results_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+        self.tree.bind('<Double-1>', self.open_selected_folder)
+        self.results_label = ttk.Label(results_frame, text="")
+        self.results_label.grid(row=1, column=0, columnspan=2, sticky='w', pady=(5, 0))
+
+    def _parse_date(self, var, label):
+        text = var.get().strip()
+        if not text: return None, True
+        status, date = extract_date_from_value(text)
+        if status != 'VALID':
+            self.log_archivio(f"Data '{label}' non valida: {text}", "WARNING")
+            return None, False
+        return date, True
+
+    def search(self):
+        date_from, ok_from = self._parse_date(self.search_from, "dal")
+        date_to, ok_to = self._parse_date(self.search_to, "al")
+        if not (ok_from and ok_to): return
+        try:
+            entries = self.indexer.index.search(odc=self.search_odc.get(), date_from=date_from, date_to=date_to, model=self.search_model.get().strip() or None,
+                                                name=self.search_name.get(), limit=self.MAX_RESULTS + 1)
+        except sqlite3.Error as e:
+            self.log_archivio(f"ERRORE ricerca nell'indice: {e}", "ERROR"); return
+        self.tree.delete(*self.tree.get_children())
+        for i, entry in enumerate(entries[:self.MAX_RESULTS]):
+            date = "/".join(reversed(entry.emission_date.split("-"))) if entry.emission_date else ""
+            folder, name = os.path.split(entry.path)
+            self.tree.insert('', 'end', iid=str(i), values=(name, entry.odc or "", entry.model or "", date, f"{entry.size / 1024:.0f}", folder))
+        more = len(entries) > self.MAX_RESULTS
+        self.results_label['text'] = f"{min(len(entries), self.MAX_RESULTS)} schede trovate" + (f" (mostrate le prime {self.MAX_RESULTS}: restringere la ricerca)" if more else "")
+
+    def open_selected_folder(self, event=None):
+        selected = self.tree.selection()
+        if selected: open_folder_in_explorer(self.tree.set(selected[0], "folder"))
+
+    def queue_index_update(self):
+        self.indexer.queue_update()
+        self.log_archivio("Aggiornamento dell'indice in coda (priorità bassa).", "INFO")
+
+    def refresh_index_info(self):
+        try:
+            count = self.indexer.index.count()
+            self.model_combo['values'] = [""] + self.indexer.index.models()
+        except sqlite3.Error as e:
+            self.index_info_label['text'] = f"Indice non disponibile: {e}"; return
+        self.index_info_label['text'] = f"Schede indicizzate: {count}"
+
+    def log_archivio(self, message, level='INFO'):
+        self.master.after(0, self.log_widget, message, level)
@@ -3,7 +3,8 @@ from tkinter import ttk
 from datetime import datetime
 import threading
 from src.logic.monthly_fees import MonthlyFeesProcessor
-from src.utils.ui_utils import create_path_entry, select_file_dialog
+from src.logic.job_scheduler import JOB_QUEUED, PRIORITY_HIGH, RESOURCE_EXCEL, RESOURCE_WORD
+from src.utils.ui_utils import create_path_entry, select_file_dialog, DebouncedResolver
 
 class FeesTab(ttk.Frame):
     def __init__(self, parent, app_config, logger):
@@ -11,9 +12,12 @@ class FeesTab(ttk.Frame):
         self.app_config = app_config
         self.log_widget = logger
         self.cancel_event = threading.Event()
+        self.job = None
+        self.print_requested = False
         self.processor = MonthlyFeesProcessor(self, app_config)
         current_year = datetime.now().year
         self.anni_giornaliera = [str(y) for y in range(current_year - 5, current_year + 6)]
+        self.path_resolver = DebouncedResolver(self, self._collect_path_inputs, self._resolve_paths, self._apply_resolved_paths, logger=self.log_canoni)
         self._create_widgets()
         self.after(100, self.populate_printers)
         self.after(150, self._update_paths_from_ui)
@@ -67,6 +71,7 @@ class FeesTab(ttk.Frame):
         self.printer_combo = ttk.Combobox(printer_macro_frame, textvariable=self.app_config.selected_printer, state="readonly")
         self.printer_combo.grid(row=0, column=1, sticky=tk.EW, padx=5, pady=5)
         create_path_entry(printer_macro_frame, "Nome Macro VBA:", self.app_config.canoni_macro_name, 1, readonly=True)
+        ttk.Checkbutton(printer_macro_frame, text="Copia locale anticipata dei file (stampa in pipeline)", variable=self.app_config.canoni_prefetch, onvalue=True, offvalue=False).grid(row=2, column=1, sticky=tk.W, padx=5, pady=3)
 
         # --- Azioni ---
         self.actions_frame = ttk.LabelFrame(self, text="2. Azione", padding=15)
@@ -101,21 +106,41 @@ class FeesTab(ttk.Frame):
         elif printers: self.printer_combo.set(printers[0])
 
     def _update_paths_from_ui(self, *args):
-        year = self.app_config.canoni_selected_year.get()
-        month = self.app_config.canoni_selected_month.get()
-        giornaliera_path = self.processor.get_giornaliera_path(year, month)
-        self.app_config.canoni_giornaliera_path.set(giornaliera_path)
-        c1_path = self.processor.get_consuntivo_path(year, self.app_config.canoni_messina_num.get())
-        self.app_config.canoni_cons1_path.set(c1_path)
-        c2_path = self.processor.get_consuntivo_path(year, self.app_config.canoni_naselli_num.get())
-        self.app_config.canoni_cons2_path.set(c2_path)
-        c3_path = self.processor.get_consuntivo_path(year, self.app_config.canoni_caldarella_num.get())
-        self.app_config.canoni_cons3_path.set(c3_path)
+        self.path_resolver.request()
+
+    def _collect_path_inputs(self):
+        return {
+            "year": self.app_config.canoni_selected_year.get(),
+            "month": self.app_config.canoni_selected_month.get(),
+            "numbers": [self.app_config.canoni_messina_num.get(), self.app_config.canoni_naselli_num.get(), self.app_config.canoni_caldarella_num.get()]
+        }
+
+    def _resolve_paths(self, inputs, cancel_event):
+        # Runs off the Tk thread: consuntivo lookups may need to reach the network share.
+        year = inputs["year"]
+        resolved = {"giornaliera": self.processor.get_giornaliera_path(year, inputs["month"]), "consuntivi": []}
+        for number in inputs["numbers"]:
+            if cancel_event.is_set(): break
+            resolved["consuntivi"].append(self.processor.get_consuntivo_path(year, number))
+        return resolved
+
+    def _apply_resolved_paths(self, resolved):
+        self.app_config.canoni_giornaliera_path.set(resolved["giornaliera"])
+        cons_vars = [self.app_config.canoni_cons1_path, self.app_config.canoni_cons2_path, self.app_config.canoni_cons3_path]
+        for var, path in zip(cons_vars, resolved["consuntivi"]):
+            var.set(path)
 
     def start_printing_process(self):
-        self.cancel_event.clear()
         self.toggle_buttons(is_running=True)
         self.show_progress()
+        # The consuntivo lookups hit the share: wait for the background one instead of running it here.
+        self.job = None
+        self.print_requested = True
+        self.path_resolver.when_resolved(self._submit_printing_job)
+
+    def _submit_printing_job(self):
+        if not self.print_requested: return # Cancelled while the paths were being resolved.
+        self.print_requested = False
         paths_to_print = {
             "giornaliera": self.app_config.canoni_giornaliera_path.get(),
             "consuntivi": [self.app_config.canoni_cons1_path.get(), self.app_config.canoni_cons2_path.get(), self.app_config.canoni_cons3_path.get()],
@@ -123,32 +148,45 @@ class FeesTab(ttk.Frame):
         }
         printer = self.app_config.selected_printer.get()
         macro = self.app_config.canoni_macro_name.get()
-        threading.Thread(target=self.processor.run_printing_process, args=(self.cancel_event, paths_to_print, printer, macro), daemon=True).start()
+        use_prefetch = self.app_config.canoni_prefetch.get()
+        self.job = self.app_config.scheduler.submit(
+            "Stampa canoni mensili", self.processor.run_printing_process, args=(paths_to_print, printer, macro, use_prefetch),
+            resources=[RESOURCE_EXCEL, RESOURCE_WORD], priority=PRIORITY_HIGH,
+            cancel_event=self.cancel_event, on_skip=lambda: self.master.after(0, self.on_process_finished))
+        if self.job.state == JOB_QUEUED:
+            self.log_canoni("Processo in coda: Excel o Word sono in uso da un altro processo.", "WARNING")
 
     def find_numbers_and_populate(self):
-        self.cancel_event.clear()
         self.toggle_buttons(is_running=True)
         self.log_canoni("Ricerca automatica dei numeri di canone in corso...", "HEADER")
-        threading.Thread(target=self._find_numbers_thread, args=(self.cancel_event,), daemon=True).start()
+        self.job = self.app_config.scheduler.submit(
+            "Ricerca numeri canone", self._find_numbers_thread, priority=PRIORITY_HIGH,
+            cancel_event=self.cancel_event, on_skip=lambda: self.master.after(0, self.on_process_finished))
 
     def _find_numbers_thread(self, cancel_event):
         try:
             year = self.app_config.canoni_selected_year.get()
             month = self.app_config.canoni_selected_month.get()
-            tcls_to_find = {"MESSINA": self.app_config.canoni_messina_num, "NASELLI": self.app_config.canoni_naselli_num, "CALDARELLA": self.app_config.canoni_caldarella_num}
-            for tcl, var in tcls_to_find.items():
-                if cancel_event.is_set():
-                    self.log_canoni("Ricerca annullata.", "WARNING")
-                    break
-                number, _ = self.processor.find_consuntivo_for_tcl(year, month, tcl, cancel_event)
-                if number:
+            tcl_names = self.app_config.config_manager.get("canoni_tcl_names")
+            found = self.processor.find_consuntivi_for_tcls(year, month, tcl_names, cancel_event)
+            if cancel_event.is_set():
+                self.log_canoni("Ricerca annullata.", "WARNING")
+            for tcl, (number, _) in found.items():
+                # Only TCLs with a dedicated field (canoni_<nome>_num) can be filled in.
+                var = getattr(self.app_config, f"canoni_{tcl.lower()}_num", None)
+                if var is not None:
                     self.master.after(0, var.set, number)
+                else:
+                    self.log_canoni(f"Nessun campo per il TCL '{tcl}': numero trovato {number}.", "INFO")
         finally:
             self.master.after(0, self.on_process_finished)
 
     def cancel_process(self):
         self.log_canoni("Annullamento richiesto...", "WARNING")
-        self.cancel_event.set()
+        if self.job is None:
+            self.print_requested = False
+            self.on_process_finished(); return
+        self.app_config.scheduler.cancel(self.job)
         self.cancel_button.config(state='disabled')
 
     def on_process_finished(self):
@@ -0,0 +1,164 @@
+import tkinter as tk
+from tkinter import ttk
+import os
+from src.utils import constants as const
+from src.logic.job_scheduler import JOB_RUNNING, PRIORITY_NAMES, PRIORITY_NORMAL, RESOURCE_EXCEL, folder_resource
+from src.logic.month_end import MonthEndProcessor
+from src.logic.preprocessing import BackgroundPreprocessor
+
+
+class JobsTab(ttk.Frame):
+    """Shows every job of the scheduler and queues the month-end routine."""
+    REFRESH_MS = 1000
+
+    def __init__(self, parent, app_config, logger):
+        super().__init__(parent)
+        self.app_config = app_config
+        self.log_widget = logger
+        self.scheduler = app_config.scheduler
+        self._refresh_pending = False
+        self.print_after_var = tk.BooleanVar(value=False)
+
+        self._create_widgets()
+        self.processor = MonthEndProcessor(self, app_config, self.setup_progress, self.update_progress, self.hide_progress)
+        self.preprocessor = BackgroundPreprocessor(app_config, self.log_fine_mese)
+        self.scheduler.add_listener(self._on_job_changed)
+        self.after(self.REFRESH_MS, self._periodic_refresh)
+
+    def _create_widgets(self):
+        self.columnconfigure(0, weight=1)
+
+        desc_label = ttk.Label(self, text="Elenco dei processi avviati dalle schede. I processi che usano Excel, Word o Outlook, o le stesse cartelle, vengono eseguiti uno alla volta; gli altri restano in coda.", wraplength=800, justify=tk.LEFT, style='info.TLabel')
+        desc_label.pack(fill=tk.X, pady=(0, 15), anchor='w')
+
+        # --- Pipeline Frame ---
+        self.pipeline_frame = ttk.LabelFrame(self, text="1. Routine di Fine Mese", padding=15)
+        self.pipeline_frame.pack(fill=tk.X, pady=5)
+        self.pipeline_frame.columnconfigure(0, weight=1)
+        ttk.Label(self.pipeline_frame, text="Apre una sola volta ogni scheda della cartella di origine (scheda 'Organizza'): ne legge modello, data e ODC, la firma ed esporta il PDF. Poi rinomina i file, li copia nelle cartelle ODC, comprime i PDF, crea il PDF unico di ogni ODC e prepara le bozze email.", wraplength=800, justify=tk.LEFT).grid(row=0, column=0, sticky='w')
+        ttk.Checkbutton(self.pipeline_frame, text="Stampa tutte le cartelle organizzate al termine", variable=self.print_after_var, onvalue=True, offvalue=False).grid(row=1, column=0, sticky='w', pady=(5, 0))
+        self.chain_button = ttk.Button(self.pipeline_frame, text="▶ Accoda Routine di Fine Mese", style='primary.TButton', command=self.queue_month_end)
+        self.chain_button.grid(row=2, column=0, sticky='we', pady=(10, 0))
+        ttk.Checkbutton(self.pipeline_frame, text="Pre-elabora in background i file che arrivano in 'File Excel da Firmare' e 'Schede da Organizzare' (lettura, firma e PDF anticipati)",
+                        variable=self.app_config.watch_folders, onvalue=True, offvalue=False, command=self.toggle_watch).grid(row=3, column=0, sticky='w', pady=(10, 0))
+        ttk.Checkbutton(self.pipeline_frame, text=f"Profila il prossimo processo avviato (pile di chiamate e riepilogo nella cartella '{const.LOG_DIR}')",
+                        variable=self.app_config.profile_next_run, onvalue=True, offvalue=False, command=self.toggle_profiling).grid(row=4, column=0, sticky='w', pady=(5, 0))
+
+        # --- Job List Frame ---
+        list_frame = ttk.LabelFrame(self, text="2. Coda dei Processi", padding=15)
+        list_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        list_frame.rowconfigure(0, weight=1)
+        list_frame.columnconfigure(0, weight=1)
+
+        columns = ("id", "name", "priority", "state", "elapsed", "detail")
+        self.tree = ttk.Treeview(list_frame, columns=columns, show='headings', selectmode='browse')
+        for column, heading, width in [("id", "#", 40), ("name", "Processo", 260), ("priority", "Priorità", 80), ("state", "Stato", 110), ("elapsed", "Durata", 80), ("detail", "Dettagli", 320)]:
+            self.tree.heading(column, text=heading)
+            self.tree.column(column, width=width, stretch=column in ("name", "detail"))
+        scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.grid(row=0, column=0, sticky='nsew')
+        scrollbar.grid(row=0, column=1, sticky='ns')
+
+        controls = ttk.Frame(list_frame)
+        controls.grid(row=1, column=0, columnspan=2, sticky='ew', pady=(10, 0))
+        ttk.Button(controls, text="Annulla Selezionato", command=self.cancel_selected).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(0, 5))
+        ttk.Button(controls, text="Rimuovi Terminati", command=self.clear_finished).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 0))
+
+        # --- Progress Bar ---
+        self.progress_frame = ttk.Frame(self)
+        self.progress_label = ttk.Label(self.progress_frame, text="Progresso:")
+        self.progress_label.pack(side=tk.LEFT, padx=(0, 5))
+        self.progressbar = ttk.Progressbar(self.progress_frame, orient='horizontal', mode='determinate')
+        self.progressbar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.percent_label = ttk.Label(self.progress_frame, text="0%", width=5)
+        self.percent_label.pack(side=tk.LEFT, padx=(5, 0))
+
+    def _on_job_changed(self, job):
+        if job.profile_dir and job.is_finished and job.profile_paths:
+            self.log_fine_mese(f"Profilo di '{job.name}' salvato: {job.profile_paths[1]}", "SUCCESS")
+        elif job.profile_dir and job.state == JOB_RUNNING:
+            # Profiling covers one run: untick the box once a job has taken it.
+            self.after(0, self.app_config.profile_next_run.set, self.scheduler.profiling_armed)
+        # Called from worker threads: coalesce into one refresh on the Tk thread.
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.after(0, self.refresh)
+
+    def _periodic_refresh(self):
+        if any(job.state == JOB_RUNNING for job in self.scheduler.jobs()):
+            self.refresh()
+        self.after(self.REFRESH_MS, self._periodic_refresh)
+
+    def refresh(self):
+        self._refresh_pending = False
+        selected = self.tree.selection()
+        self.tree.delete(*self.tree.get_children())
+        for job in self.scheduler.jobs():
+            elapsed = f"{job.elapsed:.0f} s" if job.elapsed is not None else ""
+            self.tree.insert('', 'end', iid=str(job.id), values=(job.id, job.name, PRIORITY_NAMES.get(job.priority, job.priority), job.state, elapsed, job.detail))
+        if selected and self.tree.exists(selected[0]):
+            self.tree.selection_set(selected[0])
+
+    def cancel_selected(self):
+        selected = self.tree.selection()
+        if not selected: return
+        job = next((j for j in self.scheduler.jobs() if str(j.id) == selected[0]), None)
+        if job and not job.is_finished: self.scheduler.cancel(job)
+
+    def clear_finished(self):
+        self.scheduler.clear_finished()
+        self.refresh()
+
+    def queue_month_end(self):
+        app = self.app_config
+        source_dir = app.organizza_source_dir.get()
+        dest_dir = app.organizza_dest_dir.get()
+        resources = [RESOURCE_EXCEL, folder_resource(source_dir), folder_resource(dest_dir), folder_resource(app.firma_pdf_dir.get())]
+        self.toggle_buttons(is_running=True)
+        month_end_job = self.scheduler.submit("Fine mese: passaggio unico", self.processor.run_month_end_process, resources=resources,
+                                              priority=PRIORITY_NORMAL, on_skip=lambda: self.master.after(0, self.on_process_finished))
+        if not self.print_after_var.get(): return
+        organize_processor = app.organize_tab.processor
+
+        def print_all_folders(cancel_event):
+            # Runs only if the routine completed: it rebuilt the folder, so every subfolder is from this run.
+            folders = [os.path.join(dest_dir, d) for d in sorted(os.listdir(dest_dir)) if os.path.isdir(os.path.join(dest_dir, d))] if os.path.isdir(dest_dir) else []
+            return organize_processor.run_printing_process(cancel_event, folders, app.stampa_batch.get())
+
+        self.scheduler.submit("Fine mese: Stampa cartelle organizzate", print_all_folders,
+                              resources=[RESOURCE_EXCEL, folder_resource(dest_dir)], priority=PRIORITY_NORMAL, depends_on=[month_end_job])
+
+    def toggle_watch(self):
+        if self.app_config.watch_folders.get(): self.preprocessor.start()
+        else: self.preprocessor.stop()
+
+    def toggle_profiling(self):
+        if self.app_config.profile_next_run.get():
+            self.scheduler.profile_next_job(os.path.join(const.APPLICATION_PATH, const.LOG_DIR))
+            self.log_fine_mese("Il prossimo processo avviato verrà profilato.", "INFO")
+        else:
+            self.scheduler.profile_next_job(None)
+
+    def on_process_finished(self):
+        self.toggle_buttons(is_running=False)
+
+    def toggle_buttons(self, is_running):
+        self.chain_button.config(state='disabled' if is_running else 'normal')
+
+    def log_fine_mese(self, message, level='INFO'):
+        self.master.after(0, self.log_widget, message, level)
+
+    def setup_progress(self, max_value):
+        self.progress_frame.pack(fill=tk.X, pady=(10, 5), after=self.pipeline_frame)
+        self.progressbar['maximum'] = max_value
+        self.progressbar['value'] = 0
+        self.percent_label['text'] = "0%"
+
+    def update_progress(self, value):
+        self.progressbar['value'] = value
+        max_val = self.progressbar['maximum']
+        if max_val > 0: percent = (value / max_val) * 100; self.percent_label['text'] = f"{percent:.0f}%"
+
+    def hide_progress(self):
+        self.progress_frame.pack_forget()
@@ -3,6 +3,7 @@ from tkinter import ttk
 import threading
 import os
 from src.logic.organization import OrganizationProcessor
+from src.logic.job_scheduler import JOB_QUEUED, PRIORITY_HIGH, PRIORITY_NORMAL, RESOURCE_EXCEL, folder_resource
 from src.utils.ui_utils import create_path_entry, select_folder_dialog, open_folder_in_explorer
 
 class OrganizeTab(ttk.Frame):
@@ -10,9 +11,13 @@ class OrganizeTab(ttk.Frame):
         super().__init__(parent)
         self.app_config = app_config
         self.log_widget = logger
+        # Folder name -> IntVar; the paths are rebuilt from stampa_root when printing.
         self.stampa_checkbox_vars = {}
+        self.stampa_root = None
         self.cancel_event = threading.Event()
         self.active_process_type = None
+        self.job = None
+        self.odc_map_job = None
 
         self._create_widgets()
         self.processor = OrganizationProcessor(self, app_config, fees_processor, self.setup_progress, self.update_progress, self.hide_progress)
@@ -34,6 +39,8 @@ class OrganizeTab(ttk.Frame):
         self.organize_button.grid(row=1, column=0, columnspan=2, sticky="we", pady=(10, 0))
         self.cancel_org_button = ttk.Button(self.org_frame, text="Annulla Organizzazione", command=self.cancel_process)
         # self.cancel_org_button is managed dynamically by toggle_buttons
+        self.bundle_check = ttk.Checkbutton(self.org_frame, text="Genera un PDF unico compresso per ogni ODC", variable=self.app_config.organizza_bundle_pdf, onvalue=True, offvalue=False)
+        self.bundle_check.grid(row=2, column=0, columnspan=2, sticky='w', pady=(5, 0))
 
         # --- Printing Frame ---
         self.print_frame = ttk.LabelFrame(self, text="2. Stampa Schede Organizzate", padding=15)
@@ -52,6 +59,8 @@ class OrganizeTab(ttk.Frame):
         self.open_folder_button.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 0))
         self.cancel_print_button = ttk.Button(self.print_controls_frame, text="Annulla Stampa", command=self.cancel_process)
         # self.cancel_print_button is managed dynamically
+        self.batch_print_check = ttk.Checkbutton(self.print_frame, text="Un unico lavoro di stampa per cartella (PDF unito)", variable=self.app_config.stampa_batch, onvalue=True, offvalue=False)
+        self.batch_print_check.grid(row=2, column=0, sticky='w', pady=(5, 0))
 
         # --- Checkbox List ---
         list_container = ttk.Frame(self.print_frame, borderwidth=1, relief="solid")
@@ -82,24 +91,27 @@ class OrganizeTab(ttk.Frame):
 
         self.on_process_finished()
 
-    def start_process(self, process_type, target_func, *args):
-        self.cancel_event.clear()
+    def start_process(self, process_type, job_name, resources, target_func, *args):
         self.active_process_type = process_type
         self.toggle_buttons(is_running=True)
-
-        thread_args = (self.cancel_event,) + args
-        threading.Thread(target=target_func, args=thread_args, daemon=True).start()
+        self.job = self.app_config.scheduler.submit(
+            job_name, target_func, args=args, resources=resources, priority=PRIORITY_HIGH,
+            cancel_event=self.cancel_event, on_skip=lambda: self.master.after(0, self.on_process_finished))
+        if self.job.state == JOB_QUEUED:
+            self.log_organizza("Processo in coda: Excel o le cartelle sono in uso da un altro processo.", "WARNING")
 
     def start_organization_process(self):
-        self.start_process('organize', self.processor.run_organization_process)
+        resources = [RESOURCE_EXCEL, folder_resource(self.app_config.organizza_source_dir.get()), folder_resource(self.app_config.organizza_dest_dir.get())]
+        self.start_process('organize', "Organizza schede per ODC", resources, self.processor.run_organization_process)
 
     def start_printing_process(self):
-        selected_folders = [d["path"] for d in self.stampa_checkbox_vars.values() if d["var"].get() == 1]
-        self.start_process('print', self.processor.run_printing_process, selected_folders)
+        selected_folders = [os.path.join(self.stampa_root, name) for name, var in self.stampa_checkbox_vars.items() if var.get() == 1]
+        resources = [RESOURCE_EXCEL, folder_resource(self.app_config.organizza_dest_dir.get())]
+        self.start_process('print', "Stampa schede organizzate", resources, self.processor.run_printing_process, selected_folders, self.app_config.stampa_batch.get())
 
     def cancel_process(self):
         self.log_organizza("Annullamento richiesto...", "WARNING")
-        self.cancel_event.set()
+        self.app_config.scheduler.cancel(self.job)
         self.cancel_org_button.config(state='disabled')
         self.cancel_print_button.config(state='disabled')
 
@@ -147,13 +159,27 @@ class OrganizeTab(ttk.Frame):
         self.progress_frame.pack_forget()
 
     def populate_stampa_list(self):
-        for widget in self.stampa_checkbox_frame.winfo_children(): widget.destroy()
-        self.stampa_checkbox_vars.clear()
+        """
+        Refreshes the list of organized folders. The ODC labels come from the Giornaliera,
+        which needs Excel and a copy from the share, so it is read in a job holding Excel;
+        the checkboxes are then rebuilt on the Tk thread.
+        """
+        if self.odc_map_job is not None and not self.odc_map_job.is_finished: return
         year = self.app_config.canoni_selected_year.get()
         month = self.app_config.canoni_selected_month.get()
+        self.odc_map_job = self.app_config.scheduler.submit(
+            "Stampa: lettura ODC dalla Giornaliera", self._read_odc_map, args=(year, month), resources=[RESOURCE_EXCEL], priority=PRIORITY_NORMAL)
+
+    def _read_odc_map(self, cancel_event, year, month):
         odc_map = self.processor.get_odc_to_canone_map(year, month)
+        self.after(0, self._rebuild_stampa_list, odc_map)
+
+    def _rebuild_stampa_list(self, odc_map):
+        for widget in self.stampa_checkbox_frame.winfo_children(): widget.destroy()
+        self.stampa_checkbox_vars.clear()
         dest_path = self.app_config.organizza_dest_dir.get()
         if not os.path.isdir(dest_path): return
+        self.stampa_root = dest_path
         try:
             folders = sorted([d for d in os.listdir(dest_path) if os.path.isdir(os.path.join(dest_path, d))])
             for folder_name in folders:
@@ -161,7 +187,8 @@ class OrganizeTab(ttk.Frame):
                 folder_path = os.path.join(dest_path, folder_name)
                 file_count = 0
                 try:
-                    file_count = len([name for name in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, name))])
+                    # Only workbooks count: the folder may also hold its merged '<ODC>.pdf'.
+                    file_count = len([name for name in os.listdir(folder_path) if name.lower().endswith(('.xls', '.xlsx', '.xlsm', '.xlsb')) and os.path.isfile(os.path.join(folder_path, name))])
                 except Exception as e:
                     self.log_organizza(f"Impossibile contare i file nella cartella '{folder_name}': {e}", "WARNING")
                 display_text = folder_name
@@ -169,6 +196,6 @@ class OrganizeTab(ttk.Frame):
                 display_text = f"{display_text} - qt. {file_count}"
                 cb = ttk.Checkbutton(self.stampa_checkbox_frame, text=display_text, variable=var)
                 cb.pack(anchor="w", padx=5, fill='x')
-                self.stampa_checkbox_vars[folder_name] = {"var": var, "path": folder_path}
+                self.stampa_checkbox_vars[folder_name] = var
         except Exception as e:
             self.log_organizza(f"Errore durante la lettura delle cartelle organizzate: {e}", "ERROR")
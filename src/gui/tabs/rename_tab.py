@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk
 import threading
 from src.logic.renaming import RenameProcessor
+from src.logic.job_scheduler import JOB_QUEUED, PRIORITY_HIGH, RESOURCE_EXCEL, folder_resource
 from src.utils.ui_utils import create_path_entry, select_folder_dialog
 
 class RenameTab(ttk.Frame):
@@ -10,6 +11,7 @@ class RenameTab(ttk.Frame):
         self.app_config = app_config
         self.log_widget = logger
         self.cancel_event = threading.Event()
+        self.job = None
 
         self._create_widgets()
 
@@ -60,13 +62,17 @@ class RenameTab(ttk.Frame):
         self.on_process_finished()
 
     def start_rename_process(self):
-        self.cancel_event.clear()
         self.toggle_buttons(is_running=True)
-        threading.Thread(target=self.processor.run_rename_process, args=(self.cancel_event,), daemon=True).start()
+        self.job = self.app_config.scheduler.submit(
+            "Rinomina schede", self.processor.run_rename_process,
+            resources=[RESOURCE_EXCEL, folder_resource(self.app_config.rinomina_path.get())], priority=PRIORITY_HIGH,
+            cancel_event=self.cancel_event, on_skip=lambda: self.master.after(0, self.on_process_finished))
+        if self.job.state == JOB_QUEUED:
+            self.log_rinomina("Processo in coda: Excel o la cartella sono in uso da un altro processo.", "WARNING")
 
     def cancel_process(self):
         self.log_rinomina("Annullamento richiesto...", "WARNING")
-        self.cancel_event.set()
+        self.app_config.scheduler.cancel(self.job)
         self.cancel_button.config(state='disabled')
 
     def on_process_finished(self):
@@ -6,9 +6,15 @@ import math
 import re
 from datetime import datetime
 from src.logic.signature import SignatureProcessor
-from src.logic.email_handler import EmailHandler
+from src.logic.email_handler import EmailHandler, EmlFileMailBackend, OutlookMailBackend
+from src.logic.pdf_compression import COMPRESSION_MODES
+from src.logic.job_scheduler import JOB_QUEUED, PRIORITY_HIGH, RESOURCE_EXCEL, RESOURCE_OUTLOOK, folder_resource
+from src.logic.email_planner import plan_email_chunks, build_drafts, scan_attachments, GROUP_BY_NONE, GROUP_BY_ODC, GROUP_BY_DATE
+from src.utils import constants as const
 from src.utils.ui_utils import create_path_entry, select_file_dialog, open_folder_in_explorer
 
+EMAIL_GROUPING_OPTIONS = {"Nessuno": GROUP_BY_NONE, "ODC": GROUP_BY_ODC, "Data": GROUP_BY_DATE}
+
 class SignatureTab(ttk.Frame):
     def __init__(self, parent, app_config, logger):
         super().__init__(parent)
@@ -17,6 +23,11 @@ class SignatureTab(ttk.Frame):
         self.prepared_drafts = []
         self.current_draft_index = 0
         self.cancel_event = threading.Event()
+        self.job = None
+        self.is_running = False
+        self.drafts_from_estimates = False
+        # The body as written (with '{file_list}'): the widget shows a rendered draft once planned.
+        self._body_template = None
 
         self._create_widgets()
 
@@ -64,6 +75,10 @@ class SignatureTab(ttk.Frame):
         create_path_entry(paths_frame, "Immagine Firma:", self.app_config.firma_image_path, 2, readonly=True)
         create_path_entry(paths_frame, "Ghostscript:", self.app_config.firma_ghostscript_path, 3, readonly=False,
                           browse_command=lambda: select_file_dialog(self.app_config.firma_ghostscript_path, "Seleziona eseguibile Ghostscript", [("Executable", "*.exe")]))
+        ttk.Label(paths_frame, text="Compressione PDF:").grid(row=4, column=0, sticky=tk.W, padx=5, pady=3)
+        self.compression_combo = ttk.Combobox(paths_frame, textvariable=self.app_config.firma_compression_mode, values=COMPRESSION_MODES, state="readonly", width=15)
+        self.compression_combo.grid(row=4, column=1, sticky=tk.W, padx=5, pady=3)
+        ttk.Checkbutton(paths_frame, text="Ghostscript in batch (un processo per più PDF)", variable=self.app_config.firma_gs_batch, onvalue=True, offvalue=False).grid(row=5, column=1, sticky=tk.W, padx=5, pady=3)
 
         # --- Mode Frame Content ---
         ttk.Radiobutton(mode_frame, text="Schede (Controllo, Manutenzione, etc.)", variable=self.app_config.firma_processing_mode, value="schede").pack(anchor=tk.W, padx=5, pady=2)
@@ -89,7 +104,11 @@ class SignatureTab(ttk.Frame):
 
         ttk.Label(email_settings_frame, text="Limite MB/Email:").pack(side=tk.LEFT, padx=(0, 5))
         self.size_limit_entry = ttk.Entry(email_settings_frame, textvariable=self.app_config.email_size_limit, width=5)
-        self.size_limit_entry.pack(side=tk.LEFT)
+        self.size_limit_entry.pack(side=tk.LEFT, padx=(0, 10))
+
+        ttk.Label(email_settings_frame, text="Raggruppa per:").pack(side=tk.LEFT, padx=(0, 5))
+        self.group_by_combo = ttk.Combobox(email_settings_frame, textvariable=self.app_config.email_group_by, values=list(EMAIL_GROUPING_OPTIONS.keys()), state="readonly", width=10)
+        self.group_by_combo.pack(side=tk.LEFT)
 
         create_path_entry(self.email_frame, "Destinatario(i):", self.app_config.email_to, 1, readonly=False)
         create_path_entry(self.email_frame, "CC:", self.app_config.email_cc, 2, readonly=False)
@@ -131,15 +150,19 @@ class SignatureTab(ttk.Frame):
         self._update_email_preview()
 
     def start_signature_process(self):
-        self.cancel_event.clear()
         self.toggle_buttons(is_running=True)
         self.preview_frame.pack_forget()
         self.prepared_drafts = []
-        threading.Thread(target=self.processor.run_full_signature_process, args=(self.cancel_event,), daemon=True).start()
+        resources = [RESOURCE_EXCEL, folder_resource(self.app_config.firma_excel_dir.get()), folder_resource(self.app_config.firma_pdf_dir.get())]
+        self.job = self.app_config.scheduler.submit(
+            "Apponi firma", self.processor.run_full_signature_process, resources=resources, priority=PRIORITY_HIGH,
+            cancel_event=self.cancel_event, on_skip=lambda: self.master.after(0, self.on_process_finished))
+        if self.job.state == JOB_QUEUED:
+            self.log_firma("Processo in coda: Excel o le cartelle sono in uso da un altro processo.", "WARNING")
 
     def cancel_process(self):
         self.log_firma("Annullamento richiesto...", "WARNING")
-        self.cancel_event.set()
+        self.app_config.scheduler.cancel(self.job)
         self.cancel_button.config(state='disabled')
 
     def on_process_finished(self):
@@ -148,8 +171,23 @@ class SignatureTab(ttk.Frame):
         has_pdfs = os.path.isdir(pdf_dir) and any(f.lower().endswith('.pdf') for f in os.listdir(pdf_dir))
         self.prepare_button.config(state='normal' if has_pdfs else 'disabled')
         self.email_button.config(state='disabled')
+        if self.drafts_from_estimates:
+            # Drafts were planned on predicted sizes while compressing: redo them on the real ones.
+            self.drafts_from_estimates = False
+            if has_pdfs:
+                self.log_firma("Aggiornamento delle bozze con le dimensioni reali dei PDF...", "INFO")
+                self.prepare_email_drafts(reuse_template=True)
+            else:
+                self.prepared_drafts = []
+                self.preview_frame.pack_forget()
+
+    def on_size_estimates_ready(self):
+        """Called once the PDFs are exported, so drafts can be previewed during compression."""
+        if self.is_running:
+            self.prepare_button.config(state='normal')
 
     def toggle_buttons(self, is_running):
+        self.is_running = is_running
         if is_running:
             self.run_button.pack_forget()
             self.cancel_button.pack(fill=tk.X, ipady=8, pady=5)
@@ -161,8 +199,15 @@ class SignatureTab(ttk.Frame):
             self.run_button.pack(fill=tk.X, ipady=8, pady=5)
             self.run_button.config(state='normal')
 
-    def prepare_email_drafts(self):
-        # ... (rest of the file is unchanged)
+    def prepare_email_drafts(self, reuse_template=False):
+        """
+        Plans the drafts of the PDFs in the output folder and shows the first one.
+
+        Args:
+            reuse_template (bool): Re-plan from the body template of the last planning
+                instead of the text box, which by then holds a rendered draft. Used by
+                the automatic re-plans; planning by hand reads the text box.
+        """
         self.log_firma("Preparazione delle bozze email...", "HEADER")
         try:
             limit_mb_str = self.app_config.email_size_limit.get()
@@ -175,46 +220,38 @@ class SignatureTab(ttk.Frame):
         if not os.path.isdir(pdf_dir):
             self.log_firma(f"ERRORE: La cartella PDF non esiste: {pdf_dir}", "ERROR")
             return
-        all_attachments = [(p, os.path.getsize(p)) for p in [os.path.join(pdf_dir, f) for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]]
+        estimated_count = 0
+        if self.is_running:
+            all_attachments, estimated_count = self.processor.get_attachment_sizes()
+        else:
+            all_attachments = scan_attachments(pdf_dir)
+        self.drafts_from_estimates = estimated_count > 0
         if not all_attachments:
             self.log_firma("Nessun file PDF trovato da allegare.", "WARNING")
             return
-        chunks = []
-        current_chunk = []
-        current_chunk_size = 0
-        for path, size in all_attachments:
-            if current_chunk and current_chunk_size + size > limit_bytes:
-                chunks.append(current_chunk)
-                current_chunk = []
-                current_chunk_size = 0
-            current_chunk.append(path)
-            current_chunk_size += size
-        if current_chunk:
-            chunks.append(current_chunk)
-        self.prepared_drafts = []
-        num_drafts = len(chunks)
+        group_by = EMAIL_GROUPING_OPTIONS.get(self.app_config.email_group_by.get(), GROUP_BY_NONE)
+        odc_by_name = self.processor.pdf_odcs
+        if group_by == GROUP_BY_ODC and not any(os.path.basename(p) in odc_by_name for p, _ in all_attachments):
+            self.log_firma("ODC non noto per questi PDF (non esportati in questa sessione): bozze non raggruppate per ODC.", "WARNING")
+        plan = plan_email_chunks(all_attachments, limit_bytes, group_by, odc_by_name)
+        chunks = plan.chunks
         raw_subject = self.app_config.email_subject.get()
         base_subject = re.sub(r'^\[\d+/\d+\]\s*', '', raw_subject)
         self.app_config.email_subject.set(base_subject)
-        for i, chunk in enumerate(chunks):
-            draft = {}
-            draft['to'] = self.app_config.email_to.get()
-            draft['cc'] = self.app_config.email_cc.get()
-            draft['subject'] = f"[{i+1}/{num_drafts}] {base_subject}" if num_drafts > 1 else base_subject
-            draft['attachments'] = chunk
-            draft['file_list'] = [os.path.splitext(os.path.basename(p))[0] for p in chunk]
-            base_template = self.email_body_text.get("1.0", tk.END).strip()
-            if i == 0:
-                draft['intro_text'] = base_template
-            else:
-                draft['intro_text'] = f"Seguito della mail precedente.\n\nElenco file:\n{{file_list}}"
-            self.prepared_drafts.append(draft)
+        if not reuse_template or self._body_template is None:
+            self._body_template = self.email_body_text.get("1.0", tk.END).strip()
+        self.prepared_drafts = build_drafts(plan, self.app_config.email_to.get(), self.app_config.email_cc.get(), base_subject,
+                                            self._body_template, "Seguito della mail precedente.\n\nElenco file:\n{file_list}")
         self.log_firma(f"Preparate {len(self.prepared_drafts)} bozze di email.", "SUCCESS")
+        if self.drafts_from_estimates:
+            self.log_firma(f"Dimensioni stimate per {estimated_count} PDF ancora in compressione: le bozze verranno aggiornate al termine.", "WARNING")
+        if plan.saved_drafts:
+            self.log_firma(f"Bozze risparmiate rispetto alla suddivisione sequenziale: {plan.saved_drafts} (da {plan.greedy_count} a {len(chunks)}).", "INFO")
         self.current_draft_index = 0
         self._display_draft_preview()
         self.preview_frame.pack(side=tk.LEFT, padx=(20, 0))
         self.prepare_button.config(state='normal')
-        self.email_button.config(state='normal')
+        self.email_button.config(state='disabled' if self.is_running else 'normal')
 
     def _display_draft_preview(self):
         if not self.prepared_drafts:
@@ -222,12 +259,10 @@ class SignatureTab(ttk.Frame):
             return
         draft = self.prepared_drafts[self.current_draft_index]
         self.preview_label['text'] = f"Anteprima {self.current_draft_index + 1}/{len(self.prepared_drafts)}"
-        self.app_config.email_to.set(draft['to'])
-        self.app_config.email_subject.set(draft['subject'])
-        file_list_str = "\n".join([os.path.splitext(os.path.basename(p))[0] for p in draft['attachments']])
-        full_body = draft['intro_text'].replace("{file_list}", file_list_str)
+        self.app_config.email_to.set(draft.to)
+        self.app_config.email_subject.set(draft.subject)
         self.email_body_text.delete("1.0", tk.END)
-        self.email_body_text.insert("1.0", full_body)
+        self.email_body_text.insert("1.0", draft.body_text)
         self.prev_button.config(state='normal' if self.current_draft_index > 0 else 'disabled')
         self.next_button.config(state='normal' if self.current_draft_index < len(self.prepared_drafts) - 1 else 'disabled')
 
@@ -243,18 +278,25 @@ class SignatureTab(ttk.Frame):
 
     def start_email_creation_process(self):
         self.toggle_buttons(is_running=True)
-        threading.Thread(target=self.create_email_drafts_in_outlook, daemon=True).start()
-
-    def create_email_drafts_in_outlook(self):
+        backend = self._get_mail_backend()
+        self.app_config.scheduler.submit(
+            f"Bozze email ({backend.name})", lambda cancel_event: self.create_email_drafts(backend),
+            resources=[RESOURCE_OUTLOOK] if isinstance(backend, OutlookMailBackend) else [], priority=PRIORITY_HIGH,
+            on_skip=lambda: self.master.after(0, self.on_process_finished))
+
+    def _get_mail_backend(self):
+        if self.app_config.email_backend.get() == EmlFileMailBackend.name:
+            return EmlFileMailBackend(os.path.join(const.APPLICATION_PATH, const.EMAIL_DRAFTS_DIR))
+        return OutlookMailBackend()
+
+    def create_email_drafts(self, backend):
         try:
             if not self.prepared_drafts:
                 self.log_firma("Nessuna bozza da creare.", "WARNING")
                 return
-            self.log_firma(f"Avvio creazione di {len(self.prepared_drafts)} bozze in Outlook...", "HEADER")
-            email_handler = EmailHandler(self.log_firma)
-            for draft_info in self.prepared_drafts:
-                email_handler.create_outlook_draft(draft_info)
-            self.log_firma("Creazione bozze in Outlook completata.", "SUCCESS")
+            self.log_firma(f"Avvio creazione di {len(self.prepared_drafts)} bozze ({backend.name})...", "HEADER")
+            EmailHandler(self.log_firma, backend).create_drafts(self.prepared_drafts)
+            self.log_firma("Creazione bozze completata.", "SUCCESS")
             self.prepared_drafts = []
             self.master.after(0, self.preview_frame.pack_forget)
         finally:
@@ -346,3 +388,4 @@ class SignatureTab(ttk.Frame):
 
         self.email_body_text.delete("1.0", tk.END)
         self.email_body_text.insert("1.0", body_template)
+        self._body_template = body_template
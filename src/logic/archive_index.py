@@ -0,0 +1,273 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from src.utils import constants as const
+from src.utils.excel_handler import ExcelHandler
+from src.utils.file_inventory import ErrorLog, FileInventory
+from src.logic.job_scheduler import PRIORITY_LOW, RESOURCE_EXCEL
+from src.logic.workbook_metadata import get_metadata_extractor, normalize_odc
+
+_SCHEMA = """
+PRAGMA journal_mode=WAL;
+CREATE TABLE IF NOT EXISTS schede (
+    path TEXT PRIMARY KEY COLLATE NOCASE,
+    folder TEXT NOT NULL COLLATE NOCASE,
+    name TEXT NOT NULL,
+    odc TEXT,
+    odc_key TEXT,
+    model TEXT,
+    emission_date TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha1 TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS schede_by_odc ON schede(odc_key);
+CREATE INDEX IF NOT EXISTS schede_by_date ON schede(emission_date);
+CREATE INDEX IF NOT EXISTS schede_by_model ON schede(model, emission_date);
+CREATE INDEX IF NOT EXISTS schede_by_version ON schede(size, mtime_ns);
+"""
+
+_UPSERT = ("INSERT OR REPLACE INTO schede (path, folder, name, odc, odc_key, model, emission_date, size, mtime_ns, sha1, indexed_at) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def odc_key(value):
+    """The form ODC values are indexed and searched by: normalised as in `normalize_odc`, upper-case."""
+    odc = normalize_odc(value)
+    return odc.upper() if odc else None
+
+
+def file_sha1(path, block_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''): digest.update(block)
+    return digest.hexdigest()
+
+
+class ArchiveEntry:
+    """One indexed workbook, as returned by `ArchiveIndex.search`."""
+    __slots__ = ("path", "odc", "model", "emission_date", "size", "sha1")
+
+    def __init__(self, path, odc, model, emission_date, size, sha1):
+        self.path = path
+        self.odc = odc
+        self.model = model
+        self.emission_date = emission_date
+        self.size = size
+        self.sha1 = sha1
+
+
+class ArchiveIndex:
+    """
+    A persistent SQLite index of the workbooks of the archive tree: path, ODC, model,
+    emission date, size and content hash, searchable by ODC, date range and model.
+
+    Updates are incremental. The tree is listed with `FileInventory` and compared
+    with the index inside SQLite, so only new or changed files are read; their
+    metadata comes from the shared extractor, which skips Excel for workbooks the
+    other processors have just read. A file renamed in place (same folder, size and
+    modification time as a file that disappeared) keeps its record without being
+    opened. Rows are written in batches, and an interrupted update keeps what it
+    indexed so far.
+    """
+    BATCH = 500
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.metadata = get_metadata_extractor()
+        self._schema_ready = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        if not self._schema_ready:
+            connection.executescript(_SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def update(self, root, excel, cancel_event, password=None, should_yield=None, progress_cb=None, logger=None):
+        """
+        Brings the index of `root` up to date.
+
+        Args:
+            root (str): The archive folder to index (recursively).
+            excel: The Excel application (from ExcelHandler), used for unread files.
+            cancel_event (threading.Event): Stops the update after the current file.
+            password (str, optional): Tried on protected workbooks.
+            should_yield (callable, optional): Returns True when the update should
+                stop to let another job go first.
+            progress_cb (callable, optional): Called as progress_cb(done, total).
+            logger (callable, optional): Receives the per-file errors.
+
+        Returns:
+            dict: 'scanned', 'indexed', 'renamed', 'removed', 'errors' and 'complete'
+            (False if the update stopped before the end).
+        """
+        inventory = FileInventory.scan(root, cancel_event=cancel_event)
+        stats = {"scanned": len(inventory), "indexed": 0, "renamed": 0, "removed": 0, "errors": 0, "complete": False}
+        if cancel_event.is_set(): return stats
+        connection = self._connect()
+        try:
+            connection.execute("CREATE TEMP TABLE seen (path TEXT PRIMARY KEY COLLATE NOCASE, idx INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL)")
+            connection.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?, ?, ?)",
+                                   ((inventory.path(i), i, inventory.size(i), inventory.mtime_ns(i)) for i in range(len(inventory))))
+            changed = [row[0] for row in connection.execute(
+                "SELECT s.idx FROM seen s LEFT JOIN schede f ON f.path = s.path "
+                "WHERE f.path IS NULL OR f.size != s.size OR f.mtime_ns != s.mtime_ns ORDER BY s.idx")]
+            with ErrorLog("indice archivio") as errors:
+                pending = []
+                for done, i in enumerate(changed, 1):
+                    if cancel_event.is_set() or (should_yield and should_yield()): break
+                    path = inventory.path(i)
+                    try:
+                        row, renamed = self._index_file(connection, inventory, i, path, excel, password)
+                        pending.append(row)
+                        stats["renamed" if renamed else "indexed"] += 1
+                    except Exception as e:
+                        errors.add(os.path.basename(path), f"Dettagli: {e}")
+                        if logger: logger(f"  -> Non indicizzato: {os.path.basename(path)} ({e})", "WARNING")
+                    if len(pending) >= self.BATCH:
+                        with connection: connection.executemany(_UPSERT, pending)
+                        pending = []
+                    if progress_cb: progress_cb(done, len(changed))
+                else:
+                    stats["complete"] = True
+                with connection: connection.executemany(_UPSERT, pending)
+                stats["errors"] = len(errors)
+            if stats["complete"]:
+                # Only a complete pass may drop rows: files not reached yet are still in the tree.
+                prefix = os.path.join(root, "")
+                with connection:
+                    stats["removed"] = connection.execute(
+                        "DELETE FROM schede WHERE substr(path, 1, ?) = ? COLLATE NOCASE AND path NOT IN (SELECT path FROM seen)",
+                        (len(prefix), prefix)).rowcount
+        finally:
+            connection.close()
+        return stats
+
+    def _index_file(self, connection, inventory, i, path, excel, password):
+        """Returns the row to store for file `i` and whether it was carried over from a rename."""
+        folder, name = inventory.directory(i), inventory.name(i)
+        size, mtime_ns = inventory.size(i), inventory.mtime_ns(i)
+        previous = connection.execute(
+            "SELECT rowid, odc, model, emission_date, sha1 FROM schede WHERE size = ? AND mtime_ns = ? AND folder = ? "
+            "AND path NOT IN (SELECT path FROM seen) LIMIT 1", (size, mtime_ns, folder)).fetchone()
+        if previous:
+            rowid, odc, model, emission_date, sha1 = previous
+            # The old path goes now, so it cannot be matched to a second renamed file.
+            connection.execute("DELETE FROM schede WHERE rowid = ?", (rowid,))
+            return (path, folder, name, odc, odc_key(odc), model, emission_date, size, mtime_ns, sha1, time.time()), True
+        metadata = self.metadata.extract(excel, path, password=password)
+        odc = normalize_odc(metadata.odc)
+        emission_date = metadata.date.strftime("%Y-%m-%d") if metadata.date else None
+        return (path, folder, name, odc, odc_key(odc), metadata.model or None, emission_date, size, mtime_ns, file_sha1(path), time.time()), False
+
+    def search(self, odc=None, date_from=None, date_to=None, model=None, name=None, limit=2000):
+        """
+        Returns the indexed workbooks matching every given filter, newest first.
+
+        Args:
+            odc (str, optional): ODC, or its beginning (case-insensitive).
+            date_from, date_to (datetime, optional): Emission date range, inclusive.
+            model (str, optional): Normalised model key, as stored by the extractor.
+            name (str, optional): Text contained in the file name.
+            limit (int): Maximum number of results.
+
+        Returns:
+            list[ArchiveEntry]: The matches.
+        """
+        clauses, params = [], []
+        key = odc_key(odc)
+        if key:
+            # A range on the indexed key: a prefix match that still uses the index.
+            clauses.append("odc_key >= ? AND odc_key < ?"); params += [key, key + "\uffff"]
+        if date_from:
+            clauses.append("emission_date >= ?"); params.append(date_from.strftime("%Y-%m-%d"))
+        if date_to:
+            clauses.append("emission_date <= ?"); params.append(date_to.strftime("%Y-%m-%d"))
+        if model:
+            clauses.append("model = ?"); params.append(model)
+        if name and name.strip():
+            clauses.append("name LIKE ?"); params.append(f"%{name.strip()}%")
+        query = "SELECT path, odc, model, emission_date, size, sha1 FROM schede"
+        if clauses: query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY emission_date DESC, name LIMIT ?"
+        params.append(limit)
+        connection = self._connect()
+        try: return [ArchiveEntry(*row) for row in connection.execute(query, params)]
+        finally: connection.close()
+
+    def models(self):
+        """Returns the models present in the index, alphabetically."""
+        connection = self._connect()
+        try: return [row[0] for row in connection.execute("SELECT DISTINCT model FROM schede WHERE model IS NOT NULL ORDER BY model")]
+        finally: connection.close()
+
+    def count(self):
+        connection = self._connect()
+        try: return connection.execute("SELECT COUNT(*) FROM schede").fetchone()[0]
+        finally: connection.close()
+
+
+class ArchiveIndexer:
+    """
+    Runs index updates as low-priority jobs: an update yields Excel to any job the
+    user starts and queues itself again to carry on afterwards.
+    """
+    def __init__(self, app_config, logger):
+        self.app_config = app_config
+        self.logger = logger
+        self.scheduler = app_config.scheduler
+        self.index = get_archive_index()
+        self.on_update_finished = None
+
+    def queue_update(self, root=None):
+        root = root or self.app_config.archivio_dir.get()
+        return self.scheduler.submit(f"Indice archivio: {os.path.basename(os.path.normpath(root)) or root}", self.run_update,
+                                     args=(root,), resources=[RESOURCE_EXCEL], priority=PRIORITY_LOW)
+
+    def run_update(self, cancel_event, root):
+        if not os.path.isdir(root):
+            self.logger(f"ERRORE: Cartella dell'archivio non trovata: {root}", "ERROR"); return False
+        self.logger(f"Aggiornamento indice di: {root}", "HEADER")
+        started = time.perf_counter()
+        last_report = [0.0]
+
+        def progress(done, total):
+            if time.perf_counter() - last_report[0] >= 10:
+                last_report[0] = time.perf_counter()
+                self.logger(f"  -> {done}/{total} file letti...", "INFO")
+
+        try:
+            with ExcelHandler(self.logger) as excel:
+                if not excel: return False
+                stats = self.index.update(root, excel, cancel_event, password=self.app_config.rinomina_password.get(),
+                                          should_yield=lambda: self.scheduler.has_waiting([RESOURCE_EXCEL], PRIORITY_LOW),
+                                          progress_cb=progress, logger=self.logger)
+            elapsed = time.perf_counter() - started
+            self.logger(f"File nell'archivio: {stats['scanned']}. Indicizzati: {stats['indexed']}, rinominati riconosciuti: {stats['renamed']}, "
+                        f"rimossi: {stats['removed']}, errori: {stats['errors']} ({elapsed:.0f} s).", "SUCCESS" if not stats["errors"] else "WARNING")
+            if not stats["complete"] and not cancel_event.is_set():
+                self.logger("Excel richiesto da un altro processo: l'aggiornamento riprenderà al termine.", "INFO")
+                self.queue_update(root)
+        except (OSError, sqlite3.Error) as e:
+            self.logger(f"ERRORE aggiornamento indice: {e}", "ERROR")
+            raise
+        finally:
+            if cancel_event.is_set(): self.logger("Aggiornamento indice annullato.", "WARNING")
+            if self.on_update_finished: self.on_update_finished()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_archive_index():
+    """Returns the archive index shared by the application, next to the application."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ArchiveIndex(os.path.join(const.APPLICATION_PATH, const.ARCHIVE_INDEX_FILE_NAME))
+        return _index
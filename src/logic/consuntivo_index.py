@@ -0,0 +1,88 @@
+import os
+import re
+import threading
+import time
+
+LEADING_NUMBER_REGEX = re.compile(r'^(\d+)')
+
+
+class ConsuntivoIndex:
+    """
+    An in-memory index of a CONSUNTIVI folder on the network share.
+
+    The folder is listed with a single `scandir` and indexed by consuntivo number and
+    by (month, TCL). The listing is only rebuilt when the folder's modification time
+    changes, and that time is checked at most once every MTIME_CHECK_INTERVAL seconds,
+    so repeated lookups (e.g. while typing) do not touch the share at all.
+    """
+    MTIME_CHECK_INTERVAL = 5.0
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._entries = []
+        self._by_number = {}
+        self._by_month_tcl = {}
+
+    def _refresh_if_needed(self):
+        # Must be called with the lock held. Raises OSError if the folder is unreachable.
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.MTIME_CHECK_INTERVAL:
+            return
+        mtime = os.stat(self.directory).st_mtime
+        self._checked_at = now
+        if mtime == self._mtime:
+            return
+        entries = []
+        by_number = {}
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                match = LEADING_NUMBER_REGEX.match(entry.name)
+                number = match.group(1) if match else None
+                entries.append((number, entry.name, entry.name.upper()))
+                # Same rule as the old lookup: "<n>-..." or "<n> ...", first match wins.
+                if number and entry.name[len(number):len(number) + 1] in ("-", " "):
+                    by_number.setdefault(number, entry.name)
+        self._entries = entries
+        self._by_number = by_number
+        self._by_month_tcl = {}
+        self._mtime = mtime
+
+    def invalidate(self):
+        """Forces the next lookup to check the folder again."""
+        with self._lock:
+            self._checked_at = 0.0
+            self._mtime = None
+
+    def entries(self):
+        """Returns the (number, file name, upper-case file name) tuples of the folder."""
+        with self._lock:
+            self._refresh_if_needed()
+            return list(self._entries)
+
+    def path_for_number(self, consuntivo_num):
+        """Returns the path of the file of consuntivo `consuntivo_num`, or None."""
+        with self._lock:
+            self._refresh_if_needed()
+            filename = self._by_number.get(consuntivo_num)
+        return os.path.join(self.directory, filename) if filename else None
+
+    def find_for_tcl(self, month_name, tcl_name):
+        """
+        Returns (number, path) of the monthly canone file of a TCL, or (None, None).
+        Results are memoised until the folder changes.
+        """
+        key = (month_name.upper(), tcl_name.upper())
+        with self._lock:
+            self._refresh_if_needed()
+            if key not in self._by_month_tcl:
+                found = (None, None)
+                for number, filename, filename_norm in self._entries:
+                    if number and all(keyword in filename_norm for keyword in ("CANONE",) + key):
+                        found = (number, filename)
+                        break
+                self._by_month_tcl[key] = found
+            number, filename = self._by_month_tcl[key]
+        return (number, os.path.join(self.directory, filename)) if filename else (None, None)
@@ -1,58 +1,248 @@
-import win32com.client
+import base64
+import io
+import mimetypes
+import os
+import re
+import time
 import traceback
-import pythoncom
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from email.header import Header
+from email.utils import formatdate
+from urllib.parse import quote
 
-class EmailHandler:
+# The COM modules are only needed by the Outlook backend; the file backend works without them.
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:
+    pythoncom = None
+    win32com = None
+
+
+class MailBackend:
     """
-    Handles the creation of email drafts in Microsoft Outlook.
+    Where email drafts are created. Subclasses implement `create_draft`; backends that
+    can safely create several drafts at once set `parallel`. `open`/`close` bracket a
+    whole batch, so per-batch setup (such as starting COM) happens once. `setup_hint`
+    tells the user what to check when `open` fails.
     """
-    def __init__(self, logger):
-        self.logger = logger
+    name = "base"
+    parallel = False
+    setup_hint = ""
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
 
-    def create_outlook_draft(self, draft_info):
+    def create_draft(self, draft):
         """
-        Creates and displays a single Outlook email draft from a draft info object.
+        Creates one draft from an `EmailDraft`.
 
-        Args:
-            draft_info (dict): A dictionary containing 'to', 'subject', 'intro_text',
-                               'file_list', and 'attachments'.
+        Returns:
+            list[tuple[str, Exception]]: The attachments left out of the draft, with the
+            error that stopped each one.
         """
+        raise NotImplementedError
+
+
+class OutlookMailBackend(MailBackend):
+    """
+    Creates and displays drafts in Outlook. Outlook's object model only adds attachments
+    one at a time, and COM objects stay on the thread that created them, so drafts are
+    created one after another on the batch's thread.
+    """
+    name = "outlook"
+    setup_hint = "Verificare che Outlook sia installato e configurato."
+
+    def __init__(self):
+        self.outlook = None
+
+    def open(self):
+        if win32com is None: raise RuntimeError("pywin32 non installato: Outlook non disponibile.")
         pythoncom.CoInitialize()
+        self.outlook = win32com.client.Dispatch("Outlook.Application")
+
+    def close(self):
+        self.outlook = None
+        if pythoncom is not None: pythoncom.CoUninitialize()
+
+    def create_draft(self, draft):
+        mail = self.outlook.CreateItem(0)
+        mail.To = draft.to
+        mail.CC = draft.cc
+        mail.Subject = draft.subject
+        mail.Display()
+        signature = mail.HTMLBody
+        mail.HTMLBody = draft.body_html + signature
+        attachments = mail.Attachments
+        skipped = []
+        for attachment_path in draft.attachments:
+            # One attachment Outlook refuses must not cost the whole draft.
+            try: attachments.Add(attachment_path)
+            except Exception as e: skipped.append((attachment_path, e))
+        return skipped
+
+
+def load_outlook_signature(signatures_dir=None):
+    """
+    Returns the HTML of the user's Outlook signature (the first .htm file in the
+    Outlook signatures folder), or "" if there is none. Pictures the signature links
+    to in its companion folder are not embedded.
+    """
+    signatures_dir = signatures_dir or os.path.join(os.environ.get('APPDATA', ''), 'Microsoft', 'Signatures')
+    try:
+        names = sorted(n for n in os.listdir(signatures_dir) if n.lower().endswith(('.htm', '.html')))
+    except OSError:
+        return ""
+    for name in names:
         try:
-            to = draft_info['to']
-            cc = draft_info.get('cc', '')
-            subject = draft_info['subject']
-            intro_text = draft_info['intro_text']
-            file_list = draft_info['file_list']
-            attachments = draft_info['attachments']
+            with open(os.path.join(signatures_dir, name), 'rb') as f:
+                raw = f.read()
+        except OSError:
+            continue
+        # Outlook saves signatures as windows-1252 unless they declare otherwise.
+        match = re.search(rb'charset=["\']?([\w-]+)', raw[:2048], re.IGNORECASE)
+        try: return raw.decode(match.group(1).decode('ascii') if match else 'windows-1252')
+        except (LookupError, UnicodeDecodeError): return raw.decode('utf-8', errors='replace')
+    return ""
+
 
-            outlook = win32com.client.Dispatch("Outlook.Application")
-            mail = outlook.CreateItem(0)
+def _encode_header(value):
+    try:
+        value.encode('ascii')
+        return value
+    except UnicodeEncodeError:
+        return Header(value, 'utf-8').encode()
 
-            mail.To = to
-            mail.CC = cc
-            mail.Subject = subject
 
-            mail.Display()
-            signature = mail.HTMLBody
+def _filename_params(file_name):
+    try:
+        file_name.encode('ascii')
+        return f'filename="{file_name}"'
+    except UnicodeEncodeError:
+        return f"filename*=utf-8''{quote(file_name)}"
 
-            files_html = "<br>".join(file_list)
-            body_with_files = intro_text.replace("{file_list}", files_html)
-            body_with_br = body_with_files.replace('\n', '<br>')
 
-            mail.HTMLBody = f"<p style='font-family:calibri; font-size:11pt'>{body_with_br}</p>" + signature
+class EmlFileMailBackend(MailBackend):
+    """
+    Writes each draft as an .eml file that Outlook opens as an unsent draft (X-Unsent),
+    with the same HTML body and signature layout as an Outlook draft.
+
+    The MIME structure is written directly: attachments are read and base64-encoded in
+    blocks, so memory stays flat whatever their size, and each file is written under a
+    temporary name and renamed when complete. Drafts are independent files, so they are
+    written in parallel. Outlook's own .msg format is not produced: it is a compound
+    document that Outlook itself is needed to write.
+    """
+    name = "file"
+    parallel = True
+    setup_hint = "Verificare che la cartella delle bozze sia accessibile in scrittura."
+    # A multiple of 57 bytes, which base64 turns into exactly one 76-character line.
+    READ_BLOCK = 57 * 1024
 
-            self.logger(f"Aggiunta di {len(attachments)} allegati alla bozza '{subject}'...", "INFO")
-            for attachment_path in attachments:
-                try:
-                    mail.Attachments.Add(attachment_path)
-                except Exception as e:
-                    self.logger(f"Impossibile aggiungere l'allegato: {attachment_path}. Errore: {e}", "ERROR")
+    def __init__(self, output_dir, signature_html=None):
+        self.output_dir = output_dir
+        self.signature_html = signature_html
 
-            self.logger("Bozza email creata e mostrata con successo.", "SUCCESS")
+    def open(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.signature_html is None: self.signature_html = load_outlook_signature()
 
+    def create_draft(self, draft):
+        safe_name = "".join(c for c in draft.subject if c not in '\\/:*?"<>|')
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')} {safe_name}.eml")
+        part_path = path + ".part"
+        try:
+            with open(part_path, 'wb') as f:
+                self._write_message(f, draft)
+            os.replace(part_path, path)
+        except BaseException:
+            try: os.remove(part_path)
+            except OSError: pass
+            raise
+        return []
+
+    def _write_message(self, f, draft):
+        mixed, alternative = f"=_mixed_{uuid.uuid4().hex}", f"=_alt_{uuid.uuid4().hex}"
+        headers = [("To", draft.to), ("Cc", draft.cc), ("Subject", _encode_header(draft.subject)), ("Date", formatdate(localtime=True)),
+                   ("X-Unsent", "1"), ("MIME-Version", "1.0"), ("Content-Type", f'multipart/mixed; boundary="{mixed}"')]
+        f.write("".join(f"{name}: {value}\r\n" for name, value in headers if value).encode('utf-8'))
+        f.write(f'\r\n--{mixed}\r\nContent-Type: multipart/alternative; boundary="{alternative}"\r\n'.encode('ascii'))
+        html = draft.body_html + (self.signature_html or "")
+        for subtype, text in (("plain", draft.body_text), ("html", html)):
+            f.write(f"\r\n--{alternative}\r\nContent-Type: text/{subtype}; charset=utf-8\r\nContent-Transfer-Encoding: base64\r\n\r\n".encode('ascii'))
+            self._write_base64(f, io.BytesIO(text.encode('utf-8')))
+        f.write(f"\r\n--{alternative}--\r\n".encode('ascii'))
+        for attachment_path in draft.attachments:
+            file_name = os.path.basename(attachment_path)
+            ctype = mimetypes.guess_type(attachment_path)[0] or 'application/octet-stream'
+            f.write(f"\r\n--{mixed}\r\nContent-Type: {ctype}\r\nContent-Transfer-Encoding: base64\r\n"
+                    f"Content-Disposition: attachment; {_filename_params(file_name)}\r\n\r\n".encode('utf-8'))
+            with open(attachment_path, 'rb') as source:
+                self._write_base64(f, source)
+        f.write(f"\r\n--{mixed}--\r\n".encode('ascii'))
+
+    def _write_base64(self, f, source):
+        while True:
+            block = source.read(self.READ_BLOCK)
+            if not block: break
+            encoded = base64.b64encode(block)
+            f.write(b"\r\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76)))
+            f.write(b"\r\n")
+
+
+class EmailHandler:
+    """
+    Creates the planned email drafts through a mail backend (Outlook by default).
+    """
+    def __init__(self, logger, backend=None, max_workers=4):
+        self.logger = logger
+        self.backend = backend or OutlookMailBackend()
+        self.max_workers = max_workers
+
+    def create_drafts(self, drafts):
+        """
+        Creates every draft, in parallel when the backend allows it.
+
+        Args:
+            drafts (list[EmailDraft]): The drafts from `build_drafts`.
+
+        Returns:
+            int: How many drafts were created.
+        """
+        started = time.perf_counter()
+        created = 0
+        try:
+            self.backend.open()
         except Exception as e:
-            self.logger(f"ERRORE FATALE: Impossibile creare la bozza dell'email. Verificare che Outlook sia installato e configurato. Dettagli: {e}", "ERROR")
-            self.logger(traceback.format_exc(), "ERROR")
+            self.logger(f"ERRORE FATALE: Impossibile creare le bozze email ({self.backend.name}). {self.backend.setup_hint} Dettagli: {e}", "ERROR")
+            return 0
+        try:
+            if self.backend.parallel and len(drafts) > 1:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    created = sum(executor.map(self._create_one, drafts))
+            else:
+                created = sum(self._create_one(draft) for draft in drafts)
         finally:
-            pythoncom.CoUninitialize()
+            self.backend.close()
+        elapsed = time.perf_counter() - started
+        total_mb = sum(d.size for d in drafts) / (1024 * 1024)
+        self.logger(f"Create {created}/{len(drafts)} bozze ({self.backend.name}) in {elapsed:.1f} s, {total_mb:.1f} MB di allegati.", "SUCCESS" if created == len(drafts) else "WARNING")
+        return created
+
+    def _create_one(self, draft):
+        try:
+            skipped = self.backend.create_draft(draft) or []
+            for attachment_path, error in skipped:
+                self.logger(f"Impossibile aggiungere l'allegato: {attachment_path}. Errore: {error}", "ERROR")
+            added = len(draft.attachments) - len(skipped)
+            self.logger(f"Bozza '{draft.subject}' creata con {added}/{len(draft.attachments)} allegati." if skipped else
+                        f"Bozza '{draft.subject}' creata con {added} allegati.", "WARNING" if skipped else "SUCCESS")
+            return 1
+        except Exception as e:
+            self.logger(f"ERRORE creazione bozza '{draft.subject}': {e}", "ERROR")
+            self.logger(traceback.format_exc(), "ERROR")
+            return 0
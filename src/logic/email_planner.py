@@ -0,0 +1,172 @@
+import os
+import re
+
+# Keys accepted by `plan_email_chunks(group_by=...)`.
+GROUP_BY_NONE = None
+GROUP_BY_ODC = "odc"
+GROUP_BY_DATE = "date"
+
+DATE_IN_FILENAME_REGEX = re.compile(r'\((\d{2}-\d{2}-\d{4})\)')
+
+
+class EmailPlan:
+    """
+    The result of splitting a set of attachments into email drafts.
+
+    Attributes:
+        chunks (list[list[str]]): The attachment paths of each draft, in sending order.
+        chunk_sizes (list[int]): The total size in bytes of each draft.
+        greedy_count (int): How many drafts the old in-order greedy split would have produced.
+        sizes (dict[str, int]): The size of every attachment, as given to the planner.
+    """
+    def __init__(self, chunks, chunk_sizes, greedy_count, sizes):
+        self.chunks = chunks
+        self.chunk_sizes = chunk_sizes
+        self.greedy_count = greedy_count
+        self.sizes = sizes
+
+    @property
+    def saved_drafts(self):
+        return max(0, self.greedy_count - len(self.chunks))
+
+
+class EmailDraft:
+    """
+    One planned email. The body is rendered once, as text for the preview and as HTML
+    for the mail backends, so neither navigation nor draft creation rebuilds it.
+    """
+    __slots__ = ("to", "cc", "subject", "attachments", "size", "body_text", "body_html")
+
+    def __init__(self, to, cc, subject, attachments, size, body_template):
+        self.to = to
+        self.cc = cc
+        self.subject = subject
+        self.attachments = attachments
+        self.size = size
+        self.body_text = body_template.replace("{file_list}", "\n".join(os.path.splitext(os.path.basename(p))[0] for p in attachments))
+        html_text = self.body_text.replace('\n', '<br>')
+        self.body_html = f"<p style='font-family:calibri; font-size:11pt'>{html_text}</p>"
+
+
+def scan_attachments(pdf_dir):
+    """
+    Returns the (path, size) pairs of the PDFs in `pdf_dir`, sorted by path.
+    Sizes come from the directory listing itself, one `scandir` for the whole folder.
+    """
+    attachments = []
+    with os.scandir(pdf_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                attachments.append((entry.path, entry.stat().st_size))
+    attachments.sort()
+    return attachments
+
+
+def build_drafts(plan, to, cc, base_subject, first_body, follow_up_body):
+    """
+    Turns a plan into drafts: the first one carries `first_body`, the others
+    `follow_up_body`; with more than one draft subjects are numbered "[i/n]".
+
+    Returns:
+        list[EmailDraft]: One draft per chunk of the plan.
+    """
+    count = len(plan.chunks)
+    drafts = []
+    for i, (chunk, size) in enumerate(zip(plan.chunks, plan.chunk_sizes)):
+        subject = f"[{i+1}/{count}] {base_subject}" if count > 1 else base_subject
+        drafts.append(EmailDraft(to, cc, subject, chunk, size, first_body if i == 0 else follow_up_body))
+    return drafts
+
+
+def greedy_chunk_count(attachments, limit_bytes):
+    """
+    Counts the drafts produced by filling each email in the given order until the
+    next file no longer fits. Used as the baseline for `EmailPlan.saved_drafts`.
+    """
+    count = 0
+    current_size = 0
+    has_files = False
+    for _, size in attachments:
+        if has_files and current_size + size > limit_bytes:
+            count += 1
+            current_size = 0
+        current_size += size
+        has_files = True
+    return count + 1 if has_files else 0
+
+
+def group_key_for(path, group_by, odc_by_name=None):
+    """
+    Returns the grouping key of an attachment, or None when no grouping is requested.
+
+    ODC grouping uses `odc_by_name` (PDF file name -> ODC, recorded by the runs that
+    exported the PDFs); a PDF whose ODC is not known is a group of its own. Date
+    grouping uses the "(GG-MM-AAAA)" part of the file name.
+    """
+    if group_by == GROUP_BY_ODC:
+        odc = (odc_by_name or {}).get(os.path.basename(path))
+        return ("odc", odc) if odc else ("file", path)
+    if group_by == GROUP_BY_DATE:
+        match = DATE_IN_FILENAME_REGEX.search(os.path.basename(path))
+        return match.group(1) if match else ""
+    return None
+
+
+def _first_fit_decreasing(items, limit_bytes):
+    """
+    Packs (size, paths) items into bins of at most `limit_bytes`.
+    Items larger than the limit get a bin of their own.
+    """
+    bins = []
+    for size, paths in sorted(items, key=lambda item: item[0], reverse=True):
+        if size <= limit_bytes:
+            for b in bins:
+                if b[0] + size <= limit_bytes:
+                    b[0] += size
+                    b[1].extend(paths)
+                    break
+            else:
+                bins.append([size, list(paths)])
+        else:
+            # Oversized: no other item can ever fit next to it, so it gets a bin of its own.
+            bins.append([size, list(paths)])
+    return [(size, paths) for size, paths in bins]
+
+
+def plan_email_chunks(attachments, limit_bytes, group_by=GROUP_BY_NONE, odc_by_name=None):
+    """
+    Splits attachments into as few drafts as possible under a size limit using
+    first-fit-decreasing bin packing.
+
+    With `group_by` set, files sharing an ODC or a date are kept in the same draft
+    whenever the whole group fits in one; larger groups are packed on their own first.
+
+    Args:
+        attachments (list[tuple[str, int]]): (path, size in bytes) pairs.
+        limit_bytes (float): The maximum total attachment size of a single draft.
+        group_by (str, optional): GROUP_BY_ODC, GROUP_BY_DATE or None.
+        odc_by_name (dict, optional): PDF file name -> ODC, for GROUP_BY_ODC.
+
+    Returns:
+        EmailPlan: The planned drafts plus the baseline greedy draft count.
+    """
+    sizes = dict(attachments)
+    if group_by is None:
+        items = [(size, [path]) for path, size in attachments]
+    else:
+        groups = {}
+        for path, size in attachments:
+            groups.setdefault(group_key_for(path, group_by, odc_by_name), []).append((path, size))
+        items = []
+        for members in groups.values():
+            group_size = sum(size for _, size in members)
+            if group_size <= limit_bytes:
+                items.append((group_size, [path for path, _ in members]))
+            else:
+                # The group cannot travel in one email: split it tightly on its own.
+                items.extend(_first_fit_decreasing([(size, [path]) for path, size in members], limit_bytes))
+
+    chunks = [sorted(paths, key=lambda p: os.path.basename(p).lower()) for _, paths in _first_fit_decreasing(items, limit_bytes)]
+    chunks.sort(key=lambda chunk: os.path.basename(chunk[0]).lower())
+    chunk_sizes = [sum(sizes[p] for p in chunk) for chunk in chunks]
+    return EmailPlan(chunks, chunk_sizes, greedy_chunk_count(attachments, limit_bytes), sizes)
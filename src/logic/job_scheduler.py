@@ -0,0 +1,239 @@
+import itertools
+import os
+import threading
+import time
+import traceback
+from src.utils.sampling_profiler import SamplingProfiler
+
+JOB_QUEUED = "In coda"
+JOB_RUNNING = "In esecuzione"
+JOB_DONE = "Completato"
+JOB_FAILED = "Errore"
+JOB_CANCELLED = "Annullato"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_HIGH: "Alta", PRIORITY_NORMAL: "Normale", PRIORITY_LOW: "Bassa"}
+
+# Office applications are driven through COM: two jobs using the same one at once end
+# up competing for the same instance and the same open files.
+RESOURCE_EXCEL = "excel"
+RESOURCE_WORD = "word"
+RESOURCE_OUTLOOK = "outlook"
+FOLDER_RESOURCE_PREFIX = "cartella:"
+
+
+def folder_resource(path):
+    """The resource name locking a folder (and everything below it)."""
+    return FOLDER_RESOURCE_PREFIX + os.path.normcase(os.path.abspath(path)).rstrip("\\/")
+
+
+def _resources_conflict(a, b):
+    if a == b: return True
+    if a.startswith(FOLDER_RESOURCE_PREFIX) and b.startswith(FOLDER_RESOURCE_PREFIX):
+        # A folder lock also covers its subfolders, in both directions.
+        shorter, longer = sorted((a, b), key=len)
+        return longer.startswith(shorter + os.sep)
+    return False
+
+
+class Job:
+    """A unit of work run by the JobScheduler, with its own state and cancel event."""
+    def __init__(self, job_id, name, target, args, resources, priority, depends_on, cancel_event, on_skip):
+        self.id = job_id
+        self.name = name
+        self.target = target
+        self.args = args
+        self.resources = tuple(resources)
+        self.priority = priority
+        self.depends_on = tuple(depends_on)
+        self.cancel_event = cancel_event or threading.Event()
+        self.on_skip = on_skip
+        self.state = JOB_QUEUED
+        self.detail = ""
+        self.traceback = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.profile_dir = None
+        self.profile_paths = None
+
+    @property
+    def is_finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def elapsed(self):
+        if self.started_at is None: return None
+        return (self.finished_at or time.time()) - self.started_at
+
+
+class JobScheduler:
+    """
+    Runs the application's pipelines from one queue.
+
+    Each job declares the resources it needs (an Office application, folders it reads
+    or writes) and may depend on earlier jobs. A queued job starts as soon as its
+    dependencies are done and none of its resources is held by a running job; among
+    the ready ones, higher priority and then earlier submission go first. A job whose
+    dependency failed or was cancelled is cancelled without running.
+
+    Job targets are called as `target(cancel_event, *args)`, the signature every
+    processor already uses, on a daemon thread of their own. A target fails by
+    raising or by returning False, which processors do on every failure they have
+    already logged (invalid folders, Excel not available...). Listeners are
+    called with the changed job from whatever thread changed it.
+
+    `profile_next_job` arms the sampling profiler for the next job started by the user
+    (background jobs at PRIORITY_LOW are never picked); its files are listed in the
+    job's `profile_paths` once it finishes.
+    """
+    def __init__(self, max_running=3):
+        self.max_running = max_running
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._profile_dir = None
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _notify(self, job):
+        for callback in list(self._listeners):
+            try: callback(job)
+            except Exception: pass
+
+    def submit(self, name, target, args=(), resources=(), priority=PRIORITY_NORMAL, depends_on=(), cancel_event=None, on_skip=None):
+        """
+        Queues a job and starts it right away if it can run.
+
+        Args:
+            name (str): Shown in the job list.
+            target (callable): Called as target(cancel_event, *args).
+            args (tuple): Extra positional arguments for the target.
+            resources (iterable[str]): RESOURCE_* names or folder_resource() locks.
+            priority (int): PRIORITY_HIGH, PRIORITY_NORMAL or PRIORITY_LOW.
+            depends_on (iterable[Job]): Jobs that must complete first.
+            cancel_event (threading.Event, optional): Reuse the caller's event, so the
+                caller's own cancel button keeps working.
+            on_skip (callable, optional): Called if the job ends without ever running.
+
+        Returns:
+            Job: The queued job.
+        """
+        with self._lock:
+            if cancel_event is not None: cancel_event.clear()
+            job = Job(next(self._ids), name, target, args, resources, priority, [d.id for d in depends_on], cancel_event, on_skip)
+            self._jobs[job.id] = job
+        self._notify(job)
+        self._dispatch()
+        return job
+
+    def cancel(self, job):
+        """Cancels a job: a queued one is dropped, a running one is asked to stop."""
+        job.cancel_event.set()
+        with self._lock:
+            skipped = job.state == JOB_QUEUED
+            if skipped: self._finish(job, JOB_CANCELLED, "Annullato prima dell'avvio")
+        if skipped:
+            self._notify(job)
+            if job.on_skip: job.on_skip()
+        self._dispatch()
+
+    def cancel_all(self):
+        for job in self.jobs():
+            if not job.is_finished: self.cancel(job)
+
+    def jobs(self):
+        """Returns a snapshot of every job, oldest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.id)
+
+    def clear_finished(self):
+        """Forgets finished jobs that no queued job still depends on."""
+        with self._lock:
+            needed = {dep for job in self._jobs.values() if not job.is_finished for dep in job.depends_on}
+            for job_id in [j.id for j in self._jobs.values() if j.is_finished and j.id not in needed]:
+                del self._jobs[job_id]
+
+    def profile_next_job(self, output_dir):
+        """Profiles the next job above PRIORITY_LOW to start, writing into `output_dir`. None disarms."""
+        with self._lock:
+            self._profile_dir = output_dir
+
+    @property
+    def profiling_armed(self):
+        return self._profile_dir is not None
+
+    def is_busy(self, resource):
+        """True if a running job holds `resource` (or, for folders, an overlapping one)."""
+        with self._lock:
+            return any(_resources_conflict(resource, held) for job in self._jobs.values() if job.state == JOB_RUNNING for held in job.resources)
+
+    def has_waiting(self, resources, priority):
+        """True if a queued job of higher priority than `priority` needs any of `resources`."""
+        with self._lock:
+            return any(_resources_conflict(r, w) for job in self._jobs.values() if job.state == JOB_QUEUED and job.priority < priority
+                       for w in job.resources for r in resources)
+
+    def _finish(self, job, state, detail=""):
+        # Must be called with the lock held.
+        job.state = state
+        job.detail = detail
+        job.finished_at = time.time()
+
+    def _dispatch(self):
+        started, skipped = [], []
+        with self._lock:
+            running = [j for j in self._jobs.values() if j.state == JOB_RUNNING]
+            held = [r for j in running for r in j.resources]
+            queued = sorted((j for j in self._jobs.values() if j.state == JOB_QUEUED), key=lambda j: (j.priority, j.id))
+            for job in queued:
+                deps = [self._jobs.get(dep_id) for dep_id in job.depends_on]
+                failed = next((d for d in deps if d is not None and d.state in (JOB_FAILED, JOB_CANCELLED)), None)
+                if job.cancel_event.is_set() or failed is not None:
+                    self._finish(job, JOB_CANCELLED, f"Dipendenza non completata: {failed.name}" if failed else "Annullato prima dell'avvio")
+                    skipped.append(job)
+                    continue
+                if any(d is not None and d.state != JOB_DONE for d in deps): continue
+                if len(running) >= self.max_running: continue
+                if any(_resources_conflict(r, h) for r in job.resources for h in held): continue
+                job.state = JOB_RUNNING
+                job.started_at = time.time()
+                if self._profile_dir is not None and job.priority < PRIORITY_LOW:
+                    job.profile_dir, self._profile_dir = self._profile_dir, None
+                running.append(job)
+                held.extend(job.resources)
+                started.append(job)
+        for job in skipped:
+            self._notify(job)
+            if job.on_skip: job.on_skip()
+        for job in started:
+            self._notify(job)
+            threading.Thread(target=self._run, args=(job,), name=f"job-{job.id} {job.name}", daemon=True).start()
+        if skipped:
+            # Cancelling a job may have settled the fate of jobs depending on it.
+            self._dispatch()
+
+    def _run(self, job):
+        profiler = SamplingProfiler() if job.profile_dir else None
+        if profiler: profiler.start()
+        try:
+            result = job.target(job.cancel_event, *job.args)
+            if job.cancel_event.is_set(): state, detail = JOB_CANCELLED, "Annullato durante l'esecuzione"
+            elif result is False: state, detail = JOB_FAILED, "Terminato senza completare (vedere il log)"
+            else: state, detail = JOB_DONE, ""
+        except Exception as e:
+            state, detail = JOB_FAILED, f"{type(e).__name__}: {e}"
+            job.traceback = traceback.format_exc()
+        if profiler:
+            profiler.stop()
+            try: job.profile_paths = profiler.write(job.profile_dir, job.name)
+            except OSError as e: detail = (detail + "; " if detail else "") + f"Profilo non salvato: {e}"
+        with self._lock:
+            self._finish(job, state, detail)
+        self._notify(job)
+        self._dispatch()
@@ -0,0 +1,260 @@
+import os
+import shutil
+import traceback
+from src.utils import constants as const
+from src.utils.excel_handler import ExcelHandler
+from src.utils.file_utils import clear_folder_content, backup_folder, restore_folder_backup, UniqueNameRegistry
+from src.utils.file_cache import get_shared_cache, derived_files_moved
+from src.utils.pdf_merge import merge_pdfs_streaming, PdfMergeError
+from src.utils.stamp_cache import StampImageCache
+from src.utils.metrics_store import get_metrics_store, run_status
+from src.utils.file_inventory import ErrorLog, FileInventory
+from src.logic.template_registry import get_template_registry
+from src.logic.renaming import build_dated_filename
+from src.logic.workbook_metadata import get_metadata_extractor
+from src.logic.organization import odc_folder_name
+from src.logic.signature import export_signed_sheet, presigned_pdf_cache, presigned_suffix
+from src.logic.pdf_compression import choose_profile, compress_pdfs, merge_pdfs
+
+
+class WorkbookRecord:
+    """What the single pass learned about one workbook."""
+    __slots__ = ("path", "model", "date", "odc_folder", "pdf_path")
+
+    def __init__(self, path, model, date, odc_folder, pdf_path):
+        self.path = path
+        self.model = model
+        self.date = date
+        self.odc_folder = odc_folder
+        self.pdf_path = pdf_path
+
+
+class MonthEndProcessor:
+    """
+    Runs the month-end routine on the month folder in one pass over the workbooks.
+
+    Each workbook is opened at most once: its metadata comes from the shared
+    extractor and, for models with a signature template, the stamp is applied and
+    the PDF exported in the same open. Unsigned runs skip Excel for workbooks whose
+    metadata is already cached. Renaming, placement by ODC, compression, the merged
+    PDF of each ODC and the email drafts are then derived from those records without
+    opening Excel again.
+    """
+    def __init__(self, gui, app_config, setup_progress_cb, update_progress_cb, hide_progress_cb):
+        self.gui = gui
+        self.app_config = app_config
+        self.logger = gui.log_fine_mese
+        self.setup_progress = setup_progress_cb
+        self.update_progress = update_progress_cb
+        self.hide_progress = hide_progress_cb
+        self.file_cache = get_shared_cache()
+        self.templates = get_template_registry()
+        self.metadata = get_metadata_extractor()
+        self.presigned_cache = presigned_pdf_cache()
+        self.metrics = get_metrics_store()
+        self.run_metrics = None
+
+    def run_month_end_process(self, cancel_event):
+        """
+        Runs the routine. Like the organizer, the destination folder (and the PDF output
+        folder, when signing) is backed up and cleared first, and restored if the
+        routine does not complete.
+
+        Returns:
+            bool: False if the routine did not complete, so the scheduler skips the jobs
+            depending on it (such as printing the organized folders).
+        """
+        self.logger("Avvio della routine di fine mese (passaggio unico)...", "HEADER")
+        self.run_metrics = run = self.metrics.start("fine mese")
+        dest_dir = self.app_config.organizza_dest_dir.get()
+        pdf_dir = self.app_config.firma_pdf_dir.get()
+        backup_dir = pdf_backup_dir = ""
+        completed = False
+        try:
+            source_dir = self.app_config.organizza_source_dir.get()
+            if not os.path.isdir(source_dir):
+                self.logger(f"ERRORE: Cartella di origine non trovata: {source_dir}", "ERROR"); return False
+            excel_files = FileInventory.scan(source_dir, cancel_event=cancel_event)
+            if not excel_files: self.logger("Nessun file Excel trovato.", "WARNING"); return False
+            self.logger(f"Trovati {len(excel_files)} file Excel in: {source_dir}", "INFO")
+
+            image_path = self.app_config.firma_image_path.get()
+            sign = os.path.isfile(image_path)
+            try:
+                with run.phase("Backup"):
+                    backup_dir = backup_folder(dest_dir, self.logger)
+                    if sign: pdf_backup_dir = backup_folder(pdf_dir, self.logger)
+            except Exception as e:
+                self.logger(f"ERRORE CRITICO durante la creazione del backup: {e}", "ERROR")
+                self.logger("La routine di fine mese è stata interrotta per prevenire la perdita di dati.", "ERROR")
+                return False
+            clear_folder_content(dest_dir, self.logger, folder_display_name=const.ORGANIZZA_DEST_DIR)
+            os.makedirs(dest_dir, exist_ok=True)
+            if sign:
+                clear_folder_content(pdf_dir, self.logger, folder_display_name=const.FIRMA_PDF_OUTPUT_DIR)
+                os.makedirs(pdf_dir, exist_ok=True)
+            else:
+                self.logger(f"ATTENZIONE: Immagine firma non trovata, le schede non verranno firmate: {image_path}", "WARNING")
+
+            self.logger("--- FASE 1: Lettura, firma ed esportazione (un'apertura per file) ---", "HEADER")
+            with run.phase("Lettura e firma"):
+                records = self._read_and_sign(excel_files, pdf_dir if sign else None, image_path, cancel_event)
+            if records is None or cancel_event.is_set(): return False
+
+            for label, stage in [("Rinomina", lambda: self._rename(records)),
+                                 ("Organizzazione per ODC", lambda: self._place_by_odc(records, dest_dir)),
+                                 ("Compressione PDF", lambda: self._compress(records)),
+                                 ("PDF unici per ODC", lambda: self._build_bundles(records, dest_dir))]:
+                if cancel_event.is_set(): return False
+                self.logger(f"--- FASE: {label} ---", "HEADER")
+                with run.phase(label): stage()
+
+            completed = True
+            if any(r.pdf_path for r in records):
+                self.app_config.signature_tab.processor.pdf_odcs = {os.path.basename(r.pdf_path): r.odc_folder for r in records if r.pdf_path}
+                self.logger("Bozze email preparate nella scheda 'Apponi Firma'.", "INFO")
+                self.gui.after(0, lambda: self.app_config.signature_tab.prepare_email_drafts(reuse_template=True))
+            self.gui.after(0, self.app_config.organize_tab.populate_stampa_list)
+            self.logger("--- ROUTINE DI FINE MESE COMPLETATA ---", "SUCCESS")
+        except Exception as e:
+            self.logger(f"ERRORE CRITICO: {e}", "ERROR"); self.logger(traceback.format_exc(), "ERROR")
+            raise
+        finally:
+            for folder, backup in ((dest_dir, backup_dir), (pdf_dir, pdf_backup_dir)):
+                if completed:
+                    if backup: shutil.rmtree(backup)
+                else:
+                    restore_folder_backup(folder, backup, self.logger)
+            if run.phases:
+                self.logger("Tempi: " + ", ".join(f"{label} {seconds:.1f} s" for label, seconds in run.phases), "INFO")
+            # As in the organizer, every run that did not complete is recorded as failed (or cancelled).
+            self.metrics.finish(run, run_status(cancel_event, not completed))
+            if cancel_event.is_set(): self.logger("Routine di fine mese annullata.", "WARNING")
+            self.gui.after(0, self.hide_progress)
+            self.gui.after(0, self.gui.on_process_finished)
+        return completed
+
+    def _read_and_sign(self, excel_files, pdf_dir, image_path, cancel_event):
+        """Opens every workbook once. Returns the records, or None if Excel is not available."""
+        self.gui.after(0, self.setup_progress, len(excel_files))
+        stamp_cache = StampImageCache(image_path)
+        suffix = presigned_suffix(image_path) if pdf_dir else None
+        records = []
+        try:
+            with ExcelHandler(self.logger) as excel:
+                if not excel: return None
+                for i in range(len(excel_files)):
+                    if cancel_event.is_set(): return records
+                    path = excel_files.path(i)
+                    self.gui.after(0, self.update_progress, i + 1)
+                    wb = None
+                    try:
+                        metadata = self.metadata.cached(path)
+                        pdf_path = None
+                        template = self.templates.get(metadata.model) if metadata else None
+                        # Workbooks signed in the background only need their PDF copied.
+                        presigned = self.presigned_cache.lookup(path, suffix) if template and suffix else None
+                        if metadata is None or (pdf_dir and template and not presigned):
+                            read_path = self.file_cache.resolve(path)
+                            with_password = False
+                            try: wb = excel.Workbooks.Open(read_path, ReadOnly=True)
+                            except Exception:
+                                wb = excel.Workbooks.Open(read_path, ReadOnly=True, Password=self.app_config.rinomina_password.get())
+                                with_password = True
+                            metadata = metadata or self.metadata.read(wb, path, with_password)
+                        template = self.templates.get(metadata.model)
+                        if pdf_dir and template:
+                            file_name = build_dated_filename(os.path.basename(path), metadata.date) if metadata.date else os.path.basename(path)
+                            pdf_path = os.path.join(pdf_dir, f"{os.path.splitext(file_name)[0]}.pdf")
+                            if presigned: shutil.copyfile(presigned, pdf_path)
+                            elif not export_signed_sheet(wb, template, stamp_cache, pdf_path):
+                                self.logger(f"Foglio '{template.sheet_name}' non trovato in {os.path.basename(path)}.", "WARNING"); pdf_path = None
+                        records.append(WorkbookRecord(path, metadata.model, metadata.date, odc_folder_name(metadata.odc), pdf_path))
+                        self.run_metrics.add_file(read=excel_files.size(i), written=os.path.getsize(pdf_path) if pdf_path else 0)
+                    except Exception as e:
+                        self.run_metrics.add_error()
+                        self.logger(f"ERRORE lettura {os.path.basename(path)}: {e}", "ERROR")
+                    finally:
+                        if wb: wb.Close(SaveChanges=False)
+        finally:
+            stamp_cache.close()
+        signed = sum(1 for r in records if r.pdf_path)
+        self.logger(f"Letti {len(records)} file, {signed} firmati ed esportati in PDF.", "SUCCESS")
+        return records
+
+    def _rename(self, records):
+        registry = UniqueNameRegistry()
+        renamed = 0
+        for record in records:
+            if not record.date:
+                self.logger(f"  -> Data non trovata: {os.path.basename(record.path)}", "WARNING"); continue
+            directory, file_name = os.path.split(record.path)
+            new_name = build_dated_filename(file_name, record.date)
+            if new_name.lower() == file_name.lower(): continue
+            final_path = registry.reserve(os.path.join(directory, new_name))
+            try:
+                os.rename(record.path, final_path)
+            except OSError as e:
+                registry.release(final_path)
+                self.run_metrics.add_error()
+                self.logger(f"ERRORE rinomina {file_name}: {e}", "ERROR"); continue
+            registry.release(record.path)
+            self.metadata.moved(record.path, final_path)
+            derived_files_moved(record.path, final_path)
+            record.path = final_path
+            renamed += 1
+        self.logger(f"File rinominati: {renamed}.", "SUCCESS")
+
+    def _place_by_odc(self, records, dest_dir):
+        copied = 0
+        with ErrorLog("fine mese") as errors:
+            for record in records:
+                try:
+                    folder = os.path.join(dest_dir, record.odc_folder)
+                    os.makedirs(folder, exist_ok=True)
+                    shutil.copy2(self.file_cache.resolve(record.path), os.path.join(folder, os.path.basename(record.path)))
+                    copied += 1
+                except Exception as e:
+                    errors.add(os.path.basename(record.path), f"Dettagli: {e}")
+                    self.run_metrics.add_error()
+            self.logger(f"{copied} file copiati in {len({r.odc_folder for r in records})} cartelle ODC.", "SUCCESS" if not errors else "WARNING")
+            if errors:
+                self.logger(f"File non copiati: {len(errors)}.", "ERROR")
+                errors.log_summary(self.logger)
+
+    def _compress(self, records):
+        gs_exe = self.app_config.firma_ghostscript_path.get()
+        pdfs = [r.pdf_path for r in records if r.pdf_path and os.path.isfile(r.pdf_path)]
+        if not pdfs: return
+        if not gs_exe or not os.path.isfile(gs_exe):
+            self.logger("Ghostscript non trovato: PDF non compressi.", "WARNING"); return
+        try: email_limit_bytes = float(self.app_config.email_size_limit.get()) * 1024 * 1024
+        except (ValueError, TypeError): email_limit_bytes = None
+        mode = self.app_config.firma_compression_mode.get()
+        jobs = [(p, choose_profile(os.path.getsize(p), mode, email_limit_bytes)) for p in pdfs]
+        results, processes = compress_pdfs(gs_exe, jobs, self.app_config.firma_gs_batch.get())
+        errors = [r for r in results if r.error]
+        self.run_metrics.add_error(len(errors))
+        for r in errors: self.logger(f"ERRORE compressione {r.file_name}: {r.error}", "ERROR")
+        saved = sum(r.input_size - r.output_size for r in results)
+        self.logger(f"Compressi {len(results) - len(errors)} PDF con {processes} processi Ghostscript (-{saved / 1024:.0f} KB).", "SUCCESS")
+
+    def _build_bundles(self, records, dest_dir):
+        by_odc = {}
+        for record in records:
+            if record.pdf_path and os.path.isfile(record.pdf_path):
+                by_odc.setdefault(record.odc_folder, []).append(record.pdf_path)
+        gs_exe = self.app_config.firma_ghostscript_path.get()
+        for folder_name, pdfs in sorted(by_odc.items()):
+            output = os.path.join(dest_dir, folder_name, f"{folder_name}.pdf")
+            try:
+                try:
+                    merge_pdfs_streaming(sorted(pdfs, key=lambda p: os.path.basename(p).lower()), output)
+                except PdfMergeError:
+                    if not gs_exe or not os.path.isfile(gs_exe): raise
+                    merge_pdfs(gs_exe, sorted(pdfs, key=lambda p: os.path.basename(p).lower()), output)
+                self.run_metrics.add_bytes(written=os.path.getsize(output))
+                self.logger(f"  -> {folder_name}.pdf creato ({len(pdfs)} schede).", "SUCCESS")
+            except Exception as e:
+                self.run_metrics.add_error()
+                self.logger(f"ERRORE creazione {folder_name}.pdf: {e}", "ERROR")
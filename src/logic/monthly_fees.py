@@ -1,17 +1,24 @@
 import os
-import re
+import time
 import win32print
 import traceback
 from datetime import datetime
 from src.utils import constants as const
 from src.utils.excel_handler import ExcelHandler
 from src.utils.word_handler import WordHandler
+from src.logic.consuntivo_index import ConsuntivoIndex
+from src.utils.text_match import KeywordMatcher, normalize_for_match
+from src.utils.file_cache import get_shared_cache
+from src.utils.metrics_store import get_metrics_store, run_status
 
 class MonthlyFeesProcessor:
     def __init__(self, gui, app_config):
         self.gui = gui
         self.app_config = app_config
         self.logger = gui.log_canoni
+        self._consuntivo_indexes = {}
+        self.file_cache = get_shared_cache()
+        self.metrics = get_metrics_store()
 
     def get_printers(self):
         try:
@@ -30,91 +37,208 @@ class MonthlyFeesProcessor:
         file_name = f"Giornaliera {month_number}-{year}.xlsm"
         return os.path.join(const.CANONI_GIORNALIERA_BASE_DIR, year_folder_name, file_name)
 
+    def get_consuntivo_index(self, year):
+        """Returns the cached index of the CONSUNTIVI folder of `year`, creating it once per year."""
+        index = self._consuntivo_indexes.get(year)
+        if index is None:
+            index = ConsuntivoIndex(os.path.join(const.CANONI_CONSUNTIVI_BASE_DIR, year, "CONSUNTIVI", year))
+            self._consuntivo_indexes[year] = index
+        return index
+
     def get_consuntivo_path(self, year, consuntivo_num):
         if not year: return "Anno non selezionato"
         if not consuntivo_num.strip().isdigit(): return "Inserire un numero valido"
-        cons_dir = os.path.join(const.CANONI_CONSUNTIVI_BASE_DIR, year, "CONSUNTIVI", year)
-        if not os.path.isdir(cons_dir): return f"ERRORE: Cartella non trovata"
+        index = self.get_consuntivo_index(year)
         try:
-            for filename in os.listdir(cons_dir):
-                if filename.startswith(f"{consuntivo_num}-") or filename.startswith(f"{consuntivo_num} "):
-                    return os.path.join(cons_dir, filename)
-            return f"File non trovato per il n° {consuntivo_num}"
+            path = index.path_for_number(consuntivo_num)
+            return path if path else f"File non trovato per il n° {consuntivo_num}"
+        except FileNotFoundError:
+            return f"ERRORE: Cartella non trovata"
         except Exception as e:
             self.logger(f"Errore ricerca consuntivo n°{consuntivo_num}: {e}", "ERROR")
             return "Errore ricerca file"
 
     def find_consuntivo_for_tcl(self, year, month_name, tcl_name, cancel_event):
         if not year or not month_name: return None, "Periodo non selezionato"
-        cons_dir = os.path.join(const.CANONI_CONSUNTIVI_BASE_DIR, year, "CONSUNTIVI", year)
-        if not os.path.isdir(cons_dir): return None, f"Cartella non trovata: {cons_dir}"
+        index = self.get_consuntivo_index(year)
+        if cancel_event.is_set(): return None, "Annullato"
         try:
-            files_in_dir = os.listdir(cons_dir)
-            month_norm = month_name.upper()
-            tcl_norm = tcl_name.upper()
-            for filename in files_in_dir:
-                if cancel_event.is_set(): return None, "Annullato"
-                filename_norm = filename.upper()
-                if all(keyword in filename_norm for keyword in ["CANONE", month_norm, tcl_norm]):
-                    match = re.match(r'^(\d+)', filename)
-                    if match:
-                        number = match.group(1)
-                        self.logger(f"Trovato file '{filename}' per {tcl_name}, numero: {number}", "SUCCESS")
-                        return number, os.path.join(cons_dir, filename)
+            number, path = index.find_for_tcl(month_name, tcl_name)
+            if number:
+                self.logger(f"Trovato file '{os.path.basename(path)}' per {tcl_name}, numero: {number}", "SUCCESS")
+                return number, path
             self.logger(f"Nessun file consuntivo trovato per {tcl_name} nel periodo {month_name} {year}", "WARNING")
             return None, "File non trovato"
+        except FileNotFoundError:
+            return None, f"Cartella non trovata: {index.directory}"
         except Exception as e:
             self.logger(f"Errore durante la ricerca del file per {tcl_name}: {e}", "ERROR")
             return None, "Errore di sistema"
 
-    def run_printing_process(self, cancel_event, paths_to_print, printer_name, macro_name):
+    def find_consuntivi_for_tcls(self, year, month_name, tcl_names, cancel_event):
+        """
+        Finds the monthly canone file of every TCL in a single pass over the folder.
+
+        Each file name is scanned once with a multi-keyword matcher for "CANONE", the
+        month and all TCL names together; the first numbered file matching a TCL wins.
+
+        Returns:
+            dict: TCL name -> (number, path) for every TCL that was found.
+        """
+        if not year or not month_name or not tcl_names: return {}
+        index = self.get_consuntivo_index(year)
+        month_key = normalize_for_match(month_name)
+        tcl_keys = {normalize_for_match(tcl): tcl for tcl in tcl_names}
+        matcher = KeywordMatcher(["CANONE", month_key] + list(tcl_keys))
+        results = {}
+        try:
+            for number, filename, _ in index.entries():
+                if cancel_event.is_set(): return results
+                if not number: continue
+                found = matcher.find_all(filename)
+                if "CANONE" not in found or month_key not in found: continue
+                for tcl_key in found:
+                    tcl = tcl_keys.get(tcl_key)
+                    if tcl and tcl not in results:
+                        results[tcl] = (number, os.path.join(index.directory, filename))
+                        self.logger(f"Trovato file '{filename}' per {tcl}, numero: {number}", "SUCCESS")
+                if len(results) == len(tcl_keys): break
+        except FileNotFoundError:
+            self.logger(f"Cartella non trovata: {index.directory}", "ERROR")
+            return results
+        except Exception as e:
+            self.logger(f"Errore durante la ricerca dei file consuntivo: {e}", "ERROR")
+            return results
+        for tcl in tcl_names:
+            if tcl not in results:
+                self.logger(f"Nessun file consuntivo trovato per {tcl} nel periodo {month_name} {year}", "WARNING")
+        return results
+
+    def run_printing_process(self, cancel_event, paths_to_print, printer_name, macro_name, use_prefetch=False):
         self.logger("Avvio del processo di stampa canoni...", "HEADER")
+        run = self.metrics.start("stampa canoni")
+        failed = False
         try:
-            if not self._validate_paths(paths_to_print, printer_name, macro_name): return
+            if not self._validate_paths(paths_to_print, printer_name, macro_name):
+                failed = True
+                return False
+            if cancel_event.is_set(): return
+            documents = [paths_to_print["giornaliera"], *paths_to_print["consuntivi"], paths_to_print["word"]]
+            for path in documents: run.add_file(read=os.path.getsize(path))
+            run.extra["consuntivi"] = len(paths_to_print["consuntivi"])
+            run.extra["prefetch"] = bool(use_prefetch)
+
+            if use_prefetch:
+                printed = self._run_pipelined_printing(cancel_event, paths_to_print, printer_name, macro_name)
+            else:
+                printed = self._run_sequential_printing(cancel_event, paths_to_print, printer_name, macro_name)
+            if printed is False:
+                failed = True
+                return False
+
+            if not cancel_event.is_set():
+                self.logger("--- PROCESSO STAMPA CANONI COMPLETATO ---", 'SUCCESS')
+        except Exception as e:
+            failed = True
+            self.logger(f"ERRORE CRITICO nel processo: {e}", "ERROR")
+            self.logger(traceback.format_exc(), "ERROR")
+            raise
+        finally:
+            if failed: run.add_error()
+            self.metrics.finish(run, run_status(cancel_event, failed))
+            if cancel_event.is_set(): self.logger("Processo di stampa annullato.", "WARNING")
+            self.gui.after(0, self.gui.on_process_finished)
+
+    def _run_sequential_printing(self, cancel_event, paths_to_print, printer_name, macro_name):
+        with ExcelHandler(self.logger) as excel_app, WordHandler(self.logger) as word_app:
+            if not excel_app or not word_app: return False
             if cancel_event.is_set(): return
 
-            with ExcelHandler(self.logger) as excel_app, WordHandler(self.logger) as word_app:
-                if not excel_app or not word_app: return
-                if cancel_event.is_set(): return
+            word_app.ActivePrinter = printer_name
+            self.logger(f"Stampante attiva impostata su: '{printer_name}'", "SUCCESS")
+
+            giornaliera_path = paths_to_print["giornaliera"]
+            cons_paths = paths_to_print["consuntivi"]
+            word_path = paths_to_print["word"]
+
+            wb_giornaliera = excel_app.Workbooks.Open(giornaliera_path)
+            wb_cons_list = [excel_app.Workbooks.Open(p) for p in cons_paths]
+            doc_word = word_app.Documents.Open(word_path)
+            self.logger("Documenti aperti.", 'INFO')
+
+            for i, cons_wb in enumerate(wb_cons_list):
+                if cancel_event.is_set(): break
 
-                word_app.ActivePrinter = printer_name
-                self.logger(f"Stampante attiva impostata su: '{printer_name}'", "SUCCESS")
+                leaf_name = cons_wb.Name
+                self.logger(f"Esecuzione macro '{macro_name}' su {leaf_name}...", 'INFO')
+                excel_app.Run(f"'{leaf_name}'!{macro_name}")
+                self.logger(f"Macro su Consuntivo {i+1} completata.", 'SUCCESS')
 
-                giornaliera_path = paths_to_print["giornaliera"]
-                cons_paths = paths_to_print["consuntivi"]
-                word_path = paths_to_print["word"]
+                if i < len(wb_cons_list) - 1:
+                    if cancel_event.is_set(): break
+                    self.logger(f"Stampa file Word: {doc_word.Name}...", 'INFO')
+                    doc_word.PrintOut()
+                    self.logger("Comando di stampa Word inviato.", 'SUCCESS')
+
+            doc_word.Close(SaveChanges=0)
+            for wb in wb_cons_list: wb.Close(SaveChanges=False)
+            wb_giornaliera.Close(SaveChanges=False)
+
+    def _run_pipelined_printing(self, cancel_event, paths_to_print, printer_name, macro_name):
+        """
+        Same job as `_run_sequential_printing`, but every network file is first copied
+        concurrently into the local cache, and each document is opened from local disk
+        only when it is needed, so the first macro runs while later copies still arrive.
+        """
+        started = time.perf_counter()
+        giornaliera_path = paths_to_print["giornaliera"]
+        cons_paths = paths_to_print["consuntivi"]
+        word_path = paths_to_print["word"]
+        self.logger("Copia locale dei file in corso (prefetch)...", "INFO")
+        futures = self.file_cache.prefetch([giornaliera_path] + cons_paths + [word_path])
+
+        def local(path):
+            try:
+                return futures[path].result()
+            except OSError as e:
+                self.logger(f"Copia locale non riuscita per '{os.path.basename(path)}', uso il file di rete. Dettagli: {e}", "WARNING")
+                return path
+
+        with ExcelHandler(self.logger) as excel_app, WordHandler(self.logger) as word_app:
+            if not excel_app or not word_app: return False
+            if cancel_event.is_set(): return
 
-                wb_giornaliera = excel_app.Workbooks.Open(giornaliera_path)
-                wb_cons_list = [excel_app.Workbooks.Open(p) for p in cons_paths]
-                doc_word = word_app.Documents.Open(word_path)
-                self.logger("Documenti aperti.", 'INFO')
+            word_app.ActivePrinter = printer_name
+            self.logger(f"Stampante attiva impostata su: '{printer_name}'", "SUCCESS")
 
-                for i, cons_wb in enumerate(wb_cons_list):
+            opened_workbooks = []
+            doc_word = None
+            first_print_at = None
+            try:
+                opened_workbooks.append(excel_app.Workbooks.Open(local(giornaliera_path)))
+                for i, cons_path in enumerate(cons_paths):
                     if cancel_event.is_set(): break
+                    cons_wb = excel_app.Workbooks.Open(local(cons_path))
+                    opened_workbooks.append(cons_wb)
 
                     leaf_name = cons_wb.Name
                     self.logger(f"Esecuzione macro '{macro_name}' su {leaf_name}...", 'INFO')
                     excel_app.Run(f"'{leaf_name}'!{macro_name}")
+                    if first_print_at is None: first_print_at = time.perf_counter()
                     self.logger(f"Macro su Consuntivo {i+1} completata.", 'SUCCESS')
 
-                    if i < len(wb_cons_list) - 1:
+                    if i < len(cons_paths) - 1:
                         if cancel_event.is_set(): break
+                        if doc_word is None: doc_word = word_app.Documents.Open(local(word_path))
                         self.logger(f"Stampa file Word: {doc_word.Name}...", 'INFO')
                         doc_word.PrintOut()
                         self.logger("Comando di stampa Word inviato.", 'SUCCESS')
+            finally:
+                if doc_word is not None: doc_word.Close(SaveChanges=0)
+                for wb in reversed(opened_workbooks): wb.Close(SaveChanges=False)
 
-                doc_word.Close(SaveChanges=0)
-                for wb in wb_cons_list: wb.Close(SaveChanges=False)
-                wb_giornaliera.Close(SaveChanges=False)
-
-            if not cancel_event.is_set():
-                self.logger("--- PROCESSO STAMPA CANONI COMPLETATO ---", 'SUCCESS')
-        except Exception as e:
-            self.logger(f"ERRORE CRITICO nel processo: {e}", "ERROR")
-            self.logger(traceback.format_exc(), "ERROR")
-        finally:
-            if cancel_event.is_set(): self.logger("Processo di stampa annullato.", "WARNING")
-            self.gui.after(0, self.gui.on_process_finished)
+        if first_print_at is not None:
+            self.logger(f"Tempo alla prima stampa: {first_print_at - started:.1f} s - tempo totale: {time.perf_counter() - started:.1f} s.", "INFO")
 
     def _validate_paths(self, paths, printer, macro):
         all_paths = {"File Giornaliera": paths["giornaliera"], "File Foglio Canone": paths["word"]}
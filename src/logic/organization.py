@@ -1,11 +1,30 @@
 import os
 import re
 import shutil
+import tempfile
 import traceback
 import time
+from concurrent.futures import ThreadPoolExecutor
 from src.utils import constants as const
 from src.utils.excel_handler import ExcelHandler
-from src.utils.file_utils import clear_folder_content
+from src.utils.file_utils import clear_folder_content, backup_folder, restore_folder_backup
+from src.utils.file_cache import get_shared_cache, get_derived_cache
+from src.utils.pdf_merge import merge_pdfs_streaming, PdfMergeError
+from src.utils.metrics_store import get_metrics_store, run_status
+from src.utils.file_inventory import ErrorLog, FileInventory
+from src.logic.pdf_compression import merge_pdfs, compress_pdf, count_pdf_pages, PROFILE_STANDARD
+from src.logic.template_registry import get_template_registry
+from src.logic.workbook_metadata import get_metadata_extractor, normalize_odc
+from src.logic.print_backends import GhostscriptPrinterBackend, FilePrinterBackend
+
+NO_ODC_FOLDER_NAME = "Schede senza ODC"
+
+
+def odc_folder_name(odc_value):
+    """Returns the destination folder of a workbook from the value of its ODC cell."""
+    odc_s = normalize_odc(odc_value)
+    return re.sub(r'[\\/:*?"<>|]', '', odc_s) if odc_s else NO_ODC_FOLDER_NAME
+
 
 class OrganizationProcessor:
     def __init__(self, gui, app_config, fees_processor, setup_progress_cb, update_progress_cb, hide_progress_cb):
@@ -16,35 +35,34 @@ class OrganizationProcessor:
         self.setup_progress = setup_progress_cb
         self.update_progress = update_progress_cb
         self.hide_progress = hide_progress_cb
-        self.stampa_processing_data = {
-            "schedacontrolloSTRUMENTIANALOGICI": {"PrintArea": "A2:N55"},
-            "schedacontrolloSTRUMENTIDIGITALI": {"PrintArea": "A2:N50"},
-            "SchedacontrolloREPORTMANUTENZIONECORRETTIVA": {"PrintArea": "A2:N55"},
-            "SCHEDAMANUTENZIONE": {"PrintArea": "A1:FV106"}
-        }
+        self.file_cache = get_shared_cache()
+        self.pdf_cache = get_derived_cache(const.PDF_RENDER_CACHE_DIR)
+        self.templates = get_template_registry()
+        self.metadata = get_metadata_extractor()
+        self.metrics = get_metrics_store()
+        self.run_metrics = None
+        # Batched printing waits while the printer queue holds more than this many jobs.
+        self.max_queued_print_jobs = 3
 
     def run_organization_process(self, cancel_event):
         self.logger("Avvio del processo di organizzazione...", "HEADER")
         dest_dir = self.app_config.organizza_dest_dir.get()
         backup_dir = ""
         operation_successful = False
+        self.run_metrics = self.metrics.start("organizza")
         try:
             try:
-                if os.path.isdir(dest_dir) and os.listdir(dest_dir):
-                    timestamp = time.strftime("%Y%m%d-%H%M%S")
-                    backup_dir = f"{dest_dir}_backup_{timestamp}"
-                    self.logger(f"Creazione backup: {os.path.basename(backup_dir)}", "INFO")
-                    shutil.copytree(dest_dir, backup_dir)
+                with self.run_metrics.phase("Backup"): backup_dir = backup_folder(dest_dir, self.logger)
             except Exception as e:
                 self.logger(f"ERRORE CRITICO durante la creazione del backup: {e}", "ERROR")
                 self.logger("L'operazione di organizzazione è stata interrotta per prevenire la perdita di dati.", "ERROR")
-                return # Abort the entire operation if backup fails
+                return False # Abort the entire operation if backup fails
 
             clear_folder_content(dest_dir, self.logger, folder_display_name=const.ORGANIZZA_DEST_DIR)
             os.makedirs(dest_dir, exist_ok=True)
             if cancel_event.is_set(): return
 
-            self._organize_files(cancel_event)
+            if self._organize_files(cancel_event) is False: return False
 
             if not cancel_event.is_set():
                 operation_successful = True
@@ -53,77 +71,156 @@ class OrganizationProcessor:
         except Exception as e:
             self.logger(f"ERRORE CRITICO: {e}", "ERROR"); self.logger(traceback.format_exc(), "ERROR")
             operation_successful = False
+            raise
         finally:
             if operation_successful:
                 if backup_dir: shutil.rmtree(backup_dir)
             else:
-                self.logger("ANNULLAMENTO/ERRORE: Ripristino cartella dal backup.", "WARNING")
-                if backup_dir and os.path.isdir(backup_dir):
-                    clear_folder_content(dest_dir, self.logger)
-                    shutil.rmtree(dest_dir)
-                    os.rename(backup_dir, dest_dir)
-                    self.logger("Ripristino completato.", "SUCCESS")
+                restore_folder_backup(dest_dir, backup_dir, self.logger)
 
+            self.metrics.finish(self.run_metrics, run_status(cancel_event, not operation_successful))
             if cancel_event.is_set(): self.logger("Processo annullato.", "WARNING")
             self.gui.after(0, self.hide_progress)
             self.gui.after(0, self.gui.on_process_finished)
 
-    def run_printing_process(self, cancel_event, folders_to_print):
+    def run_printing_process(self, cancel_event, folders_to_print, batched=False):
         if not folders_to_print:
             self.logger("Nessuna cartella selezionata.", "WARNING")
             self.gui.after(0, self.gui.on_process_finished)
             return
+        self.run_metrics = self.metrics.start("stampa unita" if batched else "stampa")
+        failed = False
         try:
             self.logger(f"--- Avvio Stampa per {len(folders_to_print)} cartelle ---", "HEADER")
-            self._print_files_in_folders(cancel_event, folders_to_print)
+            printed = self._print_folders_batched(cancel_event, folders_to_print) if batched else self._print_files_in_folders(cancel_event, folders_to_print)
+            if printed is False:
+                failed = True
+                return False
             if not cancel_event.is_set(): self.logger("--- Stampa Completata ---", "SUCCESS")
         except Exception as e:
+            failed = True
             self.logger(f"ERRORE CRITICO: {e}", "ERROR"); self.logger(traceback.format_exc(), "ERROR")
+            raise
         finally:
+            self.metrics.finish(self.run_metrics, run_status(cancel_event, failed))
             if cancel_event.is_set(): self.logger("Processo di stampa annullato.", "WARNING")
             self.gui.after(0, self.hide_progress)
             self.gui.after(0, self.gui.on_process_finished)
 
     def _organize_files(self, cancel_event):
         source_dir = self.app_config.organizza_source_dir.get(); dest_dir = self.app_config.organizza_dest_dir.get()
-        if not os.path.isdir(source_dir): self.logger(f"ERRORE: Cartella di origine non trovata.", "ERROR"); return
+        if not os.path.isdir(source_dir): self.logger(f"ERRORE: Cartella di origine non trovata.", "ERROR"); return False
         try:
-            excel_files = [os.path.join(r, f) for r, _, fs in os.walk(source_dir) for f in fs if f.lower().endswith(('.xls', '.xlsx', '.xlsm', '.xlsb')) and not f.startswith('~')]
+            excel_files = FileInventory.scan(source_dir, cancel_event=cancel_event)
         except Exception as e:
-            self.logger(f"ERRORE accesso cartella di origine: {e}", "ERROR"); return
-        if not excel_files: self.logger(f"Nessun file Excel trovato.", "WARNING"); return
+            self.logger(f"ERRORE accesso cartella di origine: {e}", "ERROR"); return False
+        # The destination was just emptied: with nothing to organize it is restored from the backup.
+        if not excel_files: self.logger(f"Nessun file Excel trovato.", "WARNING"); return False
 
         self.gui.after(0, self.setup_progress, len(excel_files), "Organizzazione in corso:")
-        summary = {"processed": 0, "errors": []}
-        with ExcelHandler(self.logger) as excel:
-            if not excel: return
-            for i, fp in enumerate(excel_files):
+        summary = {"processed": 0, "errors": ErrorLog("organizza")}
+        make_bundles = self.app_config.organizza_bundle_pdf.get()
+        bundle_sources = {}
+        with ExcelHandler(self.logger) as excel, self.run_metrics.phase("Organizzazione per ODC"), summary["errors"]:
+            if not excel: return False
+            for i in range(len(excel_files)):
                 if cancel_event.is_set(): return
+                fp = excel_files.path(i)
                 self.gui.after(0, self.update_progress, i + 1)
                 self.logger(f"Processando: {os.path.basename(fp)}...")
                 wb = None
                 try:
-                    wb = excel.Workbooks.Open(fp)
-                    ws = wb.Worksheets(1)
-                    odc_v = next((ws.Range(c).Value for c in ["L50", "L45", "DB14", "DB17"] if ws.Range(c).Value is not None and str(ws.Range(c).Value).strip() != ""), None)
-                    odc_s = str(int(odc_v)) if isinstance(odc_v, (int, float)) else (str(odc_v).strip() if isinstance(odc_v, str) else "")
-                    wb.Close(SaveChanges=False); wb = None
-                    dest_folder_name = re.sub(r'[\\/:*?"<>|]', '', odc_s) if odc_s and odc_s.upper() != "NA" else "Schede senza ODC"
+                    # Read the share through the local cache: the same copy is opened and then copied.
+                    local_fp = self.file_cache.resolve(fp)
+                    # Excel is only needed for metadata not read yet or a PDF not exported yet.
+                    metadata = self.metadata.cached(fp)
+                    pdf_path = self.pdf_cache.lookup(fp, ".pdf") if make_bundles else None
+                    if metadata is None or (make_bundles and pdf_path is None and self.templates.get(metadata.model)):
+                        wb = excel.Workbooks.Open(local_fp)
+                        metadata = self.metadata.read(wb, fp)
+                        if make_bundles: pdf_path = self.render_pdf_for_bundle(wb, fp)
+                        wb.Close(SaveChanges=False); wb = None
+                    dest_folder_name = odc_folder_name(metadata.odc)
+                    if pdf_path: bundle_sources.setdefault(dest_folder_name, []).append((os.path.basename(fp).lower(), pdf_path))
                     dest_folder_path = os.path.join(dest_dir, dest_folder_name)
                     os.makedirs(dest_folder_path, exist_ok=True)
-                    shutil.copy2(fp, dest_folder_path)
+                    shutil.copy2(local_fp, os.path.join(dest_folder_path, os.path.basename(fp)))
+                    size = excel_files.size(i)
+                    self.run_metrics.add_file(read=size, written=size)
                     summary["processed"] += 1
                 except Exception as e:
-                    summary["errors"].append((os.path.basename(fp), f"Dettagli: {e}"))
+                    summary["errors"].add(os.path.basename(fp), f"Dettagli: {e}")
+                    self.run_metrics.add_error()
                 finally:
                     if wb: wb.Close(SaveChanges=False)
-        # ... (summary logging)
+        if make_bundles and bundle_sources and not cancel_event.is_set():
+            with self.run_metrics.phase("PDF unici per ODC"), summary["errors"]: self._build_odc_bundles(dest_dir, bundle_sources, summary)
+        if summary["errors"]:
+            self.logger("\n--- RIEPILOGO ERRORI ---", "HEADER")
+            summary["errors"].log_summary(self.logger)
+
+    def render_pdf_for_bundle(self, wb, source_path):
+        """
+        Returns the PDF export of an open workbook, reusing the cached one when the source
+        file has not changed. Returns None for models without a known print area.
+        New exports are compressed once here, so the merged bundles need no further pass.
+        """
+        cached = self.pdf_cache.lookup(source_path, ".pdf")
+        if cached: return cached
+        ws = self._prepare_print_sheet(wb, source_path)
+        if ws is None: return None
+        pdf_path = self.pdf_cache.path_for(source_path, ".pdf")
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        ws.ExportAsFixedFormat(0, pdf_path)
+        gs_exe = self.app_config.firma_ghostscript_path.get()
+        if gs_exe and os.path.isfile(gs_exe):
+            compress_pdf(gs_exe, pdf_path, PROFILE_STANDARD)
+        self.pdf_cache.store(pdf_path)
+        return pdf_path
+
+    def _merge_pdfs(self, pdfs, output_pdf):
+        """
+        Merges `pdfs` with the streaming merger, which shares the stamp image repeated in
+        every signed sheet. PDFs it cannot read are merged with Ghostscript instead.
+
+        Returns:
+            MergeStats or None: The merge statistics, None after a Ghostscript fallback.
+        """
+        try:
+            return merge_pdfs_streaming(pdfs, output_pdf)
+        except PdfMergeError as e:
+            gs_exe = self.app_config.firma_ghostscript_path.get()
+            if not gs_exe or not os.path.isfile(gs_exe): raise
+            self.logger(f"  -> Unione diretta non riuscita ({e}), uso Ghostscript.", "WARNING")
+            merge_pdfs(gs_exe, pdfs, output_pdf)
+            return None
+
+    def _build_odc_bundles(self, dest_dir, bundle_sources, summary):
+        """Merges the PDFs of every ODC folder into '<ODC>.pdf' inside that folder, in parallel."""
+        self.logger(f"Generazione di {len(bundle_sources)} PDF unici per ODC...", "HEADER")
+
+        def build(folder_name, sources):
+            # Pages follow the file names, as the workbooks appear in the folder.
+            stats = self._merge_pdfs([pdf for _, pdf in sorted(sources)], os.path.join(dest_dir, folder_name, f"{folder_name}.pdf"))
+            return folder_name, len(sources), stats
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(build, name, sources) for name, sources in bundle_sources.items()]
+            for future in futures:
+                try:
+                    folder_name, count, stats = future.result()
+                    self.run_metrics.add_bytes(written=os.path.getsize(os.path.join(dest_dir, folder_name, f"{folder_name}.pdf")))
+                    shared = f", {stats.shared_streams} risorse ripetute condivise (-{stats.shared_bytes / 1024:.0f} KB)" if stats and stats.shared_streams else ""
+                    self.logger(f"  -> {folder_name}.pdf creato ({count} schede{shared}).", "SUCCESS")
+                except Exception as e:
+                    summary["errors"].add("PDF unico", f"Dettagli: {e}")
+                    self.run_metrics.add_error()
+                    self.logger(f"ERRORE creazione PDF unico: {e}", "ERROR")
 
     def _print_files_in_folders(self, cancel_event, folder_list):
         self.gui.after(0, self.setup_progress, len(folder_list), "Stampa in corso:")
-        with ExcelHandler(self.logger) as excel:
-            if not excel: return
-            errors = []
+        with ExcelHandler(self.logger) as excel, ErrorLog("stampa") as errors:
+            if not excel: return False
             for i, folder_p in enumerate(folder_list):
                 if cancel_event.is_set(): return
                 self.gui.after(0, self.update_progress, i + 1)
@@ -135,20 +232,136 @@ class OrganizationProcessor:
                         if cancel_event.is_set(): return
                         wb = None
                         try:
+                            if self._is_unknown_model(fp): self.logger(f"  -> Ignorato (modello non trovato): {os.path.basename(fp)}", "WARNING"); continue
                             wb = excel.Workbooks.Open(fp)
-                            ws = wb.Worksheets(1)
-                            m_val = next((str(ws.Cells(r, c).Value).strip() for r, c in [(2, 5), (2, 20), (5, 20)] if ws.Cells(r, c).Value and str(ws.Cells(r, c).Value).strip()), "")
-                            cleaned_model = re.sub(r'\W', '', m_val)
-                            if cleaned_model in self.stampa_processing_data:
-                                ws.PageSetup.PrintArea = self.stampa_processing_data[cleaned_model]["PrintArea"]
+                            if self._prepare_print_sheet(wb, fp) is not None:
                                 wb.PrintOut()
+                                self.run_metrics.add_file(read=os.path.getsize(fp))
                                 self.logger(f"  -> Stampa inviata per: {os.path.basename(fp)}", "SUCCESS")
                             else: self.logger(f"  -> Ignorato (modello non trovato): {os.path.basename(fp)}", "WARNING")
-                        except Exception as e_file: errors.append((os.path.basename(fp), f"Dettagli: {e_file}"))
+                        except Exception as e_file: errors.add(os.path.basename(fp), f"Dettagli: {e_file}")
                         finally:
                             if wb: wb.Close(SaveChanges=False)
-                except Exception as e_folder: errors.append((os.path.basename(folder_p), f"Dettagli: {e_folder}"))
-        # ... (error summary logging)
+                except Exception as e_folder: errors.add(os.path.basename(folder_p), f"Dettagli: {e_folder}")
+            self.run_metrics.add_error(len(errors))
+        if errors:
+            self.logger("\n--- RIEPILOGO ERRORI ---", "HEADER")
+            errors.log_summary(self.logger)
+
+    def _prepare_print_sheet(self, wb, source_path):
+        """Sets the print area of a known model and returns its sheet, or None if the model is unknown."""
+        metadata = self.metadata.cached(source_path) or self.metadata.read(wb, source_path)
+        template = self.templates.get(metadata.model)
+        if template is None: return None
+        ws = wb.Worksheets(1)
+        ws.PageSetup.PrintArea = template.print_area
+        return ws
+
+    def _is_unknown_model(self, source_path):
+        """True if the cached metadata already tells the workbook is not a printable model."""
+        metadata = self.metadata.cached(source_path)
+        return metadata is not None and self.templates.get(metadata.model) is None
+
+    def _get_printer_backend(self):
+        if self.app_config.stampa_backend.get() == FilePrinterBackend.name:
+            return FilePrinterBackend(os.path.join(const.APPLICATION_PATH, const.PRINT_SPOOL_DIR))
+        return GhostscriptPrinterBackend(self.app_config.firma_ghostscript_path.get(), self.app_config.selected_printer.get())
+
+    def _get_current_bundle(self, folder_p, excel_fs):
+        """Returns the folder's '<ODC>.pdf' if it is newer than all of its workbooks, else None."""
+        bundle_path = os.path.join(folder_p, f"{os.path.basename(folder_p)}.pdf")
+        try:
+            bundle_mtime = os.path.getmtime(bundle_path)
+            return bundle_path if all(os.path.getmtime(fp) <= bundle_mtime for fp in excel_fs) else None
+        except OSError:
+            return None
+
+    def _wait_for_print_queue(self, backend, cancel_event):
+        last_reported = None
+        while not cancel_event.is_set():
+            pending = backend.pending_jobs()
+            if pending is None or pending <= self.max_queued_print_jobs: return
+            if pending != last_reported:
+                self.logger(f"  -> Coda stampante piena ({pending} lavori in attesa), attendo...", "WARNING")
+                last_reported = pending
+            time.sleep(2)
+
+    def _print_folders_batched(self, cancel_event, folder_list):
+        """
+        Prints each ODC folder as one combined job: every workbook is exported to PDF with
+        its print area, the PDFs are merged into one file and the result is sent to
+        the printer backend as a single spool job.
+        """
+        gs_exe = self.app_config.firma_ghostscript_path.get()
+        if not gs_exe or not os.path.isfile(gs_exe):
+            self.logger(f"ERRORE: Eseguibile Ghostscript non trovato: {gs_exe}", "ERROR"); return False
+        backend = self._get_printer_backend()
+        self.logger(f"Stampa in lavori unici per cartella (destinazione: {backend.name}).", "INFO")
+        self.gui.after(0, self.setup_progress, len(folder_list), "Stampa in corso:")
+        temp_dir = tempfile.mkdtemp(prefix="stampa_")
+        errors = ErrorLog("stampa unita")
+        jobs = 0; pages = 0
+        started = time.perf_counter()
+        try:
+            with ExcelHandler(self.logger) as excel:
+                if not excel: return False
+                for i, folder_p in enumerate(folder_list):
+                    if cancel_event.is_set(): return
+                    self.gui.after(0, self.update_progress, i + 1)
+                    folder_name = os.path.basename(folder_p)
+                    self.logger(f"Stampa cartella: {folder_name}")
+                    try:
+                        excel_fs = [os.path.join(folder_p, f) for f in os.listdir(folder_p) if f.lower().endswith(('.xls', '.xlsx', '.xlsm', '.xlsb')) and not f.startswith('~')]
+                        if not excel_fs: self.logger("  -> Nessun file Excel trovato.", "WARNING"); continue
+                        bundle_path = self._get_current_bundle(folder_p, excel_fs)
+                        if bundle_path:
+                            # The organizer already produced the merged PDF: send it as it is.
+                            self._wait_for_print_queue(backend, cancel_event)
+                            if cancel_event.is_set(): return
+                            backend.submit(bundle_path, f"Schede {folder_name}")
+                            bundle_pages = count_pdf_pages(bundle_path)
+                            jobs += 1; pages += bundle_pages
+                            self.run_metrics.add_bytes(read=os.path.getsize(bundle_path))
+                            self.logger(f"  -> PDF unico esistente inviato: {bundle_pages} pagine.", "SUCCESS")
+                            continue
+                        pdfs = []
+                        for j, fp in enumerate(excel_fs):
+                            if cancel_event.is_set(): return
+                            wb = None
+                            try:
+                                if self._is_unknown_model(fp): self.logger(f"  -> Ignorato (modello non trovato): {os.path.basename(fp)}", "WARNING"); continue
+                                wb = excel.Workbooks.Open(fp)
+                                ws = self._prepare_print_sheet(wb, fp)
+                                if ws is None: self.logger(f"  -> Ignorato (modello non trovato): {os.path.basename(fp)}", "WARNING"); continue
+                                pdf_path = os.path.join(temp_dir, f"{i:04d}_{j:04d}.pdf")
+                                ws.ExportAsFixedFormat(0, pdf_path)
+                                pdfs.append(pdf_path)
+                                self.run_metrics.add_file(read=os.path.getsize(fp))
+                            except Exception as e_file: errors.add(os.path.basename(fp), f"Dettagli: {e_file}")
+                            finally:
+                                if wb: wb.Close(SaveChanges=False)
+                        if not pdfs: continue
+                        bundle_path = os.path.join(temp_dir, f"{i:04d}_bundle.pdf")
+                        self._merge_pdfs(pdfs, bundle_path)
+                        self._wait_for_print_queue(backend, cancel_event)
+                        if cancel_event.is_set(): return
+                        backend.submit(bundle_path, f"Schede {folder_name}")
+                        bundle_pages = count_pdf_pages(bundle_path)
+                        jobs += 1; pages += bundle_pages
+                        self.run_metrics.add_bytes(written=os.path.getsize(bundle_path))
+                        self.logger(f"  -> Lavoro unico inviato: {len(pdfs)} file, {bundle_pages} pagine.", "SUCCESS")
+                    except Exception as e_folder: errors.add(folder_name, f"Dettagli: {e_folder}")
+        finally:
+            errors.close()
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            elapsed = time.perf_counter() - started
+            self.run_metrics.add_error(len(errors))
+            self.run_metrics.extra.update(lavori=jobs, pagine=pages)
+            if jobs and elapsed > 0:
+                self.logger(f"Lavori di stampa: {jobs}, pagine: {pages} in {elapsed:.1f} s ({pages / elapsed:.2f} pagine/s, {jobs / elapsed:.3f} lavori/s).", "INFO")
+            if errors:
+                self.logger("\n--- RIEPILOGO ERRORI ---", "HEADER")
+                errors.log_summary(self.logger)
 
     def get_odc_to_canone_map(self, year, month):
         self.logger(f"Lettura del file Giornaliera per {month} {year}...", "INFO")
@@ -163,7 +376,7 @@ class OrganizationProcessor:
             if not excel: return {}
             wb = None
             try:
-                wb = excel.Workbooks.Open(giornaliera_path, ReadOnly=True)
+                wb = excel.Workbooks.Open(self.file_cache.resolve(giornaliera_path), ReadOnly=True)
                 ws = wb.Worksheets("RIEPILOGO")
                 cells_to_check = [("S16", "S17"), ("U16", "U17"), ("V16", "V17")]
                 for header_cell, value_cell in cells_to_check:
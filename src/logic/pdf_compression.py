@@ -0,0 +1,308 @@
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+COMPRESSION_MODE_STANDARD = "Standard"
+COMPRESSION_MODE_ADAPTIVE = "Adattiva"
+COMPRESSION_MODES = [COMPRESSION_MODE_STANDARD, COMPRESSION_MODE_ADAPTIVE]
+
+PROFILE_SKIP = "nessuna"
+PROFILE_LIGHT = "leggera"
+PROFILE_STANDARD = "standard"
+PROFILE_STRONG = "forte"
+
+# Ghostscript arguments of each profile. "leggera" keeps the /ebook resolution but
+# subsamples images instead of resampling them, which costs much less CPU.
+PROFILE_ARGS = {
+    PROFILE_LIGHT: ["-dPDFSETTINGS=/ebook", "-dColorImageDownsampleType=/Subsample", "-dGrayImageDownsampleType=/Subsample", "-dMonoImageDownsampleType=/Subsample"],
+    PROFILE_STANDARD: ["-dPDFSETTINGS=/ebook"],
+    PROFILE_STRONG: ["-dPDFSETTINGS=/screen"],
+}
+
+# Adaptive thresholds. Files below SKIP_BELOW_BYTES are already small enough that a
+# Ghostscript pass is not worth its start-up cost; outliers are measured against the
+# email size limit, because a few big files are what forces extra drafts.
+SKIP_BELOW_BYTES = 150 * 1024
+LIGHT_BELOW_BYTES = 600 * 1024
+STRONG_ABOVE_LIMIT_FRACTION = 0.25
+
+
+def choose_profile(input_size, mode, email_limit_bytes=None):
+    """
+    Picks the compression profile of a PDF.
+
+    Args:
+        input_size (int): The size in bytes of the uncompressed PDF.
+        mode (str): COMPRESSION_MODE_STANDARD or COMPRESSION_MODE_ADAPTIVE.
+        email_limit_bytes (float, optional): The email size limit, used to spot outliers.
+    """
+    if mode != COMPRESSION_MODE_ADAPTIVE:
+        return PROFILE_STANDARD
+    if input_size < SKIP_BELOW_BYTES:
+        return PROFILE_SKIP
+    if email_limit_bytes and input_size > email_limit_bytes * STRONG_ABOVE_LIMIT_FRACTION:
+        return PROFILE_STRONG
+    if input_size < LIGHT_BELOW_BYTES:
+        return PROFILE_LIGHT
+    return PROFILE_STANDARD
+
+
+def build_gs_args(gs_exe, profile, input_pdf, output_pdf):
+    """Returns the Ghostscript command line compressing `input_pdf` with `profile`."""
+    return [gs_exe, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4"] + PROFILE_ARGS[profile] + ["-dNOPAUSE", "-dBATCH", "-dQUIET", f"-sOutputFile={output_pdf}", input_pdf]
+
+
+class CompressionResult:
+    """The outcome of compressing a single PDF, as shown in the final report."""
+    def __init__(self, file_name, profile, seconds, input_size, output_size, error=None):
+        self.file_name = file_name
+        self.profile = profile
+        self.seconds = seconds
+        self.input_size = input_size
+        self.output_size = output_size
+        self.error = error
+
+    @property
+    def ratio(self):
+        return self.output_size / self.input_size if self.input_size else 1.0
+
+
+def compress_pdf(gs_exe, input_pdf, profile):
+    """
+    Compresses `input_pdf` in place with the given profile.
+
+    The original file is kept when Ghostscript fails, produces an invalid file or a
+    file that is not smaller than the input.
+
+    Returns:
+        CompressionResult: The chosen profile, elapsed time and sizes.
+    """
+    file_name = os.path.basename(input_pdf)
+    input_size = os.path.getsize(input_pdf)
+    if profile == PROFILE_SKIP:
+        return CompressionResult(file_name, profile, 0.0, input_size, input_size)
+
+    temp_output_pdf = os.path.join(os.path.dirname(input_pdf), f"temp_{file_name}")
+    start = time.perf_counter()
+    try:
+        subprocess.run(build_gs_args(gs_exe, profile, input_pdf, temp_output_pdf), check=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
+        seconds = time.perf_counter() - start
+        if not os.path.exists(temp_output_pdf) or os.path.getsize(temp_output_pdf) <= 100:
+            return CompressionResult(file_name, profile, seconds, input_size, input_size, error="File compresso non valido.")
+        output_size = os.path.getsize(temp_output_pdf)
+        if output_size >= input_size:
+            return CompressionResult(file_name, profile, seconds, input_size, input_size)
+        os.remove(input_pdf); os.rename(temp_output_pdf, input_pdf)
+        return CompressionResult(file_name, profile, seconds, input_size, output_size)
+    except subprocess.CalledProcessError as e:
+        return CompressionResult(file_name, profile, time.perf_counter() - start, input_size, input_size, error=f"Ghostscript: {e.stderr}")
+    except Exception as e:
+        return CompressionResult(file_name, profile, time.perf_counter() - start, input_size, input_size, error=f"Imprevisto: {e}")
+    finally:
+        if os.path.exists(temp_output_pdf): os.remove(temp_output_pdf)
+
+
+# How many PDFs a single Ghostscript process handles in batch mode. Small enough that a
+# crash only costs a few individual retries, large enough to amortise the start-up.
+BATCH_SIZE = 20
+BATCH_MARKER = "GSBATCH"
+
+
+def _ps_string(text):
+    """Escapes `text` for use inside a PostScript (...) string literal."""
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _build_batch_script(entries):
+    """
+    Builds a PostScript job that converts every (input, output) pair with the already
+    running pdfwrite device. Each input runs inside `stopped`, so a broken PDF only
+    fails its own entry; a marker line per entry reports the outcome on stdout.
+    """
+    lines = ["%!PS"]
+    for index, (input_pdf, output_pdf) in enumerate(entries):
+        if index > 0:
+            # Switching OutputFile closes the previous PDF and starts a new one.
+            lines.append(f"<< /OutputFile {_ps_string(output_pdf)} >> setpagedevice")
+        lines.append(f"{{ {_ps_string(input_pdf)} run }} stopped "
+                     f"{{ clear ({BATCH_MARKER} FAIL {index}) = }} {{ ({BATCH_MARKER} OK {index}) = }} ifelse flush")
+    return "\n".join(lines) + "\n"
+
+
+def _run_batch(gs_exe, profile, entries, work_dir):
+    """
+    Runs one Ghostscript process over `entries` and returns the set of entry indexes
+    that reported success.
+    """
+    script_path = os.path.join(work_dir, f"gsbatch_{os.getpid()}_{id(entries)}.ps")
+    with open(script_path, 'w', encoding='utf-8') as f:
+        f.write(_build_batch_script(entries))
+    permitted_dirs = {os.path.dirname(p) for pair in entries for p in pair}
+    args = [gs_exe, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4"] + PROFILE_ARGS[profile] + ["-dNOPAUSE", "-dBATCH", "-dQUIET"]
+    for directory in permitted_dirs:
+        # Ghostscript matches permitted paths literally, so allow both separator styles.
+        for prefix in {directory + os.sep, directory.replace("\\", "/") + "/"}:
+            args += [f"--permit-file-read={prefix}", f"--permit-file-write={prefix}"]
+    args += [f"-sOutputFile={entries[0][1]}", script_path]
+    try:
+        completed = subprocess.run(args, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
+    finally:
+        if os.path.exists(script_path): os.remove(script_path)
+    succeeded = set()
+    for line in completed.stdout.splitlines():
+        parts = line.strip().split()
+        if len(parts) == 3 and parts[0] == BATCH_MARKER and parts[1] == "OK":
+            succeeded.add(int(parts[2]))
+    return succeeded
+
+
+def compress_pdfs_batch(gs_exe, jobs, cancel_event=None, on_result=None):
+    """
+    Compresses many PDFs in place with as few Ghostscript launches as possible.
+
+    Jobs are grouped by profile and fed to one process per BATCH_SIZE files through a
+    generated PostScript job script. Every file still gets its own output and is
+    validated on its own; any file whose batch entry failed is retried alone with
+    `compress_pdf`, so one broken PDF never takes the rest of the batch down.
+
+    Args:
+        gs_exe (str): The Ghostscript executable.
+        jobs (list[tuple[str, str]]): (input PDF path, profile) pairs.
+        cancel_event (threading.Event, optional): Stops before starting the next batch.
+        on_result (callable, optional): Called with each CompressionResult as it is ready.
+
+    Returns:
+        tuple[list[CompressionResult], int]: The per-file results and the number of
+        Ghostscript processes launched.
+    """
+    results = []
+    processes = 0
+
+    def emit(result):
+        results.append(result)
+        if on_result: on_result(result)
+
+    by_profile = {}
+    for input_pdf, profile in jobs:
+        if profile == PROFILE_SKIP:
+            size = os.path.getsize(input_pdf)
+            emit(CompressionResult(os.path.basename(input_pdf), profile, 0.0, size, size))
+        else:
+            by_profile.setdefault(profile, []).append(input_pdf)
+
+    for profile, inputs in by_profile.items():
+        for start in range(0, len(inputs), BATCH_SIZE):
+            if cancel_event is not None and cancel_event.is_set(): return results, processes
+            batch = inputs[start:start + BATCH_SIZE]
+            entries = [(p, os.path.join(os.path.dirname(p), f"temp_{os.path.basename(p)}")) for p in batch]
+            input_sizes = [os.path.getsize(p) for p in batch]
+            started = time.perf_counter()
+            try:
+                succeeded = _run_batch(gs_exe, profile, entries, os.path.dirname(batch[0]))
+            except Exception:
+                succeeded = set()
+            processes += 1
+            seconds_each = (time.perf_counter() - started) / len(batch)
+
+            for index, (input_pdf, temp_output_pdf) in enumerate(entries):
+                output_ok = index in succeeded and os.path.exists(temp_output_pdf) and os.path.getsize(temp_output_pdf) > 100
+                if not output_ok:
+                    if os.path.exists(temp_output_pdf): os.remove(temp_output_pdf)
+                    # Isolate the failure: give this file a process of its own.
+                    processes += 1
+                    emit(compress_pdf(gs_exe, input_pdf, profile))
+                    continue
+                input_size = input_sizes[index]
+                output_size = os.path.getsize(temp_output_pdf)
+                if output_size >= input_size:
+                    os.remove(temp_output_pdf)
+                    output_size = input_size
+                else:
+                    os.remove(input_pdf); os.rename(temp_output_pdf, input_pdf)
+                emit(CompressionResult(os.path.basename(input_pdf), profile, seconds_each, input_size, output_size))
+    return results, processes
+
+
+def compress_pdfs(gs_exe, jobs, batch, cancel_event=None, on_result=None):
+    """
+    Compresses `jobs` with `compress_pdfs_batch` when `batch` is set (the "Ghostscript in
+    batch" option), otherwise with one `compress_pdf` process per file. Arguments and
+    return value are those of `compress_pdfs_batch`.
+    """
+    if batch: return compress_pdfs_batch(gs_exe, jobs, cancel_event, on_result)
+    results = []
+    processes = 0
+    for input_pdf, profile in jobs:
+        if cancel_event is not None and cancel_event.is_set(): break
+        if profile != PROFILE_SKIP: processes += 1
+        result = compress_pdf(gs_exe, input_pdf, profile)
+        results.append(result)
+        if on_result: on_result(result)
+    return results, processes
+
+
+def merge_pdfs(gs_exe, input_pdfs, output_pdf, profile=PROFILE_STANDARD):
+    """
+    Concatenates `input_pdfs` into `output_pdf` with a single Ghostscript pass, which
+    also applies the compression profile to the combined document.
+    Raises subprocess.CalledProcessError if Ghostscript fails.
+    """
+    args = [gs_exe, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4"] + PROFILE_ARGS[profile] + ["-dNOPAUSE", "-dBATCH", "-dQUIET", f"-sOutputFile={output_pdf}"] + list(input_pdfs)
+    subprocess.run(args, check=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
+
+
+PAGE_OBJECT_REGEX = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+
+
+def count_pdf_pages(pdf_path):
+    """
+    Counts the page objects of a PDF. Reliable for files written by Ghostscript at
+    compatibility level 1.4, which never hides objects inside compressed streams.
+    """
+    with open(pdf_path, 'rb') as f:
+        return len(PAGE_OBJECT_REGEX.findall(f.read()))
+
+
+def _benchmark(gs_exe, folder, profile):
+    import statistics
+    pdfs = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith('.pdf'))
+    if not pdfs:
+        print(f"Nessun PDF in {folder}"); return
+    total_mb = sum(os.path.getsize(p) for p in pdfs) / (1024 * 1024)
+    print(f"{len(pdfs)} PDF ({total_mb:.1f} MB) da {folder}, profilo {profile}")
+    # Each method works on its own fresh copy, since compression rewrites the files in place.
+    timings = {}
+    for label, batch in (("un processo per file", False), ("batch", True)):
+        work_dir = tempfile.mkdtemp(prefix="gs_bench_")
+        try:
+            copies = [shutil.copy2(p, work_dir) for p in pdfs]
+            started = time.perf_counter()
+            results, processes = compress_pdfs(gs_exe, [(p, profile) for p in copies], batch)
+            elapsed = time.perf_counter() - started
+            errors = sum(1 for r in results if r.error)
+            out_mb = sum(r.output_size for r in results) / (1024 * 1024)
+            timings[label] = elapsed
+            per_file = statistics.mean(r.seconds for r in results) if results else 0.0
+            print(f"  {label:<22} {elapsed:7.1f} s  {len(results) / elapsed:6.2f} file/s  {processes:4d} processi  "
+                  f"{per_file:5.2f} s/file  -> {out_mb:.1f} MB  errori: {errors}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if timings["batch"] > 0:
+        print(f"  accelerazione del batch: {timings['un processo per file'] / timings['batch']:.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confronta la compressione Ghostscript con un processo per file e in batch sui PDF di una cartella (i file originali non vengono modificati).")
+    parser.add_argument("cartella", help="cartella con i PDF di prova")
+    parser.add_argument("--gs", required=True, help="eseguibile Ghostscript (es. gswin64c.exe)")
+    parser.add_argument("--profilo", default=PROFILE_STANDARD, choices=list(PROFILE_ARGS), help="profilo di compressione (predefinito: standard)")
+    args = parser.parse_args(argv)
+    _benchmark(args.gs, args.cartella, args.profilo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import traceback
+from src.utils import constants as const
+from src.utils.excel_handler import ExcelHandler
+from src.utils.file_cache import get_shared_cache
+from src.utils.folder_watcher import FolderWatcher, Observer
+from src.utils.metrics_store import get_metrics_store, run_status
+from src.utils.stamp_cache import StampImageCache
+from src.logic.job_scheduler import PRIORITY_LOW, RESOURCE_EXCEL, folder_resource
+from src.logic.template_registry import get_template_registry
+from src.logic.workbook_metadata import get_metadata_extractor
+from src.logic.signature import export_signed_sheet, presigned_pdf_cache, presigned_suffix
+
+
+class BackgroundPreprocessor:
+    """
+    Prepares the workbooks dropped into the signature and organize folders during the day.
+
+    Every new workbook is opened once, at low priority: its metadata is cached, sheets
+    of a known model are signed into the pre-signed PDF cache (reused by the signature
+    and month-end runs) and, when the organizer builds merged PDFs, its plain export is
+    rendered into the organizer's PDF cache. A job stops after the current workbook as
+    soon as a user-started job is waiting for Excel; the rest is picked up later.
+    """
+    def __init__(self, app_config, logger):
+        self.app_config = app_config
+        self.logger = logger
+        self.scheduler = app_config.scheduler
+        self.file_cache = get_shared_cache()
+        self.templates = get_template_registry()
+        self.metadata = get_metadata_extractor()
+        self.presigned_cache = presigned_pdf_cache()
+        self.metrics = get_metrics_store()
+        self.watcher = FolderWatcher(self._watched_folders, self._on_new_files, interval=const.WATCH_POLL_SECONDS)
+
+    def start(self):
+        self.watcher.start()
+        mode = "notifiche di sistema e controllo periodico" if Observer is not None else f"controllo ogni {const.WATCH_POLL_SECONDS} s"
+        self.logger(f"Pre-elaborazione in background attiva ({mode}).", "INFO")
+
+    def stop(self):
+        if self.watcher.running:
+            self.watcher.stop()
+            self.logger("Pre-elaborazione in background disattivata.", "INFO")
+
+    def _watched_folders(self):
+        return [self.app_config.firma_excel_dir.get(), self.app_config.organizza_source_dir.get()]
+
+    def _on_new_files(self, folder, paths):
+        self.scheduler.submit(f"Pre-elaborazione: {len(paths)} file in {os.path.basename(folder)}", self.preprocess, args=(folder, paths),
+                              resources=[RESOURCE_EXCEL, folder_resource(folder)], priority=PRIORITY_LOW)
+
+    def preprocess(self, cancel_event, folder, paths):
+        """Reads, pre-signs and pre-renders `paths`. Runs as a low-priority job."""
+        image_path = self.app_config.firma_image_path.get()
+        suffix = presigned_suffix(image_path)
+        render_bundles = os.path.normcase(folder) == os.path.normcase(self.app_config.organizza_source_dir.get()) and self.app_config.organizza_bundle_pdf.get()
+        renderer = self.app_config.organize_tab.processor
+        resources = [RESOURCE_EXCEL, folder_resource(folder)]
+        stamp_cache = StampImageCache(image_path)
+        run = self.metrics.start("pre-elaborazione")
+        done = 0
+        failed = False
+        try:
+            with ExcelHandler(self.logger) as excel:
+                if not excel:
+                    failed = True
+                    return False
+                for i, path in enumerate(paths):
+                    if cancel_event.is_set() or self.scheduler.has_waiting(resources, PRIORITY_LOW):
+                        # Let the user's job go first; the rest is reported again at a later poll.
+                        self.watcher.forget(paths[i:])
+                        break
+                    if self._prepare(excel, path, suffix, render_bundles, renderer, stamp_cache, run): done += 1
+        except Exception as e:
+            failed = True
+            self.logger(f"ERRORE pre-elaborazione: {e}", "ERROR"); self.logger(traceback.format_exc(), "ERROR")
+            raise
+        finally:
+            stamp_cache.close()
+            if done or failed: self.metrics.finish(run, run_status(cancel_event, failed))
+        if done: self.logger(f"Pre-elaborati {done} file in {os.path.basename(folder)}.", "SUCCESS")
+
+    def _prepare(self, excel, path, suffix, render_bundles, renderer, stamp_cache, run):
+        """Returns True if the workbook had to be opened."""
+        metadata = self.metadata.cached(path)
+        template = self.templates.get(metadata.model) if metadata else None
+        needs_signature = bool(suffix) and (metadata is None or (template is not None and not self.presigned_cache.lookup(path, suffix)))
+        needs_render = render_bundles and (metadata is None or (template is not None and not renderer.pdf_cache.lookup(path, ".pdf")))
+        if metadata is not None and not needs_signature and not needs_render: return False
+        wb = None
+        try:
+            wb = excel.Workbooks.Open(self.file_cache.resolve(path), ReadOnly=True)
+            run.add_file(read=os.path.getsize(path))
+            metadata = metadata or self.metadata.read(wb, path)
+            template = self.templates.get(metadata.model)
+            if template is None: return True
+            if render_bundles:
+                # Rendered before signing: the stamp must not end up in the plain export.
+                renderer.render_pdf_for_bundle(wb, path)
+            if suffix and not self.presigned_cache.lookup(path, suffix):
+                pdf_path = self.presigned_cache.path_for(path, suffix)
+                os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+                # Exported under a temporary name, so an interrupted export is never reused.
+                part_path = pdf_path[:-len(".pdf")] + ".part.pdf"
+                if export_signed_sheet(wb, template, stamp_cache, part_path):
+                    os.replace(part_path, pdf_path)
+                    self.presigned_cache.store(pdf_path)
+                    run.add_bytes(written=os.path.getsize(pdf_path))
+            return True
+        except Exception as e:
+            run.add_error()
+            self.logger(f"  -> Pre-elaborazione non riuscita per {os.path.basename(path)}: {e}", "WARNING")
+            return False
+        finally:
+            if wb: wb.Close(SaveChanges=False)
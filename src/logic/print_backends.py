@@ -0,0 +1,71 @@
+import os
+import shutil
+import subprocess
+import time
+
+# win32print is only needed to look at the Windows print queue; without it the queue
+# length is simply reported as unknown.
+try:
+    import win32print
+except ImportError:
+    win32print = None
+
+
+class PrinterBackend:
+    """
+    Where combined print jobs are sent. Subclasses implement `submit` and may report
+    the number of jobs waiting in the queue through `pending_jobs`.
+    """
+    name = "base"
+
+    def submit(self, pdf_path, job_name):
+        """Sends `pdf_path` as a single print job named `job_name`."""
+        raise NotImplementedError
+
+    def pending_jobs(self):
+        """Returns how many jobs are waiting in the printer queue, or None if unknown."""
+        return None
+
+
+class GhostscriptPrinterBackend(PrinterBackend):
+    """Prints PDFs on a Windows printer through Ghostscript's mswinpr2 device."""
+    name = "stampante"
+
+    def __init__(self, gs_exe, printer_name):
+        self.gs_exe = gs_exe
+        self.printer_name = printer_name
+
+    def submit(self, pdf_path, job_name):
+        args = [self.gs_exe, "-dNOPAUSE", "-dBATCH", "-dQUIET", "-dNoCancel", "-sDEVICE=mswinpr2",
+                f"-sDocumentName={job_name}", f"-sOutputFile=%printer%{self.printer_name}", pdf_path]
+        subprocess.run(args, check=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
+
+    def pending_jobs(self):
+        if not win32print: return None
+        handle = None
+        try:
+            handle = win32print.OpenPrinter(self.printer_name)
+            return win32print.GetPrinter(handle, 2)["cJobs"]
+        except Exception:
+            return None
+        finally:
+            if handle: win32print.ClosePrinter(handle)
+
+
+class FilePrinterBackend(PrinterBackend):
+    """
+    A stand-in printer that copies each job into a spool folder, one PDF per job.
+    Useful to check the combined output without wasting paper.
+    """
+    name = "file"
+
+    def __init__(self, spool_dir):
+        self.spool_dir = spool_dir
+
+    def submit(self, pdf_path, job_name):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        safe_name = "".join(c for c in job_name if c not in '\\/:*?"<>|')
+        shutil.copy2(pdf_path, os.path.join(self.spool_dir, f"{time.strftime('%Y%m%d-%H%M%S')} {safe_name}.pdf"))
+
+    def pending_jobs(self):
+        return 0
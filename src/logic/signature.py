@@ -1,10 +1,64 @@
+import hashlib
 import os
-import re
-import subprocess
+import shutil
+import threading
+import time
 import traceback
 from src.utils import constants as const
 from src.utils.excel_handler import ExcelHandler
 from src.utils.file_utils import clear_folder_content
+from src.utils.file_cache import get_derived_cache
+from src.utils.metrics_store import get_metrics_store, run_status
+from src.utils.file_inventory import ErrorLog
+from src.utils.stamp_cache import StampImageCache
+from src.logic.size_model import CompressionSizeModel
+from src.logic.template_registry import get_template_registry
+from src.logic.workbook_metadata import get_metadata_extractor
+from src.logic.organization import odc_folder_name
+from src.logic.pdf_compression import choose_profile, compress_pdfs, PROFILE_SKIP, PROFILE_STANDARD
+
+
+def add_signature_picture(ws, template, stamp_cache):
+    """Inserts the stamp at the template's signature cell, shifted by its offset in points."""
+    target_cell = ws.Range(template.signature_cell)
+    img_width, img_height = template.signature_size
+    offset_left, offset_top = template.signature_offset
+    left_pos = max(0, target_cell.Left + offset_left); top_pos = max(0, target_cell.Top + offset_top)
+    ws.Shapes.AddPicture(stamp_cache.path_for(img_width, img_height), True, True, left_pos, top_pos, img_width, img_height)
+
+
+def presigned_pdf_cache():
+    """The cache of PDFs signed in the background before the signature run."""
+    return get_derived_cache(const.PRESIGNED_PDF_CACHE_DIR)
+
+
+def presigned_suffix(image_path):
+    """
+    The cache suffix of PDFs signed with the current version of the stamp image, so a
+    new stamp invalidates every pre-signed PDF. Returns None if the image is missing.
+    """
+    try: st = os.stat(image_path)
+    except OSError: return None
+    key = f"{os.path.normcase(os.path.abspath(image_path))}|{st.st_size}|{st.st_mtime_ns}"
+    return f".firma-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.pdf"
+
+
+def export_signed_sheet(wb, template, stamp_cache, pdf_path):
+    """
+    Applies the stamp to the template's sheet of an open workbook and exports it.
+
+    Returns:
+        bool: False if the workbook lacks the template's sheet.
+    """
+    if template.sheet_name:
+        ws = next((s for s in wb.Worksheets if s.Name == template.sheet_name), None)
+        if ws is None: return False
+    else:
+        ws = wb.Worksheets(1)
+    ws.PageSetup.PrintArea = template.print_area
+    add_signature_picture(ws, template, stamp_cache)
+    ws.ExportAsFixedFormat(0, pdf_path)
+    return True
 
 
 class SignatureProcessor:
@@ -15,15 +69,26 @@ class SignatureProcessor:
         self.setup_progress = setup_progress_cb
         self.update_progress = update_progress_cb
         self.hide_progress = hide_progress_cb
-        self.firma_processing_data = {
-            "schedacontrolloSTRUMENTIANALOGICI": {"PrintArea": "A2:N55", "FirmaCella": "G54"},
-            "schedacontrolloSTRUMENTIDIGITALI": {"PrintArea": "A2:N50", "FirmaCella": "G49"},
-            "SchedacontrolloREPORTMANUTENZIONECORRETTIVA": {"PrintArea": "A2:N55", "FirmaCella": "G55"},
-            "SCHEDAMANUTENZIONE": {"PrintArea": "A1:FV106", "FirmaCella": "BZ105"},
-        }
+        self.templates = get_template_registry()
+        self.metadata = get_metadata_extractor()
+        self.size_model = CompressionSizeModel(os.path.join(const.APPLICATION_PATH, const.SIZE_MODEL_FILE_NAME))
+        self.pdf_models = {}
+        # PDF file name -> ODC folder, for grouping the email drafts by ODC.
+        self.pdf_odcs = {}
+        self._pdf_sizes = {}
+        self._pdf_sizes_lock = threading.Lock()
+        self.stamp_cache = None
+        self.presigned_cache = presigned_pdf_cache()
+        self.metrics = get_metrics_store()
+        self.run_metrics = None
 
     def run_full_signature_process(self, cancel_event):
         self.logger("Avvio del processo di firma...", 'HEADER')
+        self.pdf_models = {}
+        self.pdf_odcs = {}
+        with self._pdf_sizes_lock: self._pdf_sizes = {}
+        self.run_metrics = self.metrics.start("firma")
+        failed = False
         try:
             clear_folder_content(
                 self.app_config.firma_pdf_dir.get(),
@@ -31,8 +96,13 @@ class SignatureProcessor:
                 folder_display_name=const.FIRMA_PDF_OUTPUT_DIR
             )
             if not self._validate_paths():
+                failed = True
                 self.logger("Processo interrotto a causa di percorsi non validi.", 'ERROR')
-                return
+                return False
+
+            self.stamp_cache = StampImageCache(self.app_config.firma_image_path.get())
+            if not self.stamp_cache.available:
+                self.logger("Pillow non installato: il timbro verrà inserito alla risoluzione originale.", 'WARNING')
 
             excel_path = self.app_config.firma_excel_dir.get()
             excel_files = [f for f in os.listdir(excel_path) if f.lower().endswith(('.xlsx', '.xls', '.xlsm')) and not f.startswith('~')]
@@ -42,23 +112,34 @@ class SignatureProcessor:
             if cancel_event.is_set(): return
 
             self.logger("--- FASE 1: Elaborazione Excel e Conversione PDF ---", 'HEADER')
-            processed_ok = self._process_excel_files(excel_files, cancel_event)
+            with self.run_metrics.phase("Firma ed esportazione PDF"): processed_ok = self._process_excel_files(excel_files, cancel_event)
 
             if cancel_event.is_set(): return
             if not processed_ok:
+                failed = True
                 self.logger("Fase 1 terminata con errori. Processo interrotto.", 'ERROR')
-                return
+                return False
+
+            self._estimate_pdf_sizes()
+            self.gui.after(0, self.gui.on_size_estimates_ready)
 
             self.logger("--- FASE 2: Compressione dei file PDF ---", 'HEADER')
-            self._compress_pdfs(cancel_event, len(excel_files))
+            with self.run_metrics.phase("Compressione PDF"): self._compress_pdfs(cancel_event, len(excel_files))
+
+            if not self.size_model.save():
+                self.logger(f"Impossibile salvare il modello delle dimensioni PDF: {self.size_model.store_path}", "WARNING")
 
             if not cancel_event.is_set():
                 self.logger("--- PROCESSO DI FIRMA COMPLETATO ---", 'SUCCESS')
 
         except Exception as e:
+            failed = True
             self.logger(f"ERRORE CRITICO E IMPREVISTO: {e}", "ERROR")
             self.logger(traceback.format_exc(), "ERROR")
+            raise
         finally:
+            if self.stamp_cache: self.stamp_cache.close()
+            self.metrics.finish(self.run_metrics, run_status(cancel_event, failed))
             if cancel_event.is_set(): self.logger("Processo di firma annullato.", "WARNING")
             self.gui.after(0, self.hide_progress)
             self.gui.after(0, self.gui.on_process_finished)
@@ -80,8 +161,7 @@ class SignatureProcessor:
             self.logger(f"Nessun file Excel da elaborare in: {const.FIRMA_EXCEL_INPUT_DIR}", 'WARNING')
             return True
         self.logger(f"Inizio elaborazione di {len(excel_files)} file Excel...")
-        errors = []
-        with ExcelHandler(self.logger) as excel:
+        with ExcelHandler(self.logger) as excel, ErrorLog("firma") as errors:
             if not excel: return False
             mode = self.app_config.firma_processing_mode.get()
             for i, file_name in enumerate(excel_files):
@@ -92,50 +172,65 @@ class SignatureProcessor:
                 self.logger(f"Elaborazione: {file_name}", 'INFO')
                 workbook = None
                 try:
+                    cached = self.metadata.cached(file_path)
+                    if mode == "schede" and cached is not None and self.templates.get(cached.model) is None:
+                        self.logger(f"Modello non gestito: '{cached.model}'. File ignorato.", 'WARNING'); continue
+                    if mode == "schede" and cached is not None and self._reuse_presigned(file_path, file_name, cached): continue
                     workbook = excel.Workbooks.Open(file_path, 0, True)
                     self.logger(f"  -> File '{file_name}' aperto con successo.", 'INFO')
-                    if mode == "schede": self._apply_signature_schede(workbook, file_name)
-                    elif mode == "preventivi": self._apply_signature_preventivi(workbook, file_name)
+                    metadata = cached or self.metadata.read(workbook, file_path)
+                    self.run_metrics.add_file(read=os.path.getsize(file_path))
+                    if mode == "schede": self._apply_signature_schede(workbook, file_name, metadata)
+                    elif mode == "preventivi": self._apply_signature_preventivi(workbook, file_name, metadata)
                 except Exception as e:
-                    errors.append((file_name, f"Impossibile aprire o elaborare il file. Dettagli: {e}"))
+                    errors.add(file_name, f"Impossibile aprire o elaborare il file. Dettagli: {e}")
                 finally:
                     if workbook: workbook.Close(SaveChanges=False)
+        self.run_metrics.add_error(len(errors))
         if errors:
             self.logger("\n--- RIEPILOGO ERRORI ---", "HEADER")
-            for file_name, error_msg in errors: self.logger(f"- {file_name}: {error_msg}", "ERROR")
+            errors.log_summary(self.logger)
         return not errors
 
-    def _apply_signature_schede(self, workbook, file_name):
+    def _reuse_presigned(self, file_path, file_name, metadata):
+        """Copies the PDF signed in the background for this version of the file, if any."""
+        suffix = presigned_suffix(self.app_config.firma_image_path.get())
+        presigned = self.presigned_cache.lookup(file_path, suffix) if suffix else None
+        if not presigned: return False
+        pdf_file_path = os.path.join(self.app_config.firma_pdf_dir.get(), f"{os.path.splitext(file_name)[0]}.pdf")
+        shutil.copyfile(presigned, pdf_file_path)
+        self.pdf_models[os.path.basename(pdf_file_path)] = metadata.model
+        self.pdf_odcs[os.path.basename(pdf_file_path)] = odc_folder_name(metadata.odc)
+        self.logger("Firma già applicata in background: PDF riutilizzato.", 'SUCCESS')
+        return True
+
+    def _apply_signature_schede(self, workbook, file_name, metadata):
         try:
-            ws = workbook.Worksheets(1)
-            valE2 = ws.Cells(2, 5).Text.strip(); valT2 = ws.Cells(2, 20).Text.strip(); valT5 = ws.Cells(5, 20).Text.strip()
-            model_value = valE2 or valT2 or valT5
-            cleaned_model = ''.join(filter(str.isalnum, model_value))
-            if cleaned_model in self.firma_processing_data:
-                data = self.firma_processing_data[cleaned_model]
-                ws.PageSetup.PrintArea = data["PrintArea"]
-                img_width, img_height = (105, 35) if cleaned_model == "SCHEDAMANUTENZIONE" else (150, 50)
-                cell_address = data["FirmaCella"]
-                col_str = ''.join(re.findall("[A-Z]+", cell_address)); row_str = ''.join(re.findall(r"\d+", cell_address))
-                target_cell = ws.Cells(int(row_str), self._col_to_num(col_str))
-                points_per_cm = 28.35; offset_1cm = 1.0 * points_per_cm; offset_03cm = 0.3 * points_per_cm
-                top_pos = max(0, target_cell.Top - (offset_03cm if cleaned_model == "SCHEDAMANUTENZIONE" else offset_1cm))
-                left_pos = max(0, target_cell.Left - offset_1cm)
-                ws.Shapes.AddPicture(self.app_config.firma_image_path.get(), True, True, left_pos, top_pos, img_width, img_height)
+            cleaned_model = metadata.model
+            template = self.templates.get(cleaned_model)
+            if template:
+                ws = workbook.Worksheets(1)
+                ws.PageSetup.PrintArea = template.print_area
+                add_signature_picture(ws, template, self.stamp_cache)
                 pdf_file_path = os.path.join(self.app_config.firma_pdf_dir.get(), f"{os.path.splitext(file_name)[0]}.pdf")
                 workbook.ActiveSheet.ExportAsFixedFormat(0, pdf_file_path)
+                self.pdf_models[os.path.basename(pdf_file_path)] = cleaned_model
+                self.pdf_odcs[os.path.basename(pdf_file_path)] = odc_folder_name(metadata.odc)
                 self.logger("Firma applicata e PDF esportato.", 'SUCCESS')
             else: self.logger(f"Modello non gestito: '{cleaned_model}'. File ignorato.", 'WARNING')
         except Exception as e: self.logger(f"ERRORE in _apply_signature_schede: {e}", 'ERROR')
 
-    def _apply_signature_preventivi(self, workbook, file_name):
+    def _apply_signature_preventivi(self, workbook, file_name, metadata):
         try:
-            ws = next((s for s in workbook.Worksheets if s.Name == "Consuntivo"), None)
-            if ws is None: self.logger("Foglio 'Consuntivo' non trovato.", 'WARNING'); return
-            ws.Activate(); ws.PageSetup.PrintArea = "A3:L63"; target_cell = ws.Cells(59, 3); top_position = target_cell.Top + 10
-            ws.Shapes.AddPicture(self.app_config.firma_image_path.get(), True, True, target_cell.Left, top_position, 150, 50)
+            template = self.templates.get("preventivi")
+            if template.sheet_name not in metadata.sheet_names: self.logger(f"Foglio '{template.sheet_name}' non trovato.", 'WARNING'); return
+            ws = workbook.Worksheets(template.sheet_name)
+            ws.Activate(); ws.PageSetup.PrintArea = template.print_area
+            add_signature_picture(ws, template, self.stamp_cache)
             pdf_file_path = os.path.join(self.app_config.firma_pdf_dir.get(), f"{os.path.splitext(file_name)[0]}.pdf")
             ws.ExportAsFixedFormat(0, pdf_file_path)
+            self.pdf_models[os.path.basename(pdf_file_path)] = "preventivi"
+            self.pdf_odcs[os.path.basename(pdf_file_path)] = odc_folder_name(metadata.odc)
             self.logger("Firma applicata e PDF esportato.", 'SUCCESS')
         except Exception as e: self.logger(f"ERRORE in _apply_signature_preventivi: {e}", 'ERROR')
 
@@ -143,31 +238,84 @@ class SignatureProcessor:
         pdf_path = self.app_config.firma_pdf_dir.get()
         pdf_files = [f for f in os.listdir(pdf_path) if f.lower().endswith('.pdf')]
         if not pdf_files: self.logger("Nessun PDF da comprimere.", 'WARNING'); return
-        self.logger(f"Trovati {len(pdf_files)} PDF da comprimere.")
+        compression_mode = self.app_config.firma_compression_mode.get()
+        use_batch = self.app_config.firma_gs_batch.get()
+        self.logger(f"Trovati {len(pdf_files)} PDF da comprimere (modalità: {compression_mode}{', batch' if use_batch else ''}).")
         gs_exe = self.app_config.firma_ghostscript_path.get()
-        for i, pdf_file in enumerate(pdf_files):
-            if cancel_event.is_set(): return
-            self.gui.after(0, self.update_progress, progress_offset + i + 1)
-            input_pdf = os.path.join(pdf_path, pdf_file)
-            temp_output_pdf = os.path.join(pdf_path, f"temp_{pdf_file}")
-            self.logger(f"Compressione: {pdf_file}", 'INFO')
-            args = [gs_exe, "-sDEVICE=pdfwrite", "-dCompatibilityLevel=1.4", "-dPDFSETTINGS=/ebook", "-dNOPAUSE", "-dBATCH", "-dQUIET", f"-sOutputFile={temp_output_pdf}", input_pdf]
-            try:
-                subprocess.run(args, check=True, capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW)
-                if os.path.exists(temp_output_pdf) and os.path.getsize(temp_output_pdf) > 100:
-                    os.remove(input_pdf); os.rename(temp_output_pdf, input_pdf)
-                    self.logger("Compressione OK.", 'SUCCESS')
-                else:
-                    self.logger("ERRORE: File compresso non valido.", 'ERROR')
-                    if os.path.exists(temp_output_pdf): os.remove(temp_output_pdf)
-            except subprocess.CalledProcessError as e:
-                self.logger(f"ERRORE Ghostscript: {e.stderr}", 'ERROR')
-                if os.path.exists(temp_output_pdf): os.remove(temp_output_pdf)
-            except Exception as e:
-                self.logger(f"ERRORE imprevisto compressione: {e}", 'ERROR')
-                if os.path.exists(temp_output_pdf): os.remove(temp_output_pdf)
-
-    def _col_to_num(self, col_str):
-        num = 0
-        for char in col_str: num = num * 26 + (ord(char.upper()) - ord('A')) + 1
-        return num
+        email_limit_bytes = self._get_email_limit_bytes()
+        jobs = [(os.path.join(pdf_path, f), choose_profile(os.path.getsize(os.path.join(pdf_path, f)), compression_mode, email_limit_bytes)) for f in pdf_files]
+        results = []
+        started = time.perf_counter()
+
+        def handle_result(result):
+            results.append(result)
+            self.run_metrics.add_bytes(written=result.output_size)
+            if result.error: self.run_metrics.add_error()
+            self.gui.after(0, self.update_progress, progress_offset + len(results))
+            self._set_pdf_size(os.path.join(pdf_path, result.file_name), result.output_size, is_final=True)
+            if result.error:
+                self.logger(f"ERRORE compressione {result.file_name}: {result.error}", 'ERROR')
+            elif result.profile == PROFILE_SKIP:
+                self.logger(f"{result.file_name}: file già leggero, compressione saltata.", 'INFO')
+            else:
+                self.size_model.observe(self._size_model_key(result.file_name, result.profile), result.input_size, result.output_size)
+                self.logger(f"Compressione OK: {result.file_name} (profilo {result.profile}).", 'SUCCESS')
+
+        _, processes = compress_pdfs(gs_exe, jobs, use_batch, cancel_event, handle_result)
+        elapsed = time.perf_counter() - started
+        self._log_compression_report(results)
+        if results and elapsed > 0:
+            self.logger(f"Prestazioni: {len(results)} PDF in {elapsed:.1f} s ({len(results) / elapsed:.2f} file/s) con {processes} processi Ghostscript.", "INFO")
+
+    def _log_compression_report(self, results):
+        if not results: return
+        self.logger("\n--- RIEPILOGO COMPRESSIONE ---", "HEADER")
+        for r in results:
+            status = f"ERRORE: {r.error}" if r.error else f"{r.input_size / 1024:.0f} KB -> {r.output_size / 1024:.0f} KB (rapporto {r.ratio:.2f})"
+            self.logger(f"- {r.file_name}: profilo {r.profile}, {r.seconds:.2f} s, {status}", "ERROR" if r.error else "INFO")
+        total_in = sum(r.input_size for r in results); total_out = sum(r.output_size for r in results)
+        self.logger(f"Totale: {total_in / 1048576:.2f} MB -> {total_out / 1048576:.2f} MB.", "SUCCESS")
+
+    def _get_email_limit_bytes(self):
+        try: return float(self.app_config.email_size_limit.get()) * 1024 * 1024
+        except (ValueError, TypeError): return None
+
+    def _size_model_key(self, pdf_file, profile):
+        # Ratios differ a lot between profiles, so non-standard ones are tracked apart.
+        model = self.pdf_models.get(pdf_file, "")
+        return model if profile == PROFILE_STANDARD else f"{model}|{profile}"
+
+    def _estimate_pdf_sizes(self):
+        """
+        Predicts the compressed size of every exported PDF, so that email drafts can be
+        planned while Ghostscript is still running. Estimates are replaced by the real
+        sizes as each file is compressed.
+        """
+        pdf_path = self.app_config.firma_pdf_dir.get()
+        compression_mode = self.app_config.firma_compression_mode.get()
+        email_limit_bytes = self._get_email_limit_bytes()
+        estimates = {}
+        with os.scandir(pdf_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith('.pdf'):
+                    input_size = entry.stat().st_size
+                    profile = choose_profile(input_size, compression_mode, email_limit_bytes)
+                    predicted = input_size if profile == PROFILE_SKIP else self.size_model.predict(self._size_model_key(entry.name, profile), input_size)
+                    estimates[entry.path] = (predicted, False)
+        with self._pdf_sizes_lock: self._pdf_sizes = estimates
+
+    def _set_pdf_size(self, pdf_file_path, size, is_final):
+        with self._pdf_sizes_lock: self._pdf_sizes[pdf_file_path] = (size, is_final)
+
+    def get_attachment_sizes(self):
+        """
+        Returns a snapshot of the known PDF sizes of the current run.
+
+        Returns:
+            tuple[list[tuple[str, int]], int]: (path, size) pairs sorted by path, and how
+            many of those sizes are still estimates.
+        """
+        with self._pdf_sizes_lock: snapshot = dict(self._pdf_sizes)
+        attachments = [(path, size) for path, (size, _) in sorted(snapshot.items())]
+        estimated_count = sum(1 for _, is_final in snapshot.values() if not is_final)
+        return attachments, estimated_count
@@ -0,0 +1,69 @@
+import json
+import os
+import threading
+
+
+class CompressionSizeModel:
+    """
+    Predicts the size of a PDF after Ghostscript compression from the input/output
+    size ratios observed in past runs, tracked separately for each template model.
+
+    Ratios are kept as exponentially decayed byte totals, so recent runs weigh more
+    than old ones and every real measurement refines the next prediction. The model
+    is persisted as a small JSON file next to the program configuration.
+    """
+    DEFAULT_RATIO = 0.5
+    DECAY = 0.9
+    ALL_MODELS_KEY = "*"
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.store_path):
+                with open(self.store_path, 'r') as f:
+                    self._stats = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            self._stats = {}
+
+    def save(self):
+        """Writes the current statistics back to disk. Returns False if they could not be written."""
+        with self._lock:
+            data = dict(self._stats)
+        try:
+            with open(self.store_path, 'w') as f:
+                json.dump(data, f, indent=4)
+            return True
+        except IOError:
+            return False
+
+    def ratio_for(self, model_key):
+        """
+        Returns the expected output/input ratio for a model, falling back to the
+        ratio across all models and then to DEFAULT_RATIO when there is no history.
+        """
+        with self._lock:
+            for key in (model_key, self.ALL_MODELS_KEY):
+                stats = self._stats.get(key)
+                if stats and stats["in"] > 0:
+                    return min(1.0, stats["out"] / stats["in"])
+        return self.DEFAULT_RATIO
+
+    def predict(self, model_key, input_size):
+        """Returns the predicted compressed size in bytes of a PDF of `input_size` bytes."""
+        return int(input_size * self.ratio_for(model_key))
+
+    def observe(self, model_key, input_size, output_size):
+        """Records a real compression result for `model_key`."""
+        if input_size <= 0:
+            return
+        with self._lock:
+            for key in {model_key or self.ALL_MODELS_KEY, self.ALL_MODELS_KEY}:
+                stats = self._stats.setdefault(key, {"in": 0.0, "out": 0.0, "count": 0})
+                stats["in"] = stats["in"] * self.DECAY + input_size
+                stats["out"] = stats["out"] * self.DECAY + output_size
+                stats["count"] += 1
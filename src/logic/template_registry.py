@@ -0,0 +1,104 @@
+import json
+import os
+import re
+import threading
+from src.utils import constants as const
+
+MODEL_KEY_REGEX = re.compile(r'[\W_]+')
+MATCH_EQUALS = "uguale"
+MATCH_CONTAINS = "contiene"
+
+
+def normalize_model_key(value):
+    """The one normalisation of model names: lower-case letters and digits only."""
+    if value is None: return ""
+    return MODEL_KEY_REGEX.sub('', str(value)).lower()
+
+
+class SheetTemplate:
+    """One layout of a model sheet, as described in the registry data file."""
+    __slots__ = ("key", "model_cells", "match", "sheet_name", "print_area", "signature_cell",
+                 "signature_size", "signature_offset", "odc_cells", "date_cells")
+
+    def __init__(self, data, defaults):
+        self.key = normalize_model_key(data["chiave"])
+        self.model_cells = tuple(data.get("celle_modello", defaults["celle_modello"]))
+        self.match = data.get("corrispondenza", MATCH_EQUALS)
+        self.sheet_name = data.get("foglio")
+        self.print_area = data.get("area_stampa")
+        self.signature_cell = data.get("cella_firma")
+        self.signature_size = tuple(data.get("dimensioni_firma", (150, 50)))
+        self.signature_offset = tuple(data.get("scostamento_firma", (0, 0)))
+        self.odc_cells = tuple(data.get("celle_odc", defaults["celle_odc"]))
+        self.date_cells = tuple(data.get("celle_data", ()))
+
+    def matches(self, model_value):
+        if not model_value: return False
+        return self.key in model_value if self.match == MATCH_CONTAINS else self.key == model_value
+
+
+class TemplateRegistry:
+    """
+    The model sheets known to the application, loaded once from a JSON data file.
+
+    Templates are kept in file order, which is the order the renaming checks them in
+    (first match wins), and indexed by normalised model key for the signature and
+    printing pipelines. Only templates with a print area are indexed; the first one
+    for a key wins. A new model only needs a new entry in the data file.
+    """
+    def __init__(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        defaults = {"celle_modello": data["celle_modello"], "celle_odc": data["celle_odc"]}
+        self.model_cells = tuple(data["celle_modello"])
+        self.default_odc_cells = tuple(data["celle_odc"])
+        self.default_date_cells = tuple(data["celle_data"])
+        self.templates = [SheetTemplate(entry, defaults) for entry in data["modelli"]]
+        self._by_key = {}
+        for template in self.templates:
+            if template.print_area: self._by_key.setdefault(template.key, template)
+        self._date_rules = [t for t in self.templates if t.date_cells]
+        # Every cell the renaming needs, so a workbook is read once in a single pass.
+        cells = [c for t in self._date_rules for c in t.model_cells + t.date_cells] + list(self.default_date_cells)
+        self.date_lookup_cells = tuple(dict.fromkeys(cells))
+        # Every cell any pipeline reads: model, dates and ODC, for single-pass readers.
+        odc_cells = [c for t in self.templates for c in t.odc_cells] + list(self.default_odc_cells)
+        self.all_cells = tuple(dict.fromkeys(list(self.model_cells) + list(self.date_lookup_cells) + odc_cells))
+
+    def get(self, model_key):
+        """Returns the printable template of a normalised model key, or None."""
+        return self._by_key.get(model_key)
+
+    def model_key_from(self, cell_values):
+        """Returns the normalised model name of a sheet: the first non-empty model cell."""
+        return next((key for key in (normalize_model_key(cell_values.get(c)) for c in self.model_cells) if key), "")
+
+    def odc_cells_for(self, model_key):
+        template = self.get(model_key)
+        return template.odc_cells if template else self.default_odc_cells
+
+    def date_cells_for(self, cell_values):
+        """
+        Returns the cells holding the emission date, in order of preference.
+
+        Args:
+            cell_values (dict): Cell reference -> value, for at least `date_lookup_cells`.
+        """
+        normalized = {}
+        for template in self._date_rules:
+            model_value = next((v for v in (normalized.setdefault(c, normalize_model_key(cell_values.get(c))) for c in template.model_cells) if v), "")
+            if template.matches(model_value): return template.date_cells
+        return self.default_date_cells
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_template_registry():
+    """Returns the registry shared by every processor, loading the data file on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TemplateRegistry(os.path.join(const.APPLICATION_PATH, 'src', 'assets', const.TEMPLATE_REGISTRY_FILE_NAME))
+        return _registry
@@ -0,0 +1,174 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from src.logic.template_registry import get_template_registry
+
+
+def extract_date_from_value(value: any) -> tuple[str, datetime | None]:
+    if value is None or (isinstance(value, str) and not value.strip()): return 'EMPTY', None
+    if hasattr(value, 'year') and hasattr(value, 'month') and hasattr(value, 'day'):
+        try: return 'VALID', datetime(value.year, value.month, value.day)
+        except Exception: pass
+    if isinstance(value, str):
+        date_str = value.strip()
+        if not date_str: return 'EMPTY', None
+        range_match = re.match(r'^\d{1,2}\s*-\s*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', date_str)
+        if range_match: date_str = range_match.group(1)
+        date_str = date_str.split('&')[0].strip()
+        if not date_str: return 'EMPTY', None
+        date_formats = ("%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%m/%d/%y", "%y-%m-%d", "%d-%m-%y", "%d.%m.%y")
+        for fmt in date_formats:
+            try:
+                dt_obj = datetime.strptime(date_str, fmt)
+                if dt_obj.year < 100:
+                    current_year_base = datetime.now().year // 100 * 100; year_adjusted = current_year_base + dt_obj.year
+                    if year_adjusted > datetime.now().year + 20: year_adjusted -= 100
+                    dt_obj = dt_obj.replace(year=year_adjusted)
+                return 'VALID', dt_obj
+            except ValueError: continue
+        return 'TYPO', None
+    return 'EMPTY', None
+
+
+def normalize_odc(value):
+    """
+    Returns the ODC read from a cell as text: numbers without decimals (Excel stores
+    them as floats), strings trimmed. Returns None for empty cells and for "NA".
+    """
+    odc_s = str(int(value)) if isinstance(value, (int, float)) else (value.strip() if isinstance(value, str) else "")
+    return odc_s if odc_s and odc_s.upper() != "NA" else None
+
+
+def find_emission_date(templates, cell_values):
+    """Returns the first valid date among the template's date cells, or None."""
+    for cell_ref in templates.date_cells_for(cell_values):
+        status, date_found = extract_date_from_value(cell_values.get(cell_ref))
+        if status == 'VALID': return date_found
+    return None
+
+
+class WorkbookMetadata:
+    """What the processors need to know about a workbook, read in one open."""
+    __slots__ = ("model", "date", "odc", "sheet_names", "protected")
+
+    def __init__(self, model, date, odc, sheet_names, protected):
+        self.model = model
+        self.date = date
+        self.odc = odc
+        self.sheet_names = sheet_names
+        self.protected = protected
+
+
+class WorkbookMetadataExtractor:
+    """
+    Reads the model, emission date, ODC, sheet names and protection of workbooks.
+
+    The first sheet is read once for the union of the cells any processor looks at
+    (`TemplateRegistry.all_cells`), so renaming, organizing, printing and signing no
+    longer open the same workbook each for their own cells. Records are cached in
+    memory by path, size and modification time: a workbook that has not changed is
+    not opened again for its metadata, and a rename (which keeps both) carries the
+    record over with `moved`.
+    """
+    MAX_ENTRIES = 4096
+
+    def __init__(self, templates):
+        self.templates = templates
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return os.path.normcase(os.path.abspath(path)), st.st_size, st.st_mtime_ns
+
+    def cached(self, path):
+        """Returns the cached record of the current version of `path`, or None."""
+        try: key = self._key(path)
+        except OSError: return None
+        with self._lock:
+            record = self._cache.get(key)
+            if record is not None: self._cache.move_to_end(key)
+            return record
+
+    def _store(self, path, record):
+        try: key = self._key(path)
+        except OSError: return
+        with self._lock:
+            self._cache[key] = record
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.MAX_ENTRIES: self._cache.popitem(last=False)
+
+    def read(self, wb, path, opened_with_password=False):
+        """
+        Reads the metadata of a workbook that is already open and caches it.
+
+        Args:
+            wb: The open Excel workbook.
+            path (str): The source file the workbook was opened from (or a copy of).
+            opened_with_password (bool): True if opening it required the password.
+
+        Returns:
+            WorkbookMetadata: The record.
+        """
+        ws = wb.Worksheets(1)
+        values = {ref: ws.Range(ref).Value for ref in self.templates.all_cells}
+        model = self.templates.model_key_from(values)
+        odc = next((values[c] for c in self.templates.odc_cells_for(model) if values.get(c) is not None and str(values[c]).strip() != ""), None)
+        sheet_names = tuple(sys.intern(str(s.Name)) for s in wb.Worksheets)
+        protected = opened_with_password or bool(wb.ProtectStructure) or bool(ws.ProtectContents)
+        record = WorkbookMetadata(sys.intern(model), find_emission_date(self.templates, values), odc, sheet_names, protected)
+        self._store(path, record)
+        return record
+
+    def extract(self, excel, path, read_path=None, password=None):
+        """
+        Returns the metadata of `path`, opening it read-only only if it is not cached.
+
+        Args:
+            excel: The Excel application (from ExcelHandler).
+            path (str): The workbook, as the caller knows it (the cache key).
+            read_path (str, optional): A local copy to open instead of `path`.
+            password (str, optional): Tried if the plain open fails.
+
+        Returns:
+            WorkbookMetadata: The record.
+        """
+        record = self.cached(path)
+        if record is not None: return record
+        wb = None
+        try:
+            try:
+                wb = excel.Workbooks.Open(read_path or path, ReadOnly=True)
+                with_password = False
+            except Exception:
+                if not password: raise
+                wb = excel.Workbooks.Open(read_path or path, ReadOnly=True, Password=password)
+                with_password = True
+            return self.read(wb, path, with_password)
+        finally:
+            if wb: wb.Close(SaveChanges=False)
+
+    def moved(self, old_path, new_path):
+        """Carries the record of a renamed file over to its new path."""
+        old_norm = os.path.normcase(os.path.abspath(old_path))
+        with self._lock:
+            old_key = next((k for k in self._cache if k[0] == old_norm), None)
+            record = self._cache.pop(old_key) if old_key else None
+        if record is not None: self._store(new_path, record)
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def get_metadata_extractor():
+    """Returns the extractor shared by every processor, so its cache is shared too."""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = WorkbookMetadataExtractor(get_template_registry())
+        return _extractor
@@ -25,6 +25,8 @@ class ConfigManager:
 
         self.defaults = {
             "firma_ghostscript_path": const.DEFAULT_GHOSTSCRIPT_PATH,
+            "firma_compression_mode": "Standard",
+            "firma_gs_batch": False,
             "rinomina_path": os.path.join(const.APPLICATION_PATH, const.RINOMINA_DEFAULT_DIR),
             "rinomina_password": "coemi", # Default password
             "organizza_source_dir": organize_default_path,
@@ -33,13 +35,23 @@ class ConfigManager:
             "canoni_messina_num": "",
             "canoni_naselli_num": "",
             "canoni_caldarella_num": "",
+            "canoni_tcl_names": list(const.CANONI_TCL_NAMES),
             "canoni_word_path": const.CANONI_WORD_DEFAULT_PATH,
+            "canoni_prefetch": True,
             "selected_printer": "",
+            "organizza_bundle_pdf": False,
+            "stampa_batch": False,
+            "stampa_backend": "stampante",
+            "watch_folders": False,
+            "profile_next_run": False,
+            "archivio_dir": const.ORGANIZZA_BASE_DIR,
             "email_to": "",
             "email_subject": "Documenti Firmati",
             "email_tcl": "",
             "email_is_formal": False,
-            "email_size_limit": "6"
+            "email_size_limit": "6",
+            "email_group_by": "Nessuno",
+            "email_backend": "outlook"
         }
 
     def load(self):
@@ -19,7 +19,22 @@ ORGANIZZA_DEST_DIR = "SCHEDE ORGANIZZATE"
 
 RINOMINA_DEFAULT_DIR = "SCHEDE SENZA DATA"
 
+PRINT_SPOOL_DIR = "SPOOL STAMPA"
+EMAIL_DRAFTS_DIR = "BOZZE EMAIL"
+LOG_DIR = "LOG"
+
+LOCAL_CACHE_DIR = "CACHE LOCALE"
+LOCAL_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+PDF_RENDER_CACHE_DIR = "CACHE PDF"
+PRESIGNED_PDF_CACHE_DIR = "CACHE PDF FIRMATI"
+DERIVED_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+WATCH_POLL_SECONDS = 30
+
 CONFIG_FILE_NAME = "config_programma.json"
+SIZE_MODEL_FILE_NAME = "modello_dimensioni_pdf.json"
+TEMPLATE_REGISTRY_FILE_NAME = "modelli_schede.json"
+METRICS_DB_FILE_NAME = "storico_esecuzioni.sqlite"
+ARCHIVE_INDEX_FILE_NAME = "indice_archivio.sqlite"
 
 # --- NETWORK AND EXTERNAL PATHS ---
 # These are unlikely to change but are kept here for centralization
@@ -38,6 +53,9 @@ MESI_GIORNALIERA_MAP = {
 NOMI_MESI_ITALIANI = list(MESI_GIORNALIERA_MAP.keys())
 
 DEFAULT_MACRO_NAME = "Modulo42.StampaFogli"
+# TCLs whose monthly canone consuntivo is searched automatically. Extra names can be
+# added through "canoni_tcl_names" in the configuration file.
+CANONI_TCL_NAMES = ["MESSINA", "NASELLI", "CALDARELLA"]
 
 # --- Email Feature Constants ---
 TCL_CONTACTS = {
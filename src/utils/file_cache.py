@@ -0,0 +1,243 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from . import constants as const
+
+
+class _SizeCappedCache:
+    """
+    Keeps the files of a cache folder under `max_bytes`, evicting the least recently
+    used ones. The usage is seeded from the folder the first time it is needed, oldest
+    access first, and updated by `_touch` whenever a file is written or reused.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._guard = threading.Lock()
+        self._usage = None
+        self._total_bytes = 0
+
+    def _load_usage(self):
+        # Must be called with the guard held. Seeds the LRU order from the files on disk.
+        if self._usage is not None:
+            return
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                # Files still being written ('x.part', 'x.part.pdf') are not entries yet.
+                if name.endswith(".part") or ".part." in name: continue
+                path = os.path.join(root, name)
+                try: st = os.stat(path)
+                except OSError: continue
+                found.append((st.st_atime, path, st.st_size))
+        self._usage = OrderedDict((path, size) for _, path, size in sorted(found))
+        self._total_bytes = sum(self._usage.values())
+
+    def _touch(self, local_path, size):
+        with self._guard:
+            self._load_usage()
+            self._total_bytes += size - self._usage.pop(local_path, 0)
+            self._usage[local_path] = size
+            self._evict(keep=local_path)
+
+    def _evict(self, keep):
+        # Must be called with the guard held. Files still open in Office cannot be
+        # removed on Windows; they are skipped and retried on a later eviction.
+        for path in list(self._usage):
+            if self._total_bytes <= self.max_bytes: break
+            if path == keep: continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._total_bytes -= self._usage.pop(path)
+
+
+class LocalFileCache(_SizeCappedCache):
+    """
+    A local read-through cache for files that live on the network share.
+
+    A copy is valid while its size and modification time match the source; `shutil.copy2`
+    preserves the source mtime, so validating a cached file costs one `stat` on the share
+    instead of a full transfer. Copies keep their original file name (inside a folder
+    derived from the source directory), so Office still sees the same workbook names.
+
+    Only paths under `remote_roots` are cached; anything else resolves to itself. The
+    total size of the cache is kept under `max_bytes` by evicting the least recently
+    used copies. Tests can pass a local directory as the remote root.
+    """
+    MTIME_TOLERANCE = 0.01
+
+    def __init__(self, cache_dir, max_bytes, remote_roots=()):
+        super().__init__(cache_dir, max_bytes)
+        self.remote_roots = [os.path.normcase(os.path.abspath(root)).rstrip("\\/") for root in remote_roots]
+        self._locks = {}
+
+    def is_remote(self, path):
+        """True if `path` lies under one of the configured remote roots."""
+        norm = os.path.normcase(os.path.abspath(path))
+        return any(norm == root or norm.startswith(root + os.sep) for root in self.remote_roots)
+
+    def local_path_for(self, source_path):
+        """Returns where the local copy of `source_path` is (or would be) stored."""
+        source_dir, file_name = os.path.split(os.path.abspath(source_path))
+        dir_hash = hashlib.sha1(os.path.normcase(source_dir).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, dir_hash, file_name)
+
+    def _lock_for(self, local_path):
+        with self._guard:
+            return self._locks.setdefault(local_path, threading.Lock())
+
+    @classmethod
+    def _is_valid(cls, local_path, source_stat):
+        try:
+            local_stat = os.stat(local_path)
+        except OSError:
+            return False
+        return local_stat.st_size == source_stat.st_size and abs(local_stat.st_mtime - source_stat.st_mtime) < cls.MTIME_TOLERANCE
+
+    def fetch(self, source_path):
+        """
+        Returns the path of an up-to-date local copy of `source_path`, copying it first
+        if needed. Raises OSError if the source cannot be read.
+        """
+        local_path = self.local_path_for(source_path)
+        with self._lock_for(local_path):
+            source_stat = os.stat(source_path)
+            if not self._is_valid(local_path, source_stat):
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                # Copy next to the target and swap it in, so a half-written file is never used.
+                temp_path = f"{local_path}.part"
+                shutil.copy2(source_path, temp_path)
+                os.replace(temp_path, local_path)
+            self._touch(local_path, source_stat.st_size)
+            return local_path
+
+    def resolve(self, path):
+        """
+        The single path-resolution entry point for readers: returns a local copy for
+        files on the share and `path` itself for local files or when copying fails.
+        """
+        if not self.is_remote(path):
+            return path
+        try:
+            return self.fetch(path)
+        except OSError:
+            return path
+
+    def prefetch(self, source_paths, max_workers=4):
+        """
+        Starts resolving `source_paths` concurrently.
+
+        Returns:
+            dict: source path -> Future resolving to the local path (or raising OSError).
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            return {path: executor.submit(self.fetch if self.is_remote(path) else os.path.abspath, path) for path in dict.fromkeys(source_paths)}
+        finally:
+            # Let the copies finish in the background without blocking the caller.
+            executor.shutdown(wait=False)
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Returns the cache instance shared by every processor of the application."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = LocalFileCache(
+                os.path.join(const.APPLICATION_PATH, const.LOCAL_CACHE_DIR),
+                const.LOCAL_CACHE_MAX_BYTES,
+                remote_roots=[const.CANONI_GIORNALIERA_BASE_DIR, const.CANONI_CONSUNTIVI_BASE_DIR, const.ORGANIZZA_BASE_DIR],
+            )
+        return _shared_cache
+
+
+class DerivedFileCache(_SizeCappedCache):
+    """
+    Stores files derived from a source file, such as the PDF export of a workbook.
+
+    Entries are keyed by the source path, size and modification time, so a derived file
+    is reused as long as its source is unchanged and silently ignored once it changes.
+    Writers create the file at `path_for` and then `store` it; like the local cache, the
+    folder is kept under `max_bytes` by evicting the least recently used files, which
+    also clears out the entries of sources that changed.
+    """
+    def __init__(self, cache_dir, max_bytes=const.DERIVED_CACHE_MAX_BYTES):
+        super().__init__(cache_dir, max_bytes)
+
+    @staticmethod
+    def _digest(source_path, st):
+        key = f"{os.path.normcase(os.path.abspath(source_path))}|{st.st_size}|{st.st_mtime_ns}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def path_for(self, source_path, suffix):
+        """Returns where the derived file of the current version of `source_path` lives."""
+        digest = self._digest(source_path, os.stat(source_path))
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}{suffix}")
+
+    def moved(self, old_path, new_path):
+        """
+        Carries the derived files of a renamed source over to its new path, whatever
+        their suffix. A rename keeps the size and modification time, so the old entries
+        are found from the stat of the new path.
+        """
+        try: st = os.stat(new_path)
+        except OSError: return
+        old_digest, new_digest = self._digest(old_path, st), self._digest(new_path, st)
+        old_dir = os.path.join(self.cache_dir, old_digest[:2])
+        try: names = [n for n in os.listdir(old_dir) if n.startswith(old_digest) and ".part" not in n]
+        except OSError: return
+        for name in names:
+            old_file = os.path.join(old_dir, name)
+            new_file = os.path.join(self.cache_dir, new_digest[:2], new_digest + name[len(old_digest):])
+            try:
+                os.makedirs(os.path.dirname(new_file), exist_ok=True)
+                os.replace(old_file, new_file)
+            except OSError:
+                continue
+            with self._guard:
+                if self._usage is not None and old_file in self._usage:
+                    self._usage[new_file] = self._usage.pop(old_file)
+
+    def store(self, path):
+        """Records a derived file just written at `path_for`, evicting old ones if the cache is full."""
+        self._touch(path, os.path.getsize(path))
+
+    def lookup(self, source_path, suffix):
+        """Returns the cached derived file of `source_path`, or None if there is none."""
+        try:
+            path = self.path_for(source_path, suffix)
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        self._touch(path, size)
+        return path
+
+
+_derived_caches = {}
+_derived_caches_lock = threading.Lock()
+
+
+def get_derived_cache(dir_name):
+    """Returns the derived-file cache stored in `dir_name` next to the application, one instance per folder."""
+    with _derived_caches_lock:
+        cache = _derived_caches.get(dir_name)
+        if cache is None:
+            cache = _derived_caches[dir_name] = DerivedFileCache(os.path.join(const.APPLICATION_PATH, dir_name))
+        return cache
+
+
+def derived_files_moved(old_path, new_path):
+    """Carries the PDF exports and pre-signed PDFs of a renamed workbook over to its new path."""
+    for dir_name in (const.PDF_RENDER_CACHE_DIR, const.PRESIGNED_PDF_CACHE_DIR):
+        get_derived_cache(dir_name).moved(old_path, new_path)
@@ -0,0 +1,239 @@
+import argparse
+import os
+import sys
+import time
+from array import array
+from . import constants as const
+
+EXCEL_EXTENSIONS = ('.xls', '.xlsx', '.xlsm', '.xlsb')
+
+STATUS_PENDING = 0
+STATUS_DONE = 1
+STATUS_SKIPPED = 2
+STATUS_ERROR = 3
+
+
+class FileInventory:
+    """
+    A compact list of files, for scans of tens of thousands of workbooks.
+
+    Instead of one full path string per file, each folder is stored once (interned)
+    and the files are kept in typed columns: folder index, name (UTF-8 bytes in one
+    shared buffer), size, modification time and a status byte. A file costs about
+    the length of its name plus 30 bytes, against a few hundred for a path string
+    plus the tuples and dicts usually built around it.
+
+    Files are addressed by their index; iterating yields the full paths, built on
+    demand.
+    """
+    def __init__(self):
+        self._dirs = []
+        self._dir_index = {}
+        self._dir_of = array('I')
+        self._names = bytearray()
+        self._name_start = array('Q')
+        self._name_len = array('H')
+        self._sizes = array('q')
+        self._mtimes = array('q')
+        self._status = bytearray()
+
+    @classmethod
+    def scan(cls, root, extensions=EXCEL_EXTENSIONS, recursive=True, cancel_event=None):
+        """
+        Lists the files of `root` whose name ends with one of `extensions`, skipping
+        Office lock files ('~$...'). Sizes and times come from the directory listing,
+        so no file is opened. Returns what was found so far if `cancel_event` is set.
+        Unreadable subfolders are skipped, as `os.walk` does; an unreadable `root` raises OSError.
+        """
+        inventory = cls()
+        stack = [root]
+        while stack:
+            if cancel_event is not None and cancel_event.is_set(): break
+            folder = stack.pop()
+            subfolders = []
+            try:
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive: subfolders.append(entry.path)
+                            continue
+                        name = entry.name
+                        if name.startswith('~') or not name.lower().endswith(extensions): continue
+                        try: st = entry.stat()
+                        except OSError: continue
+                        inventory.add(folder, name, st.st_size, st.st_mtime_ns)
+            except OSError:
+                if folder == root: raise
+                continue
+            # Reversed, so folders are visited in listing order.
+            stack.extend(reversed(subfolders))
+        return inventory
+
+    def add(self, directory, name, size=0, mtime_ns=0):
+        """Appends a file and returns its index."""
+        self._dir_of.append(self._intern_dir(directory))
+        self._append_name(name)
+        self._sizes.append(size)
+        self._mtimes.append(mtime_ns)
+        self._status.append(STATUS_PENDING)
+        return len(self._sizes) - 1
+
+    def _intern_dir(self, directory):
+        index = self._dir_index.get(directory)
+        if index is None:
+            index = self._dir_index[directory] = len(self._dirs)
+            self._dirs.append(sys.intern(directory))
+        return index
+
+    def _append_name(self, name, index=None):
+        encoded = name.encode('utf-8')
+        start = len(self._names)
+        self._names += encoded
+        if index is None:
+            self._name_start.append(start); self._name_len.append(len(encoded))
+        else:
+            self._name_start[index] = start; self._name_len[index] = len(encoded)
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __bool__(self):
+        return len(self._sizes) > 0
+
+    def __iter__(self):
+        for i in range(len(self._sizes)): yield self.path(i)
+
+    def name(self, i):
+        start = self._name_start[i]
+        return self._names[start:start + self._name_len[i]].decode('utf-8')
+
+    def directory(self, i):
+        return self._dirs[self._dir_of[i]]
+
+    def path(self, i):
+        return os.path.join(self._dirs[self._dir_of[i]], self.name(i))
+
+    def size(self, i):
+        return self._sizes[i]
+
+    def mtime_ns(self, i):
+        return self._mtimes[i]
+
+    def status(self, i):
+        return self._status[i]
+
+    def set_status(self, i, status):
+        self._status[i] = status
+
+    def moved(self, i, new_path):
+        """Records that file `i` was renamed or moved to `new_path`."""
+        directory, name = os.path.split(new_path)
+        self._dir_of[i] = self._intern_dir(directory)
+        # The old name stays in the buffer: renames are few next to the files listed.
+        self._append_name(name, i)
+
+    def count(self, status):
+        return self._status.count(status)
+
+    @property
+    def total_size(self):
+        return sum(self._sizes)
+
+    @property
+    def folder_count(self):
+        return len(self._dirs)
+
+
+class ErrorLog:
+    """
+    Collects the errors of a run in a text file instead of in memory.
+
+    Each error is written (and flushed) as it happens, one tab-separated line per
+    error, so long runs keep flat memory and the list survives a crash. Only the
+    first `keep` errors are held for the summary shown in the log widget; the file is
+    only created when the first error arrives.
+    """
+    def __init__(self, pipeline, keep=20, log_dir=None):
+        log_dir = log_dir or os.path.join(const.APPLICATION_PATH, const.LOG_DIR)
+        self.path = os.path.join(log_dir, f"errori_{pipeline.replace(' ', '_')}_{time.strftime('%Y%m%d-%H%M%S')}.txt")
+        self.keep = keep
+        self.first = []
+        self.count = 0
+        self._file = None
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def add(self, name, message):
+        self.count += 1
+        if len(self.first) < self.keep: self.first.append((name, message))
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(f"{time.strftime('%H:%M:%S')}\t{name}\t{' '.join(str(message).split())}\n")
+        except OSError:
+            # A log that cannot be written still keeps the count and the first errors.
+            pass
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def log_summary(self, logger):
+        """Logs the kept errors and where to find the rest."""
+        for name, message in self.first: logger(f"- {name}: {message}", "ERROR")
+        if self.count > len(self.first):
+            logger(f"... e altri {self.count - len(self.first)} errori.", "ERROR")
+        if self._file is not None or os.path.isfile(self.path):
+            logger(f"Elenco completo degli errori: {self.path}", "INFO")
+
+
+def _benchmark(count):
+    import tempfile
+    import tracemalloc
+    # Paths shaped like the archive: year / month / ODC folder / workbook.
+    folders = [os.path.join(const.ORGANIZZA_BASE_DIR, "2024", f"{m:02d} - MESE", f"ODC {o:05d}") for m in range(1, 13) for o in range(max(1, count // 240))]
+    files = [(folders[i % len(folders)], f"Scheda strumentale {i:06d} - 12-03-2024.xlsx", 45_000 + i, 1_700_000_000_000_000_000 + i) for i in range(count)]
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    paths = [os.path.join(d, n) for d, n, _, _ in files]
+    stats = [(s, m, STATUS_PENDING) for _, _, s, m in files]
+    errors = [(os.path.basename(p), f"Dettagli: errore di prova su {p}") for p in paths[::10]]
+    as_lists = tracemalloc.get_traced_memory()[0] - baseline
+    del paths, stats, errors
+
+    baseline = tracemalloc.get_traced_memory()[0]
+    inventory = FileInventory()
+    for d, n, s, m in files: inventory.add(d, n, s, m)
+    error_log = ErrorLog("benchmark", log_dir=tempfile.gettempdir())
+    for i in range(0, count, 10): error_log.add(inventory.name(i), f"Dettagli: errore di prova su {inventory.path(i)}")
+    error_log.close()
+    as_inventory = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    os.remove(error_log.path)
+
+    print(f"{count} file in {inventory.folder_count} cartelle, {count // 10} errori")
+    print(f"  percorsi + tuple dati + tuple errori:    {as_lists / (1024 * 1024):8.1f} MB ({as_lists / count:.0f} byte/file)")
+    print(f"  FileInventory + ErrorLog su disco:       {as_inventory / (1024 * 1024):8.1f} MB ({as_inventory / count:.0f} byte/file)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Confronta la memoria usata da un inventario di file come liste di percorsi e come FileInventory.")
+    parser.add_argument("--file", type=int, default=100_000, help="quanti file simulare (predefinito: 100000)")
+    _benchmark(parser.parse_args(argv).file)
+
+
+if __name__ == "__main__":
+    main()
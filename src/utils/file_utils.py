@@ -1,5 +1,8 @@
 import os
+import re
 import shutil
+import threading
+import time
 
 def clear_folder_content(folder_path, logger, folder_display_name=None):
     """
@@ -26,3 +29,111 @@ def clear_folder_content(folder_path, logger, folder_display_name=None):
             except Exception as e:
                 logger(f"Impossibile eliminare '{item_name}': {e}", 'ERROR')
     logger(f"--- Pulizia di '{folder_display_name}' completata. ---", 'SUCCESS')
+
+
+def backup_folder(folder_path, logger):
+    """
+    Copies a non-empty folder next to itself, as '<folder>_backup_<timestamp>', before
+    it is cleared and rebuilt.
+
+    Args:
+        folder_path (str): The folder to back up.
+        logger (function): A logging function to log messages.
+
+    Returns:
+        str: The path of the backup, or "" if the folder is missing or empty.
+
+    Raises:
+        OSError: If the copy fails; the caller must not clear the folder then.
+    """
+    if not (os.path.isdir(folder_path) and os.listdir(folder_path)): return ""
+    backup_dir = f"{folder_path}_backup_{time.strftime('%Y%m%d-%H%M%S')}"
+    logger(f"Creazione backup: {os.path.basename(backup_dir)}", "INFO")
+    shutil.copytree(folder_path, backup_dir)
+    return backup_dir
+
+
+def restore_folder_backup(folder_path, backup_dir, logger):
+    """
+    Puts back a folder saved by `backup_folder`, discarding what was written since.
+    Does nothing if there is no backup.
+    """
+    if not backup_dir or not os.path.isdir(backup_dir): return
+    logger("ANNULLAMENTO/ERRORE: Ripristino cartella dal backup.", "WARNING")
+    clear_folder_content(folder_path, logger)
+    shutil.rmtree(folder_path)
+    os.rename(backup_dir, folder_path)
+    logger("Ripristino completato.", "SUCCESS")
+
+
+class UniqueNameRegistry:
+    """
+    Hands out collision-free file paths without probing the disk for every candidate.
+
+    Each directory is listed once with a single `scandir` the first time a path in it
+    is requested; from then on the registry is kept up to date in memory as names are
+    reserved and released. All operations are guarded by a lock, so several workers
+    can allocate names in the same folder concurrently.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names_by_dir = {}
+        self._next_counter = {}
+
+    def _names_for(self, directory):
+        # Must be called with the lock held.
+        dir_key = os.path.normcase(os.path.abspath(directory))
+        names = self._names_by_dir.get(dir_key)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        names.add(entry.name.lower())
+            except OSError:
+                pass
+            self._names_by_dir[dir_key] = names
+        return dir_key, names
+
+    def reserve(self, filepath):
+        """
+        Returns `filepath`, or the first free "name (N).ext" variant of it, and marks
+        the returned name as taken.
+
+        Args:
+            filepath (str): The desired target path.
+        """
+        directory, filename = os.path.split(filepath)
+        base, ext = os.path.splitext(filename)
+        with self._lock:
+            dir_key, names = self._names_for(directory)
+            if filename.lower() not in names:
+                names.add(filename.lower())
+                return filepath
+            # Resume from the last counter handed out for this name, so long runs of
+            # duplicates do not rescan "(1)", "(2)", ... on every call.
+            counter_key = (dir_key, base.lower(), ext.lower())
+            counter = self._next_counter.get(counter_key, 1)
+            while f"{base} ({counter}){ext}".lower() in names:
+                counter += 1
+            self._next_counter[counter_key] = counter + 1
+            new_filename = f"{base} ({counter}){ext}"
+            names.add(new_filename.lower())
+            return os.path.join(directory, new_filename)
+
+    def release(self, filepath):
+        """
+        Marks the name of `filepath` as free again, e.g. after the file has been
+        renamed away or a reserved name was not used.
+        """
+        directory, filename = os.path.split(filepath)
+        stem, ext = os.path.splitext(filename)
+        suffix = re.match(r'^(.*) \((\d+)\)$', stem)
+        with self._lock:
+            dir_key, names = self._names_for(directory)
+            names.discard(filename.lower())
+            if suffix:
+                # A freed "(N)" is handed out again before higher ones, as a probe from "(1)" would.
+                counter_key = (dir_key, suffix.group(1).lower(), ext.lower())
+                counter = int(suffix.group(2))
+                if counter < self._next_counter.get(counter_key, 1): self._next_counter[counter_key] = counter
@@ -0,0 +1,137 @@
+import os
+import threading
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog is optional: polling alone is enough.
+    FileSystemEventHandler = object
+    Observer = None
+
+EXCEL_EXTENSIONS = ('.xls', '.xlsx', '.xlsm', '.xlsb')
+
+
+class _WakeHandler(FileSystemEventHandler):
+    def __init__(self, wake_event):
+        super().__init__()
+        self.wake_event = wake_event
+
+    def on_any_event(self, event):
+        self.wake_event.set()
+
+
+class FolderWatcher:
+    """
+    Reports the workbooks that appear (or change) in a set of folders.
+
+    The folders are polled with `os.scandir`, which works on network shares where
+    change notifications are unreliable. A file is reported once its size and
+    modification time are the same on two consecutive polls, so workbooks still being
+    copied are not picked up half-written. When the optional `watchdog` package is
+    installed its events only trigger an earlier poll.
+
+    `callback(folder, paths)` is called from the watcher thread. Folders are taken
+    from `folders_fn()` at every poll, so changing them in the GUI needs no restart.
+    """
+    SETTLE_SECONDS = 5.0
+
+    def __init__(self, folders_fn, callback, interval=30.0, extensions=EXCEL_EXTENSIONS):
+        self.folders_fn = folders_fn
+        self.callback = callback
+        self.interval = interval
+        self.extensions = extensions
+        self._seen = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._observer = None
+        self._observed = ()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            if not self._stop.is_set(): return
+            self._thread.join(timeout=5)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        self._stop_observer()
+
+    def forget(self, paths):
+        """Makes `paths` count as new again, so they are reported at a later poll."""
+        with self._lock:
+            for path in paths: self._seen.pop(path, None)
+
+    def _scan(self, folder):
+        found = {}
+        stack = [folder]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False): stack.append(entry.path); continue
+                        if entry.name.startswith('~') or not entry.name.lower().endswith(self.extensions): continue
+                        try: st = entry.stat()
+                        except OSError: continue
+                        found[entry.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        return found
+
+    def _poll(self, folders):
+        reports = []
+        with self._lock:
+            seen, pending = {}, {}
+            for folder in folders:
+                for path, signature in self._scan(folder).items():
+                    if self._seen.get(path) == signature or self._pending.get(path) == signature:
+                        if self._seen.get(path) != signature: reports.append((folder, path))
+                        seen[path] = signature
+                    else:
+                        pending[path] = signature
+            # Rebuilt from the scan, so deleted files are dropped from both.
+            self._seen, self._pending = seen, pending
+        by_folder = {}
+        for folder, path in reports: by_folder.setdefault(folder, []).append(path)
+        for folder, paths in by_folder.items():
+            try: self.callback(folder, sorted(paths))
+            except Exception: pass
+
+    def _update_observer(self, folders):
+        if Observer is None or tuple(folders) == self._observed: return
+        self._stop_observer()
+        try:
+            self._observer = Observer()
+            for folder in folders: self._observer.schedule(_WakeHandler(self._wake), folder, recursive=True)
+            self._observer.daemon = True
+            self._observer.start()
+            self._observed = tuple(folders)
+        except Exception:
+            # Shares that refuse notifications fall back to polling alone.
+            self._observer = None
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            try: self._observer.stop()
+            except Exception: pass
+        self._observer = None
+        self._observed = ()
+
+    def _run(self):
+        while not self._stop.is_set():
+            folders = [f for f in self.folders_fn() if f and os.path.isdir(f)]
+            self._update_observer(folders)
+            self._poll(folders)
+            # Files seen changing get their second look soon; otherwise wait for the
+            # next poll, or for an event when watchdog is available.
+            self._wake.wait(min(self.SETTLE_SECONDS, self.interval) if self._pending else self.interval)
+            self._wake.clear()
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from . import constants as const
+
+STATUS_DONE = "completato"
+STATUS_CANCELLED = "annullato"
+STATUS_FAILED = "errore"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pipeline TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    duration_s REAL NOT NULL,
+    status TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    bytes_read INTEGER NOT NULL,
+    bytes_written INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    machine TEXT NOT NULL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    duration_s REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_pipeline ON runs(pipeline, started_at);
+"""
+
+
+def run_status(cancel_event, failed):
+    """The status of a finished run: cancelled wins over failed, which wins over done."""
+    if cancel_event.is_set(): return STATUS_CANCELLED
+    return STATUS_FAILED if failed else STATUS_DONE
+
+
+class RunMetrics:
+    """
+    The figures of one run of a pipeline, filled in by the processor while it works.
+
+    Attributes:
+        files (int): Files handled.
+        bytes_read (int): Bytes of the files read.
+        bytes_written (int): Bytes of the files produced.
+        errors (int): Files or steps that failed.
+        extra (dict): Any pipeline-specific figures worth keeping.
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.files = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.extra = {}
+        self.phases = []
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def add_file(self, read=0, written=0):
+        # Bundles and compressions run on worker threads, hence the lock.
+        with self._lock:
+            self.files += 1
+            self.bytes_read += read
+            self.bytes_written += written
+
+    def add_bytes(self, read=0, written=0):
+        with self._lock:
+            self.bytes_read += read
+            self.bytes_written += written
+
+    def add_error(self, count=1):
+        with self._lock: self.errors += count
+
+    def add_phase(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try: yield
+        finally: self.add_phase(name, time.perf_counter() - started)
+
+
+class MetricsStore:
+    """
+    A local SQLite history of the pipeline runs, one row per run plus its phase timings.
+
+    Writing a record never interrupts a pipeline: a store that cannot be written (locked,
+    read-only folder) simply loses that record. Every call opens its own connection,
+    so runs finishing on different threads do not share one.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.machine = socket.gethostname()
+        self._schema_ready = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=10)
+        if not self._schema_ready:
+            connection.executescript(_SCHEMA)
+            self._schema_ready = True
+        return connection
+
+    def start(self, pipeline):
+        """Returns a new RunMetrics for `pipeline`; pass it to `finish` at the end."""
+        return RunMetrics(pipeline)
+
+    def finish(self, run, status=STATUS_DONE):
+        """Appends the run to the history. Returns False if it could not be written."""
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT INTO runs (pipeline, started_at, duration_s, status, files, bytes_read, bytes_written, errors, machine, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run.pipeline, run.started_at, run.elapsed, status, run.files, run.bytes_read, run.bytes_written, run.errors, self.machine,
+                         json.dumps(run.extra) if run.extra else None))
+                    connection.executemany("INSERT INTO phases (run_id, position, name, duration_s) VALUES (?, ?, ?, ?)",
+                                           [(cursor.lastrowid, i, name, seconds) for i, (name, seconds) in enumerate(run.phases)])
+            finally:
+                connection.close()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def monthly_report(self, months=12, pipeline=None):
+        """
+        Returns the monthly totals of the last `months` months, per pipeline and machine.
+
+        Returns:
+            list[tuple]: (month 'AAAA-MM', pipeline, machine, runs, files, seconds,
+            bytes read, bytes written, errors), oldest month first.
+        """
+        since = time.time() - months * 31 * 24 * 3600
+        query = ("SELECT strftime('%Y-%m', started_at, 'unixepoch', 'localtime') AS month, pipeline, machine, COUNT(*), SUM(files), SUM(duration_s), "
+                 "SUM(bytes_read), SUM(bytes_written), SUM(errors) FROM runs WHERE started_at >= ? AND status != ?")
+        params = [since, STATUS_CANCELLED]
+        if pipeline:
+            query += " AND pipeline = ?"; params.append(pipeline)
+        query += " GROUP BY month, pipeline, machine ORDER BY month, pipeline, machine"
+        connection = self._connect()
+        try: return connection.execute(query, params).fetchall()
+        finally: connection.close()
+
+    def phase_report(self, months=12, pipeline=None):
+        """Returns (month, pipeline, phase, average seconds) for the last `months` months."""
+        since = time.time() - months * 31 * 24 * 3600
+        query = ("SELECT strftime('%Y-%m', r.started_at, 'unixepoch', 'localtime') AS month, r.pipeline, p.name, AVG(p.duration_s) "
+                 "FROM phases p JOIN runs r ON r.id = p.run_id WHERE r.started_at >= ? AND r.status != ?")
+        params = [since, STATUS_CANCELLED]
+        if pipeline:
+            query += " AND r.pipeline = ?"; params.append(pipeline)
+        query += " GROUP BY month, r.pipeline, p.name ORDER BY month, r.pipeline, MIN(p.position)"
+        connection = self._connect()
+        try: return connection.execute(query, params).fetchall()
+        finally: connection.close()
+
+
+def format_report(monthly_rows, phase_rows):
+    """Formats the two reports as plain-text tables."""
+    lines = [f"{'Mese':<8} {'Processo':<18} {'PC':<14} {'Esec.':>5} {'File':>6} {'File/min':>9} {'MB letti/s':>10} {'MB scritti':>10} {'Errori':>6}"]
+    for month, pipeline, machine, runs, files, seconds, read, written, errors in monthly_rows:
+        per_minute = files / (seconds / 60) if seconds else 0
+        read_rate = read / (1024 * 1024) / seconds if seconds else 0
+        lines.append(f"{month:<8} {pipeline:<18} {machine[:14]:<14} {runs:>5} {files:>6} {per_minute:>9.1f} {read_rate:>10.2f} {written / (1024 * 1024):>10.1f} {errors:>6}")
+    if phase_rows:
+        lines.append("")
+        lines.append(f"{'Mese':<8} {'Processo':<18} {'Fase':<32} {'Media (s)':>9}")
+        for month, pipeline, phase, seconds in phase_rows:
+            lines.append(f"{month:<8} {pipeline:<18} {phase[:32]:<32} {seconds:>9.1f}")
+    return "\n".join(lines)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store():
+    """Returns the store shared by every processor, next to the application."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetricsStore(os.path.join(const.APPLICATION_PATH, const.METRICS_DB_FILE_NAME))
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Andamento mensile dei processi registrati nello storico delle esecuzioni.")
+    parser.add_argument("--mesi", type=int, default=12, help="quanti mesi mostrare (predefinito: 12)")
+    parser.add_argument("--processo", help="mostra un solo processo (es. organizza, firma, rinomina)")
+    parser.add_argument("--db", help="percorso del database (predefinito: quello dell'applicazione)")
+    args = parser.parse_args(argv)
+    store = MetricsStore(args.db) if args.db else get_metrics_store()
+    print(format_report(store.monthly_report(args.mesi, args.processo), store.phase_report(args.mesi, args.processo)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+import hashlib
+import mmap
+import os
+import re
+import zlib
+from collections import namedtuple, deque
+
+WHITESPACE = frozenset(b' \t\r\n\x0c\x00')
+NAME_REGEX = re.compile(rb'/[^\s()<>\[\]{}/%\x00]*')
+NUMBER_REGEX = re.compile(rb'[+-]?(?:\d+\.?\d*|\.\d+)')
+REF_REGEX = re.compile(rb'(\d+)\s+(\d+)\s+R(?![^\s()<>\[\]{}/%])')
+KEYWORD_REGEX = re.compile(rb'[A-Za-z]+')
+OBJ_HEADER_REGEX = re.compile(rb'\s*(\d+)\s+(\d+)\s+obj')
+XREF_SUBSECTION_REGEX = re.compile(rb'(\d+)\s+(\d+)')
+XREF_ENTRY_REGEX = re.compile(rb'\s*(\d+)\s+(\d+)\s+([nf])')
+
+# Page attributes a page may inherit from its ancestors in the page tree. They are
+# copied onto each page, because merged pages get a new, flat parent.
+INHERITABLE_PAGE_KEYS = (b'/Resources', b'/MediaBox', b'/CropBox', b'/Rotate')
+
+# Objects reachable from a stream are merged bottom-up so identical ones can be shared;
+# past this depth they are written as they are, without looking for duplicates.
+MAX_SHARING_DEPTH = 32
+
+Ref = namedtuple('Ref', 'num gen')
+OutRef = namedtuple('OutRef', 'num')
+
+
+class Name(bytes):
+    """A PDF name, kept with its leading slash exactly as written in the source."""
+
+
+class Atom(bytes):
+    """Any other PDF token (real number, string, keyword) copied through verbatim."""
+
+
+class PdfMergeError(Exception):
+    """Raised when an input PDF uses a feature the streaming merger does not handle."""
+
+
+def _skip_ws(buf, pos):
+    size = len(buf)
+    while pos < size:
+        char = buf[pos]
+        if char in WHITESPACE:
+            pos += 1
+        elif char == 0x25:  # '%' starts a comment running to the end of the line
+            while pos < size and buf[pos] not in (0x0A, 0x0D):
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _parse(buf, pos):
+    """Parses one PDF object starting at `pos`. Returns (object, position after it)."""
+    pos = _skip_ws(buf, pos)
+    if pos >= len(buf):
+        raise PdfMergeError("Fine del file inattesa.")
+    char = buf[pos]
+    if char == 0x2F:  # /Name
+        match = NAME_REGEX.match(buf, pos)
+        return Name(match.group()), match.end()
+    if char == 0x3C:  # '<<' dictionary or '<' hex string
+        if buf[pos + 1] == 0x3C:
+            result, pos = {}, pos + 2
+            while True:
+                pos = _skip_ws(buf, pos)
+                if buf[pos:pos + 2] == b'>>':
+                    return result, pos + 2
+                key, pos = _parse(buf, pos)
+                if not isinstance(key, Name):
+                    raise PdfMergeError("Chiave di dizionario non valida.")
+                result[bytes(key)], pos = _parse(buf, pos)
+        end = buf.find(b'>', pos)
+        if end < 0: raise PdfMergeError("Stringa esadecimale non chiusa.")
+        return Atom(buf[pos:end + 1]), end + 1
+    if char == 0x5B:  # [ array ]
+        result, pos = [], pos + 1
+        while True:
+            pos = _skip_ws(buf, pos)
+            if buf[pos] == 0x5D:
+                return result, pos + 1
+            item, pos = _parse(buf, pos)
+            result.append(item)
+    if char == 0x28:  # (literal string), with nested parentheses and escapes
+        depth, end = 0, pos
+        while end < len(buf):
+            current = buf[end]
+            if current == 0x5C:
+                end += 2; continue
+            if current == 0x28: depth += 1
+            elif current == 0x29:
+                depth -= 1
+                if depth == 0: return Atom(buf[pos:end + 1]), end + 1
+            end += 1
+        raise PdfMergeError("Stringa non chiusa.")
+    match = REF_REGEX.match(buf, pos)
+    if match:
+        return Ref(int(match.group(1)), int(match.group(2))), match.end()
+    match = NUMBER_REGEX.match(buf, pos)
+    if match:
+        token = match.group()
+        return (Atom(token) if b'.' in token else int(token)), match.end()
+    match = KEYWORD_REGEX.match(buf, pos)
+    if match:
+        return Atom(match.group()), match.end()
+    raise PdfMergeError(f"Token non riconosciuto alla posizione {pos}.")
+
+
+def _serialize(obj, resolve):
+    """Writes `obj` back as PDF syntax, turning source references into output numbers."""
+    if isinstance(obj, dict):
+        return b'<<' + b''.join(key + b' ' + _serialize(value, resolve) + b' ' for key, value in obj.items()) + b'>>'
+    if isinstance(obj, list):
+        return b'[' + b' '.join(_serialize(item, resolve) for item in obj) + b']'
+    if isinstance(obj, Ref):
+        return b'%d 0 R' % resolve(obj)
+    if isinstance(obj, OutRef):
+        return b'%d 0 R' % obj.num
+    if isinstance(obj, int):
+        return b'%d' % obj
+    if obj is None:
+        return b'null'
+    return bytes(obj)
+
+
+def _references(obj):
+    """Yields every indirect reference contained in `obj`."""
+    if isinstance(obj, Ref):
+        yield obj
+    elif isinstance(obj, dict):
+        for value in obj.values(): yield from _references(value)
+    elif isinstance(obj, list):
+        for item in obj: yield from _references(item)
+
+
+def _png_unpredict(data, columns, bytes_per_pixel):
+    """Reverses the PNG row predictors used by xref and object streams."""
+    row_size = columns
+    previous = bytearray(row_size)
+    out = bytearray()
+    for start in range(0, len(data), row_size + 1):
+        filter_type = data[start]
+        row = bytearray(data[start + 1:start + 1 + row_size])
+        for i in range(len(row)):
+            left = row[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
+            up = previous[i] if i < len(previous) else 0
+            if filter_type == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif filter_type == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif filter_type == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif filter_type == 4:
+                up_left = previous[i - bytes_per_pixel] if i >= bytes_per_pixel else 0
+                estimate = left + up - up_left
+                pa, pb, pc = abs(estimate - left), abs(estimate - up), abs(estimate - up_left)
+                predictor = left if pa <= pb and pa <= pc else (up if pb <= pc else up_left)
+                row[i] = (row[i] + predictor) & 0xFF
+        out += row
+        previous = row
+    return bytes(out)
+
+
+def _decode_stream(stream_dict, data):
+    """Decodes the (Flate-compressed) data of an xref or object stream."""
+    filters = stream_dict.get(b'/Filter')
+    filters = filters if isinstance(filters, list) else ([filters] if filters else [])
+    params = stream_dict.get(b'/DecodeParms')
+    params = params[0] if isinstance(params, list) else params
+    for name in filters:
+        if name != b'/FlateDecode':
+            raise PdfMergeError(f"Filtro non supportato: {name.decode('latin-1')}")
+        data = zlib.decompress(data)
+    if isinstance(params, dict) and params.get(b'/Predictor', 1) >= 10:
+        colors = params.get(b'/Colors', 1)
+        bits = params.get(b'/BitsPerComponent', 8)
+        columns = params.get(b'/Columns', 1)
+        data = _png_unpredict(data, (columns * colors * bits + 7) // 8, max(1, colors * bits // 8))
+    return data
+
+
+class PdfReader:
+    """
+    Random access to the objects of a PDF through its cross-reference table.
+
+    The file is memory-mapped and objects are parsed only when asked for, so reading
+    a page costs the size of that page's objects, not the size of the document.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise PdfMergeError("File vuoto.")
+        self._entries = {}
+        self._object_stream = (None, None, None)
+        self.trailer = self._load_xref()
+        if b'/Encrypt' in self.trailer:
+            self.close()
+            raise PdfMergeError("PDF cifrato.")
+
+    def close(self):
+        self._buf.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _load_xref(self):
+        buf = self._buf
+        marker = buf.rfind(b'startxref', max(0, len(buf) - 2048))
+        if marker < 0: raise PdfMergeError("'startxref' non trovato.")
+        offset, _ = _parse(buf, marker + 9)
+        trailer, seen = None, set()
+        while isinstance(offset, int) and offset not in seen:
+            seen.add(offset)
+            pos = _skip_ws(buf, offset)
+            if buf[pos:pos + 4] == b'xref':
+                section_trailer = self._read_xref_table(pos + 4)
+                if isinstance(section_trailer.get(b'/XRefStm'), int):
+                    self._read_xref_stream(section_trailer[b'/XRefStm'])
+            else:
+                section_trailer = self._read_xref_stream(offset)
+            if trailer is None: trailer = section_trailer
+            offset = section_trailer.get(b'/Prev')
+        return trailer
+
+    def _read_xref_table(self, pos):
+        buf = self._buf
+        while True:
+            pos = _skip_ws(buf, pos)
+            if buf[pos:pos + 7] == b'trailer':
+                trailer, _ = _parse(buf, pos + 7)
+                return trailer
+            match = XREF_SUBSECTION_REGEX.match(buf, pos)
+            if not match: raise PdfMergeError("Tabella xref non valida.")
+            start, count = int(match.group(1)), int(match.group(2))
+            pos = match.end()
+            for num in range(start, start + count):
+                match = XREF_ENTRY_REGEX.match(buf, pos)
+                if not match: raise PdfMergeError("Voce xref non valida.")
+                # Newer sections are read first, so an object already seen wins.
+                self._entries.setdefault(num, ('o', int(match.group(1))) if match.group(3) == b'n' else None)
+                pos = match.end()
+
+    def _read_xref_stream(self, offset):
+        _, stream_dict, data = self._read_object_at(offset)
+        data = _decode_stream(stream_dict, data)
+        widths = stream_dict[b'/W']
+        index = stream_dict.get(b'/Index', [0, stream_dict[b'/Size']])
+        row_size = sum(widths)
+        pos = 0
+        for i in range(0, len(index), 2):
+            for num in range(index[i], index[i] + index[i + 1]):
+                row = data[pos:pos + row_size]
+                pos += row_size
+                fields, start = [], 0
+                for width in widths:
+                    value = 0
+                    for byte in row[start:start + width]: value = (value << 8) | byte
+                    fields.append(value); start += width
+                entry_type = fields[0] if widths[0] else 1
+                if entry_type == 1: self._entries.setdefault(num, ('o', fields[1]))
+                elif entry_type == 2: self._entries.setdefault(num, ('c', fields[1], fields[2]))
+                else: self._entries.setdefault(num, None)
+        return stream_dict
+
+    def _read_object_at(self, offset):
+        buf = self._buf
+        match = OBJ_HEADER_REGEX.match(buf, offset)
+        if not match: raise PdfMergeError(f"Oggetto non trovato alla posizione {offset}.")
+        obj, pos = _parse(buf, match.end())
+        data = None
+        pos = _skip_ws(buf, pos)
+        if isinstance(obj, dict) and buf[pos:pos + 6] == b'stream':
+            pos += 6
+            if buf[pos:pos + 2] == b'\r\n': pos += 2
+            elif buf[pos] in (0x0A, 0x0D): pos += 1
+            length = obj.get(b'/Length')
+            if isinstance(length, Ref):
+                try: length = self.get(length.num)[0]
+                except PdfMergeError: length = None
+            end = pos + length if isinstance(length, int) else None
+            if end is None or buf[_skip_ws(buf, end):_skip_ws(buf, end) + 9] != b'endstream':
+                # Wrong or missing /Length: fall back to the 'endstream' keyword.
+                end = buf.find(b'endstream', pos)
+                if end < 0: raise PdfMergeError("'endstream' non trovato.")
+                if buf[end - 2:end] == b'\r\n': end -= 2
+                elif buf[end - 1] in (0x0A, 0x0D): end -= 1
+            data = buf[pos:end]
+        return int(match.group(1)), obj, data
+
+    def get(self, num):
+        """Returns (object, raw stream data or None) of object `num`; (None, None) if missing."""
+        entry = self._entries.get(num)
+        if entry is None:
+            return None, None
+        if entry[0] == 'o':
+            return self._read_object_at(entry[1])[1:]
+        stream_num, index = entry[1], entry[2]
+        if self._object_stream[0] != stream_num:
+            # Keep only the last decoded object stream: objects are mostly read in order.
+            stream_dict, data = self.get(stream_num)
+            if data is None: raise PdfMergeError("Object stream non valido.")
+            data = _decode_stream(stream_dict, data)
+            header, pos = [], 0
+            for _ in range(2 * stream_dict[b'/N']):
+                value, pos = _parse(data, pos)
+                header.append(value)
+            offsets = [stream_dict[b'/First'] + header[i] for i in range(1, len(header), 2)]
+            self._object_stream = (stream_num, data, offsets)
+        _, data, offsets = self._object_stream
+        return _parse(data, offsets[index])[0], None
+
+    def resolve(self, obj):
+        """Follows `obj` if it is a reference."""
+        return self.get(obj.num)[0] if isinstance(obj, Ref) else obj
+
+    def pages(self):
+        """
+        Returns the page tree in reading order.
+
+        Returns:
+            tuple[list[tuple[Ref, dict]], set[int]]: The (page reference, inherited
+            attributes) pairs and the object numbers of the intermediate tree nodes.
+        """
+        catalog = self.resolve(self.trailer.get(b'/Root'))
+        if not isinstance(catalog, dict) or not isinstance(catalog.get(b'/Pages'), Ref):
+            raise PdfMergeError("Catalogo delle pagine non trovato.")
+        pages, nodes = [], set()
+        stack = [(catalog[b'/Pages'], {})]
+        while stack:
+            ref, inherited = stack.pop()
+            node = self.resolve(ref)
+            if not isinstance(node, dict) or ref.num in nodes: continue
+            if b'/Kids' in node:
+                nodes.add(ref.num)
+                inherited = dict(inherited)
+                inherited.update((key, node[key]) for key in INHERITABLE_PAGE_KEYS if key in node)
+                stack.extend((kid, inherited) for kid in reversed(self.resolve(node[b'/Kids'])) if isinstance(kid, Ref))
+            else:
+                pages.append((ref, inherited))
+        return pages, nodes
+
+
+class MergeStats:
+    """What a merge produced: pages written and how much repeated content was shared."""
+    def __init__(self):
+        self.pages = 0
+        self.objects = 0
+        self.shared_streams = 0
+        self.shared_bytes = 0
+
+
+class StreamingPdfMerger:
+    """
+    Concatenates PDFs by copying their objects one page at a time into the output.
+
+    Nothing is held in memory beyond the objects of the page being copied, the output
+    cross-reference offsets and one hash per distinct stream: page count only costs a
+    few integers each. Streams are copied without being decoded. Every stream is keyed
+    by a hash of its dictionary and data once the objects it refers to are merged, so
+    content repeated across inputs (the stamp image of every signed sheet, shared ICC
+    profiles, identical fonts) is written once and referenced by every page using it.
+    """
+    CATALOG_NUM = 1
+    PAGES_NUM = 2
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.stats = MergeStats()
+        self._file = open(output_path, 'wb')
+        self._pos = 0
+        self._offsets = [None, None, None]
+        self._kids = []
+        self._stream_hashes = {}
+        self._write(b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write(self, chunk):
+        self._file.write(chunk)
+        self._pos += len(chunk)
+
+    def _allocate(self):
+        self._offsets.append(None)
+        return len(self._offsets) - 1
+
+    def _write_object(self, num, body, data=None):
+        self._offsets[num] = self._pos
+        self._write(b'%d 0 obj\n' % num + body)
+        if data is not None:
+            self._write(b'\nstream\n'); self._write(data); self._write(b'\nendstream')
+        self._write(b'\nendobj\n')
+        self.stats.objects += 1
+
+    def add(self, input_path):
+        """Appends every page of `input_path`. Raises PdfMergeError if it cannot be read."""
+        with PdfReader(input_path) as reader:
+            pages, nodes = reader.pages()
+            ref_map = dict.fromkeys(nodes, self.PAGES_NUM)
+            page_inherited = {ref.num: inherited for ref, inherited in pages}
+            pending = deque()
+            in_progress = set()
+
+            def assign(ref, depth=0):
+                if ref.num in ref_map: return ref_map[ref.num]
+                obj, data = reader.get(ref.num)
+                shareable = (data is not None or depth > 0) and depth < MAX_SHARING_DEPTH and ref.num not in in_progress and ref.num not in page_inherited
+                if not shareable:
+                    out_num = ref_map[ref.num] = self._allocate()
+                    pending.append((ref.num, out_num, obj, data))
+                    return out_num
+                if data is not None:
+                    obj = dict(obj); obj[b'/Length'] = len(data)
+                # Merge what the object refers to first, so equal objects serialize equally.
+                in_progress.add(ref.num)
+                for child in _references(obj):
+                    assign(child, depth + 1)
+                in_progress.discard(ref.num)
+                if ref.num in ref_map: return ref_map[ref.num]
+                body = _serialize(obj, lambda r: assign(r, depth + 1))
+                digest = hashlib.sha1(body + (b'\x00' + data if data is not None else b'')).digest()
+                existing = self._stream_hashes.get(digest)
+                if existing is not None:
+                    ref_map[ref.num] = existing
+                    if data is not None:
+                        self.stats.shared_streams += 1; self.stats.shared_bytes += len(data)
+                    return existing
+                out_num = ref_map[ref.num] = self._stream_hashes[digest] = self._allocate()
+                self._write_object(out_num, body, data)
+                return out_num
+
+            for page_ref, _ in pages:
+                self._kids.append(assign(page_ref))
+                self.stats.pages += 1
+                # Copy everything the page needs before moving on to the next one.
+                while pending:
+                    in_num, out_num, obj, data = pending.popleft()
+                    if in_num in page_inherited and isinstance(obj, dict):
+                        obj = dict(obj)
+                        for key, value in page_inherited[in_num].items(): obj.setdefault(key, value)
+                        obj[b'/Parent'] = OutRef(self.PAGES_NUM)
+                    if data is not None:
+                        obj = dict(obj); obj[b'/Length'] = len(data)
+                    self._write_object(out_num, _serialize(obj, assign), data)
+
+    def close(self):
+        """Writes the page tree, catalog and cross-reference table, then closes the file."""
+        kids = b' '.join(b'%d 0 R' % num for num in self._kids)
+        self._write_object(self.PAGES_NUM, b'<</Type /Pages /Kids [' + kids + b'] /Count %d>>' % len(self._kids))
+        self._write_object(self.CATALOG_NUM, b'<</Type /Catalog /Pages %d 0 R>>' % self.PAGES_NUM)
+        xref_pos = self._pos
+        lines = [b'xref\n0 %d\n' % len(self._offsets), b'0000000000 65535 f\r\n']
+        lines += [b'%010d 00000 n\r\n' % offset for offset in self._offsets[1:]]
+        self._write(b''.join(lines))
+        self._write(b'trailer\n<</Size %d /Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n' % (len(self._offsets), self.CATALOG_NUM, xref_pos))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.output_path): os.remove(self.output_path)
+
+
+def merge_pdfs_streaming(input_pdfs, output_pdf):
+    """
+    Concatenates `input_pdfs` into `output_pdf` with StreamingPdfMerger. The output is
+    written next to the target and swapped in, so a failed merge leaves no broken file.
+
+    Returns:
+        MergeStats: Pages written and repeated streams shared between inputs.
+
+    Raises:
+        PdfMergeError: If an input is encrypted or cannot be parsed; callers can then
+        fall back to another merger.
+    """
+    temp_output = f"{output_pdf}.part"
+    merger = StreamingPdfMerger(temp_output)
+    try:
+        for input_pdf in input_pdfs:
+            merger.add(input_pdf)
+        merger.close()
+    except (PdfMergeError, OSError, zlib.error, IndexError, KeyError, TypeError, ValueError) as e:
+        merger.abort()
+        raise e if isinstance(e, PdfMergeError) else PdfMergeError(f"{os.path.basename(str(input_pdf))}: {e}") from e
+    os.replace(temp_output, output_pdf)
+    return merger.stats
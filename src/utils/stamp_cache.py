@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import threading
+
+# Pillow is only needed to pre-render the stamp; without it the original image is
+# inserted as before and Excel scales it on every workbook.
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+class StampImageCache:
+    """
+    Pre-renders the signature stamp once per size, for the whole signature run.
+
+    `Shapes.AddPicture` embeds the file it is given as-is, so inserting the full
+    resolution TIMBRO.png makes Excel decode and re-encode it for every workbook and
+    puts a full copy in every exported PDF. Instead, each requested size (in points)
+    is rendered once at RENDER_DPI, the resolution the PDF compression downsamples to,
+    and every later insertion of that size reuses the same small file. Opaque stamps
+    are stored as JPEG, the format the compressed PDFs use for colour images; stamps
+    with transparency stay PNG so the cell borders still show through.
+    """
+    RENDER_DPI = 150
+    JPEG_QUALITY = 85
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+        self._rendered = {}
+        self._lock = threading.Lock()
+        self._work_dir = None
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def path_for(self, width_pt, height_pt):
+        """
+        Returns the path of the stamp rendered at `width_pt` x `height_pt` points,
+        rendering it on first use. Falls back to the source image if Pillow is missing
+        or the image cannot be rendered.
+        """
+        if Image is None:
+            return self.source_path
+        key = (width_pt, height_pt)
+        with self._lock:
+            if key not in self._rendered:
+                try:
+                    self._rendered[key] = self._render(width_pt, height_pt)
+                except (OSError, ValueError):
+                    self._rendered[key] = self.source_path
+            return self._rendered[key]
+
+    def _render(self, width_pt, height_pt):
+        if self._work_dir is None:
+            self._work_dir = tempfile.mkdtemp(prefix="timbro_")
+        size = (max(1, round(width_pt * self.RENDER_DPI / 72)), max(1, round(height_pt * self.RENDER_DPI / 72)))
+        with Image.open(self.source_path) as image:
+            image.load()
+            has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+            image = image.convert("RGBA" if has_alpha else "RGB").resize(size, Image.LANCZOS)
+            base_name = f"timbro_{size[0]}x{size[1]}"
+            if has_alpha:
+                path = os.path.join(self._work_dir, f"{base_name}.png")
+                image.save(path, "PNG", optimize=True)
+            else:
+                path = os.path.join(self._work_dir, f"{base_name}.jpg")
+                image.save(path, "JPEG", quality=self.JPEG_QUALITY, optimize=True)
+        return path
+
+    def close(self):
+        """Removes the rendered files. The cache can be reused afterwards."""
+        with self._lock:
+            if self._work_dir: shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+            self._rendered = {}
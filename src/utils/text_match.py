@@ -0,0 +1,64 @@
+import re
+from collections import deque
+
+NON_ALNUM_REGEX = re.compile(r'[^A-Z0-9]+')
+
+
+def normalize_for_match(text):
+    """Upper-cases `text` and collapses every run of separators into a single space."""
+    return NON_ALNUM_REGEX.sub(' ', str(text).upper()).strip()
+
+
+class KeywordMatcher:
+    """
+    Finds which of many keywords occur in a text with a single left-to-right scan
+    (Aho-Corasick automaton), instead of one substring search per keyword.
+
+    Keywords and texts are compared after `normalize_for_match`, so "Canone-Settembre"
+    matches the keywords "CANONE" and "SETTEMBRE".
+    """
+    def __init__(self, keywords):
+        self.keywords = [normalize_for_match(k) for k in keywords if normalize_for_match(k)]
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [set()]
+        for keyword in self.keywords:
+            self._add(keyword)
+        self._build_failure_links()
+
+    def _add(self, keyword):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+            state = next_state
+        self._output[state].add(keyword)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find_all(self, text):
+        """Returns the set of (normalised) keywords found in `text`."""
+        found = set()
+        state = 0
+        for char in normalize_for_match(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
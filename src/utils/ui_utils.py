@@ -1,4 +1,5 @@
 import os
+import threading
 import tkinter as tk
 from tkinter import scrolledtext, filedialog
 
@@ -92,3 +93,80 @@ def open_folder_in_explorer(path_to_open):
         os.startfile(path_to_open)
     except Exception as e:
         print(f"Failed to open folder: {e}")
+
+
+class DebouncedResolver:
+    """
+    Coalesces rapid UI changes into a single background resolution.
+
+    Each `request()` restarts a short timer; when it fires, the inputs are read on the
+    Tk thread with `collect_func`, resolved on a worker thread with `resolve_func` and
+    handed back to `apply_func` on the Tk thread. A newer request cancels the older
+    one, whose result is dropped even if it arrives later. Errors of `resolve_func`
+    are reported to `logger` (as logger(message, level)) and nothing is applied.
+    """
+    def __init__(self, widget, collect_func, resolve_func, apply_func, delay_ms=300, logger=None):
+        self.widget = widget
+        self.collect_func = collect_func
+        self.resolve_func = resolve_func
+        self.apply_func = apply_func
+        self.delay_ms = delay_ms
+        self.logger = logger
+        self._after_id = None
+        self._generation = 0
+        self._running_generation = None
+        self._cancel_event = threading.Event()
+        self._waiters = []
+
+    def request(self, *args):
+        """Schedules a resolution, replacing any one that has not started yet."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._after_id = self.widget.after(self.delay_ms, self._start)
+
+    def _supersede(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        self._cancel_event.set()
+        self._cancel_event = threading.Event()
+        self._generation += 1
+        return self._generation, self._cancel_event
+
+    def _start(self):
+        # Also cancels the timer when started early by `when_resolved`.
+        generation, cancel_event = self._supersede()
+        self._running_generation = generation
+        inputs = self.collect_func()
+        threading.Thread(target=self._run, args=(generation, inputs, cancel_event), daemon=True).start()
+
+    def _run(self, generation, inputs, cancel_event):
+        try:
+            result, ok = self.resolve_func(inputs, cancel_event), True
+        except Exception as e:
+            result, ok = None, False
+            if self.logger: self.logger(f"Errore durante l'aggiornamento dei percorsi: {e}", "ERROR")
+        if not cancel_event.is_set():
+            self.widget.after(0, self._apply, generation, result, ok)
+
+    def _apply(self, generation, result, ok):
+        if generation != self._generation: return
+        self._running_generation = None
+        if ok: self.apply_func(result)
+        waiters, self._waiters = self._waiters, []
+        for callback in waiters: callback()
+
+    def when_resolved(self, callback):
+        """
+        Calls `callback` on the Tk thread once the latest request has been applied, e.g.
+        right before the values are used: at once if nothing is pending, otherwise when
+        the background resolution finishes (a request still waiting for its timer is
+        started immediately). The Tk thread never waits for the lookup itself.
+        """
+        if self._after_id is not None:
+            self._waiters.append(callback)
+            self._start()
+        elif self._running_generation is not None:
+            self._waiters.append(callback)
+        else:
+            callback()